@@ -0,0 +1,332 @@
+# === analytics.py ===
+
+"""
+Columnar analysis of the result records.
+
+flatten() turns the nested evaluation dicts into one row per question with a
+0/1 column per criterion score and pair-wise outcome. Questions graded by
+the gold answer without a judge call (--judge-gate) only count in the gold_*
+columns, never in the judge's criterion scores and win rates. All statistics are
+computed per (responder, revisor) model pair from per-column sums and counts,
+so ResultsAnalytics can follow a growing results.jsonl: each refresh parses
+only the new lines and folds them into the running totals.
+
+Every metric is a 0/1 indicator, so the bootstrap distribution of its mean is
+Binomial(n, p) / n; CIs are drawn for all pairs and metrics in one NumPy call
+instead of resampling rows.
+
+Run: python analytics.py --results results/results.jsonl
+     python analytics.py --follow 5    # refresh every 5 seconds
+     python analytics.py --results results/columnar   # columnar store
+"""
+
+from __future__ import annotations
+
+# === Imports ===
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from results_store import RESULTS_JSONL, iter_records
+from schemas import AnswerAssessment
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Constants ===
+# Same criteria as the judges, without importing the judge LLM
+CRITERIA = tuple(AnswerAssessment.model_fields)
+PAIR_COLUMNS = ["responder_model", "revisor_model"]
+ROLES = ("responder", "revisor")
+SCORE_COLUMNS = [f"{name}_{role}" for name in CRITERIA for role in ROLES]
+# Pair-wise outcomes are NaN for an invalid verdict, so they are rates over
+# the valid verdicts only; "invalid" is a rate over all questions
+OUTCOME_COLUMNS = ["responder_win", "revisor_win", "tie", "invalid"]
+# Outcomes of the questions decided by the gold answer instead of the judge
+GOLD_OUTCOME_COLUMNS = ["gold_responder_win", "gold_revisor_win", "gold_tie"]
+# revise_skipped: the draft requested no search; revise_cut: a run or
+# question budget ended the graph before the revision
+TOOL_COLUMNS = [
+    "responder_tool_used",
+    "revisor_tool_used",
+    "revise_skipped",
+    "revise_cut",
+    "judge_skipped",
+]
+# Exact match, containment and the conclusive verdict (scoring.verdicts())
+# against the gold answer, NaN without one
+GOLD_COLUMNS = [
+    f"{m}_{role}" for m in ("exact_match", "contains", "correct") for role in ROLES
+]
+METRIC_COLUMNS = (
+    OUTCOME_COLUMNS + GOLD_OUTCOME_COLUMNS + SCORE_COLUMNS + GOLD_COLUMNS + TOOL_COLUMNS
+)
+
+DEFAULT_RESAMPLES = 2000
+DEFAULT_CONFIDENCE = 0.95
+
+_WINNER_OUTCOME = {"A": "responder_win", "B": "revisor_win", "tie": "tie"}
+
+
+# === Flattening ===
+
+
+def _score(entry: Any) -> float:
+    """0/1 score of an evaluator entry, NaN if the judge failed."""
+    if isinstance(entry, dict) and entry.get("score") in (0, 1):
+        return float(entry["score"])
+    return np.nan
+
+
+def flatten(records: Iterable[Dict[str, Any]]) -> pd.DataFrame:
+    """One row per record with the model pair and all metric columns."""
+    columns: Dict[str, List[Any]] = {c: [] for c in ["question", *PAIR_COLUMNS]}
+    columns.update({c: [] for c in METRIC_COLUMNS})
+
+    for record in records:
+        evaluation = record.get("evaluation") or {}
+        columns["question"].append(record.get("question", ""))
+        for c in PAIR_COLUMNS:
+            columns[c].append(record.get(c, "-"))
+
+        outcome = _WINNER_OUTCOME.get(evaluation.get("pairwise_winner", "Invalid"))
+        by_gold = bool(record.get("judge_skipped"))
+        judged = None if by_gold else outcome
+        for c in OUTCOME_COLUMNS[:-1]:
+            columns[c].append(np.nan if judged is None else float(c == judged))
+        columns["invalid"].append(np.nan if by_gold else float(outcome is None))
+        for c in GOLD_OUTCOME_COLUMNS:
+            columns[c].append(
+                float(c == f"gold_{outcome}") if by_gold and outcome else np.nan
+            )
+
+        for c in SCORE_COLUMNS:
+            columns[c].append(np.nan if by_gold else _score(evaluation.get(c)))
+        string_scores = record.get("string_scores") or {}
+        for c in GOLD_COLUMNS:
+            metric, _, role = c.rpartition("_")
+            value = (string_scores.get(role) or {}).get(metric)
+            columns[c].append(np.nan if value is None else float(value))
+        flags = {**record, "revise_cut": record.get("revise_reason") == "budget"}
+        for c in TOOL_COLUMNS:
+            columns[c].append(float(bool(flags.get(c))))
+
+    frame = pd.DataFrame(columns)
+    frame[METRIC_COLUMNS] = frame[METRIC_COLUMNS].astype(np.float64)
+    return frame
+
+
+def load_frame(store_dir: str | Path) -> pd.DataFrame:
+    """Pair and metric columns of a columnar store, without parsing records."""
+    from columnar_store import read_table
+
+    frame = read_table(store_dir, [*PAIR_COLUMNS, *METRIC_COLUMNS])
+    frame[PAIR_COLUMNS] = frame[PAIR_COLUMNS].astype(str)
+    return frame
+
+
+def load_records(path: str | Path) -> List[Dict[str, Any]]:
+    """Read a results.json list or a results.jsonl stream."""
+    path = Path(path)
+    if path.suffix == ".jsonl":
+        return list(iter_records(path))
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+# === Statistics ===
+
+
+def bootstrap_ci(
+    successes: np.ndarray,
+    counts: np.ndarray,
+    n_resamples: int = DEFAULT_RESAMPLES,
+    confidence: float = DEFAULT_CONFIDENCE,
+    seed: Optional[int] = 0,
+) -> np.ndarray:
+    """
+    Percentile bootstrap CIs of the means of 0/1 samples.
+    *successes* and *counts* are arrays of any (equal) shape; returns an array
+    of that shape plus a trailing (low, high) axis, NaN where count is 0.
+    """
+    successes = np.asarray(successes, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.int64)
+    n = np.maximum(counts, 1)
+    p = np.clip(successes / n, 0.0, 1.0)
+
+    rng = np.random.default_rng(seed)
+    draws = rng.binomial(n[..., None], p[..., None], size=(*n.shape, n_resamples))
+    alpha = (1 - confidence) / 2
+    ci = np.quantile(draws / n[..., None], [alpha, 1 - alpha], axis=-1)
+    ci = np.moveaxis(ci, 0, -1)
+    ci[counts == 0] = np.nan
+    return ci
+
+
+class ResultsAnalytics:
+    """
+    Running per-pair statistics over a (growing) set of result records.
+    Feed it with add_records() or let refresh() tail a JSONL file.
+    """
+
+    def __init__(self, path: str | Path | None = RESULTS_JSONL) -> None:
+        self.path = Path(path) if path is not None else None
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget all records and start reading the file from the beginning."""
+        self.rows = 0
+        self._offset = 0
+        self._partial = b""
+        self._sums: Optional[pd.DataFrame] = None
+        self._counts: Optional[pd.DataFrame] = None
+
+    def add_frame(self, frame: pd.DataFrame) -> None:
+        """Fold a flattened frame into the running sums and counts."""
+        if frame.empty:
+            return
+        grouped = frame.groupby(PAIR_COLUMNS, observed=True)[METRIC_COLUMNS]
+        sums, counts = grouped.sum(), grouped.count().astype(np.float64)
+        if self._sums is not None and self._counts is not None:
+            sums = sums.add(self._sums, fill_value=0)
+            counts = counts.add(self._counts, fill_value=0)
+        self._sums, self._counts = sums, counts
+        self.rows += len(frame)
+
+    def add_records(self, records: Iterable[Dict[str, Any]]) -> None:
+        self.add_frame(flatten(records))
+
+    def refresh(self) -> int:
+        """Read the lines appended to the JSONL file since the last call.
+
+        A trailing line without newline is kept until it is complete; a file
+        that shrank was rewritten and is read again from the start.
+        Returns the number of new records.
+        """
+        if self.path is None or not self.path.exists():
+            return 0
+        if self.path.stat().st_size < self._offset:
+            logger.info("%s was truncated, re-reading it", self.path)
+            self.reset()
+
+        with self.path.open("rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        self._offset += len(data)
+        *lines, self._partial = (self._partial + data).split(b"\n")
+
+        records = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning("Skipping unreadable line in %s", self.path)
+        self.add_records(records)
+        return len(records)
+
+    def means(self) -> pd.DataFrame:
+        """Mean of every metric per model pair (NaN without valid samples)."""
+        if self._sums is None or self._counts is None:
+            return pd.DataFrame(columns=METRIC_COLUMNS)
+        return self._sums / self._counts.where(self._counts > 0)
+
+    def report(
+        self,
+        n_resamples: int = DEFAULT_RESAMPLES,
+        confidence: float = DEFAULT_CONFIDENCE,
+        seed: Optional[int] = 0,
+    ) -> pd.DataFrame:
+        """
+        Long table with n, mean and bootstrap CI per model pair and metric.
+        """
+        if self._sums is None or self._counts is None:
+            return pd.DataFrame(
+                columns=[*PAIR_COLUMNS, "metric", "n", "mean", "ci_low", "ci_high"]
+            )
+        sums = self._sums.to_numpy()
+        counts = self._counts.to_numpy()
+        ci = bootstrap_ci(sums, counts, n_resamples, confidence, seed)
+
+        index = self._sums.index
+        long = pd.DataFrame(
+            {
+                "responder_model": np.repeat(index.get_level_values(0), sums.shape[1]),
+                "revisor_model": np.repeat(index.get_level_values(1), sums.shape[1]),
+                "metric": np.tile(METRIC_COLUMNS, sums.shape[0]),
+                "n": counts.ravel().astype(np.int64),
+                "mean": (sums / np.where(counts > 0, counts, np.nan)).ravel(),
+                "ci_low": ci[..., 0].ravel(),
+                "ci_high": ci[..., 1].ravel(),
+            }
+        )
+        return long
+
+
+# === CLI ===
+
+
+def _print_report(report: pd.DataFrame, rows: int, seconds: float) -> None:
+    print(f"{rows} records, statistics in {seconds * 1000:.1f} ms")
+    for (responder, revisor), group in report.groupby(PAIR_COLUMNS, sort=False):
+        print(f"\n{responder} → {revisor}")
+        print(f"{'metric':<26} {'n':>6} {'mean':>6} {'95% CI':>15}")
+        for row in group.itertuples():
+            if not row.n:
+                continue
+            print(
+                f"{row.metric:<26} {row.n:>6} {row.mean:>6.3f} "
+                f"[{row.ci_low:.3f}, {row.ci_high:.3f}]"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--results", default=str(RESULTS_JSONL))
+    parser.add_argument("--resamples", type=int, default=DEFAULT_RESAMPLES)
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument(
+        "--follow",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Keep tailing a JSONL file and refresh the report.",
+    )
+    parser.add_argument("--output", default=None, help="Write the report as CSV.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    path = Path(args.results)
+    if path.suffix != ".jsonl" and args.follow:
+        parser.error("--follow needs a .jsonl results file")
+
+    analytics = ResultsAnalytics(path if path.suffix == ".jsonl" else None)
+    if path.is_dir():
+        analytics.add_frame(load_frame(path))
+    elif analytics.path is None:
+        analytics.add_records(load_records(path))
+
+    first = True
+    while True:
+        start = time.perf_counter()
+        new = analytics.refresh()
+        report = analytics.report(args.resamples, args.confidence)
+        if first or new:
+            first = False
+            _print_report(report, analytics.rows, time.perf_counter() - start)
+        if args.output:
+            report.to_csv(args.output, index=False)
+        if args.follow is None:
+            break
+        time.sleep(args.follow)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+# === benchmark.py ===
+
+"""
+Offline end-to-end benchmark of the responder/revisor pipeline.
+
+Runs the real chains, LangGraph wiring, tool node and judges against the
+fake chat models and search tool from fakes.py, so no Ollama, OpenAI or
+Tavily is needed. Every level runs one responder/revisor pair through the
+scheduler of main.py (scheduler.run_matrix); --run-pair times
+pipeline.run_pair instead, a reference path main.py does not use. For every
+concurrency level it reports questions/sec and the per-stage overhead on top
+of the configured fake latency; the peak RSS of the process is reported once
+for the whole run.
+
+With --pool-sizes the responder and revisor are real ChatOllama clients
+instead, each question pinned to one of that many local stand-in Ollama
+servers (fakes.py) with --pool-slots parallel requests each. The report
+shows how throughput scales with the pool size. A final run on one fast
+and one 4× slower server exits 1 unless the fast server, whose questions
+finish and free their pins first, gets more of the questions.
+
+--matrix runs the production scheduler (scheduler.run_matrix) over a 2×2
+matrix of a fake local and a fake cloud model, once without and once with a
+run budget that is spent after the first call, and exits 1 unless every
+question is either recorded or counted as skipped, and every revision the
+budget cut is recorded as such (revise_reason "budget", not revise_skipped).
+
+Run: python benchmark.py --questions 32 --concurrency 1 4 16
+     python benchmark.py --output bench.json
+     python benchmark.py --baseline bench.json   # exits 1 on a regression
+     python benchmark.py --questions 48 --pool-sizes 1 2 4
+     python benchmark.py --matrix
+"""
+
+# === Imports ===
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import sys
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import budget
+import cassette
+import evaluator
+import ollama_pool
+import tool_executor
+from concurrency import configure_limits
+from fakes import FakeChatModel, FakeOllamaServer, fake_search_tool
+from instrumentation import RunSummary
+from pipeline import MAX_MESSAGES, run_pair
+from scheduler import ModelSpec, PairJob, run_matrix
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Constants ===
+DEFAULT_CONCURRENCY = (1, 2, 4, 8, 16)
+DEFAULT_TOLERANCE = 0.15  # allowed relative throughput loss vs. the baseline
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB (ru_maxrss is KiB on Linux).
+
+    ru_maxrss only ever grows, so it covers the whole run, not one level.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _stage_overhead(
+    summary: Dict[str, Any], latencies: Dict[str, float]
+) -> Dict[str, Dict[str, float]]:
+    """p50/p95 of every stage minus the latency the fakes were told to add."""
+    overhead = {}
+    for stage, row in summary["stages"].items():
+        if stage not in latencies:
+            continue
+        overhead[stage] = {
+            "p50_ms": round((row["p50_s"] - latencies[stage]) * 1000, 2),
+            "p95_ms": round((row["p95_s"] - latencies[stage]) * 1000, 2),
+        }
+    return overhead
+
+
+async def _run_level(
+    examples: List[Dict[str, str]],
+    responder_llm: Any,
+    revisor_llm: Any,
+    concurrency: int,
+    judge_mode: str,
+    revisor_backend: str = "openai",
+    reference: bool = False,
+) -> Dict[str, Any]:
+    """Run all *examples* with *concurrency* questions in flight.
+
+    The pair runs through scheduler.run_matrix as in main.py, or through
+    pipeline.run_pair if *reference* is set.
+    """
+    # Backends never limit below the question concurrency, the judge fans
+    # out up to 11 calls per question
+    configure_limits(
+        ollama=concurrency,
+        openai=concurrency,
+        tavily=concurrency,
+        judge=11 * concurrency,
+    )
+    summary = RunSummary()
+    # Account every call as main.py does, the tasks of this level inherit it
+    budget.configure_budget()
+    start = time.perf_counter()
+    if reference:
+        emitted = await run_pair(
+            examples,
+            responder_llm,
+            revisor_llm,
+            responder_backend="ollama",
+            revisor_backend=revisor_backend,
+            responder_model=responder_llm.model,
+            revisor_model=revisor_llm.model,
+            on_result=lambda record: summary.observe(record["metrics"]),
+            max_concurrency=concurrency,
+            max_messages=MAX_MESSAGES,
+            judge_mode=judge_mode,
+        )
+    else:
+        job = PairJob(
+            examples,
+            ModelSpec("ollama", responder_llm.model, responder_llm),
+            ModelSpec(revisor_backend, revisor_llm.model, revisor_llm),
+            on_result=lambda record: summary.observe(record["metrics"]),
+            max_concurrency=concurrency,
+            max_messages=MAX_MESSAGES,
+            judge_mode=judge_mode,
+        )
+        await run_matrix([job])
+        emitted = job.emitter.emitted
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "questions": emitted,
+        "seconds": round(elapsed, 3),
+        "questions_per_s": round(emitted / elapsed, 3) if elapsed else 0.0,
+        "summary": summary.summary(),
+        "spend": budget.summary()["total"],
+    }
+
+
+def _run_pool_level(
+    examples: List[Dict[str, str]],
+    latencies: List[float],
+    args: argparse.Namespace,
+) -> Dict[str, Any]:
+    """Run all *examples* against one stand-in Ollama server per latency."""
+    size = len(latencies)
+    with ExitStack() as stack:
+        servers = [
+            stack.enter_context(
+                FakeOllamaServer(
+                    latency=latency,
+                    slots=args.pool_slots,
+                    answer_words=args.answer_words,
+                    num_queries=args.num_queries,
+                )
+            )
+            for latency in latencies
+        ]
+        ollama_pool.configure_pool([server.url for server in servers])
+        llm = ollama_pool.chat_ollama(model="fake-ollama")
+        # Twice the slots of the pool in flight keep every server busy
+        concurrency = 2 * size * args.pool_slots
+        row = asyncio.run(
+            _run_level(
+                examples,
+                llm,
+                llm,
+                concurrency,
+                args.judge_mode,
+                revisor_backend="ollama",
+            )
+        )
+        row["pool_size"] = size
+        row["server_requests"] = [server.requests for server in servers]
+        # Without a pool (one server) every question went to that server
+        pinned = {
+            e["url"]: e["questions"] for e in ollama_pool.summary().get("endpoints", [])
+        }
+        row["server_questions"] = [
+            pinned.get(server.url, row["questions"]) for server in servers
+        ]
+        ollama_pool.configure_pool([])
+    return row
+
+
+async def _run_matrix(
+    examples: List[Dict[str, str]],
+    args: argparse.Namespace,
+    run_budget: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    """Run a local/cloud 2×2 model matrix through the scheduler."""
+    concurrency = 4
+    configure_limits(
+        ollama=concurrency, openai=concurrency, tavily=concurrency, judge=44
+    )
+    budget.configure_budget(run=run_budget)
+    # Parallel tool calls leave several tool messages after a draft
+    local, cloud = (
+        ModelSpec(
+            backend,
+            f"fake-{backend}",
+            FakeChatModel(
+                model=f"fake-{backend}",
+                latency=args.llm_latency,
+                answer_words=args.answer_words,
+                num_queries=max(args.num_queries, 1),
+                parallel_calls=2,
+            ),
+        )
+        for backend in ("ollama", "openai")
+    )
+    records: List[Dict[str, Any]] = []
+    jobs = [
+        PairJob(
+            examples,
+            responder,
+            revisor,
+            on_result=records.append,
+            max_concurrency=concurrency,
+            max_messages=MAX_MESSAGES,
+            judge_mode=args.judge_mode,
+        )
+        for responder in (local, cloud)
+        for revisor in (local, cloud)
+    ]
+    start = time.perf_counter()
+    schedule = await run_matrix(jobs)
+    elapsed = time.perf_counter() - start
+    spend = budget.summary()
+    return {
+        "run_budget": run_budget or {},
+        "expected": len(examples) * len(jobs),
+        "records": len(records),
+        "skipped": spend["questions_skipped"],
+        # Every draft requests a search, so only a budget ends after the draft
+        "revise_skipped": sum(bool(r["revise_skipped"]) for r in records),
+        "revise_cut": sum(r["revise_reason"] == "budget" for r in records),
+        "seconds": round(elapsed, 3),
+        "questions_per_s": round(len(records) / elapsed, 3) if elapsed else 0.0,
+        "swaps_scheduled": schedule["swaps_scheduled"],
+    }
+
+
+def _matrix_report(examples: List[Dict[str, str]], args: argparse.Namespace) -> None:
+    """Check that run_matrix records or skips every question, exit 1 if not."""
+    report: Dict[str, Any] = {"config": vars(args), "matrix": []}
+    for run_budget in (None, {"tokens": 1.0}):
+        report["matrix"].append(asyncio.run(_run_matrix(examples, args, run_budget)))
+
+    print(
+        f"{'budget':>12} {'records':>7} {'skipped':>7} {'cut':>5} "
+        f"{'q/s':>7} {'swaps':>5}"
+    )
+    failures = []
+    for row in report["matrix"]:
+        label = ",".join(f"{k}={v:g}" for k, v in row["run_budget"].items()) or "-"
+        print(
+            f"{label:>12} {row['records']:>7} {row['skipped']:>7} "
+            f"{row['revise_cut']:>5} {row['questions_per_s']:>7.2f} "
+            f"{row['swaps_scheduled']:>5}"
+        )
+        if row["records"] + row["skipped"] != row["expected"]:
+            failures.append(
+                f"budget {label}: {row['records']} records + {row['skipped']} "
+                f"skipped of {row['expected']} questions"
+            )
+        if row["revise_skipped"]:
+            failures.append(
+                f"budget {label}: {row['revise_skipped']} budget cuts recorded "
+                "as drafts without search"
+            )
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    for message in failures:
+        print(f"MATRIX FAILURE {message}")
+    if failures:
+        sys.exit(1)
+
+
+def _check_baseline(
+    report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """Return a message for every level whose throughput fell below the baseline."""
+    previous = {row["concurrency"]: row for row in baseline["levels"]}
+    regressions = []
+    for row in report["levels"]:
+        base = previous.get(row["concurrency"])
+        if base is None or not base["questions_per_s"]:
+            continue
+        ratio = row["questions_per_s"] / base["questions_per_s"]
+        if ratio < 1 - tolerance:
+            regressions.append(
+                f"concurrency {row['concurrency']}: {row['questions_per_s']:.2f} q/s "
+                f"vs. baseline {base['questions_per_s']:.2f} q/s ({ratio:.0%})"
+            )
+    return regressions
+
+
+def _pool_report(examples: List[Dict[str, str]], args: argparse.Namespace) -> None:
+    """Throughput per Ollama pool size and its speedup over the smallest pool."""
+    pools = [
+        _run_pool_level(examples, [args.llm_latency] * size, args)
+        for size in args.pool_sizes
+    ]
+    report: Dict[str, Any] = {"config": vars(args), "pools": pools}
+    if not pools:
+        return
+
+    print(f"{'pool':>4} {'q/s':>7} {'speedup':>7} {'per server':>10}  requests")
+    base = pools[0]
+    for row in pools:
+        speedup = (
+            row["questions_per_s"] / base["questions_per_s"]
+            if base["questions_per_s"]
+            else 0.0
+        )
+        row["speedup"] = round(speedup, 3)
+        row["efficiency"] = round(speedup * base["pool_size"] / row["pool_size"], 3)
+        print(
+            f"{row['pool_size']:>4} {row['questions_per_s']:>7.2f} {speedup:>6.2f}x "
+            f"{row['efficiency']:>9.0%}  {row['server_requests']}"
+        )
+
+    # Questions finish 4× faster on the first server: as pins are released
+    # when a question finishes, it must get most of the new questions
+    uneven = _run_pool_level(examples, [args.llm_latency, 4 * args.llm_latency], args)
+    report["uneven"] = uneven
+    fast, slow = uneven["server_questions"]
+    print(f"fast/slow server: {fast}/{slow} questions")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if fast <= slow:
+        print("REGRESSION the faster Ollama endpoint got no more questions")
+        sys.exit(1)
+
+
+# === CLI ===
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--questions", type=int, default=16)
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=list(DEFAULT_CONCURRENCY)
+    )
+    parser.add_argument(
+        "--judge-mode", choices=evaluator.JUDGE_MODES, default="criteria"
+    )
+    parser.add_argument(
+        "--llm-latency",
+        type=float,
+        default=0.2,
+        help="Seconds per responder/revisor call.",
+    )
+    parser.add_argument(
+        "--judge-latency", type=float, default=0.05, help="Seconds per judge call."
+    )
+    parser.add_argument(
+        "--search-latency", type=float, default=0.1, help="Seconds per Tavily batch."
+    )
+    parser.add_argument("--answer-words", type=int, default=120)
+    parser.add_argument(
+        "--num-queries",
+        type=int,
+        default=2,
+        help="Search queries per draft, 0 lets every question skip the revise stage.",
+    )
+    parser.add_argument("--results-per-query", type=int, default=5)
+    parser.add_argument("--snippet-words", type=int, default=120)
+    parser.add_argument("--output", default=None, help="Write the report as JSON.")
+    parser.add_argument(
+        "--baseline", default=None, help="Compare with a report written by --output."
+    )
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument(
+        "--pool-sizes",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Benchmark Ollama pools of these sizes instead of --concurrency.",
+    )
+    parser.add_argument(
+        "--matrix",
+        action="store_true",
+        help="Check the scheduler (run_matrix) instead of the concurrency levels.",
+    )
+    parser.add_argument(
+        "--run-pair",
+        action="store_true",
+        help="Time pipeline.run_pair, the single-pair reference path, instead of "
+        "the scheduler of main.py.",
+    )
+    parser.add_argument(
+        "--pool-slots",
+        type=int,
+        default=1,
+        help="Parallel requests of every stand-in Ollama server.",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    # === Offline setup: no caches, no cassette, fake backends ===
+    evaluator.configure_judge_cache(enabled=False)
+    tool_executor.configure_search_cache(enabled=False)
+    cassette.configure_cassette("off")
+    evaluator.configure_judge(
+        FakeChatModel(model="fake-judge", latency=args.judge_latency), "fake-judge"
+    )
+    # The judges are built lazily, build them before the first timed level
+    evaluator.get_judges()
+    tool_executor.set_search_tool(
+        fake_search_tool(
+            latency=args.search_latency,
+            results_per_query=args.results_per_query,
+            snippet_words=args.snippet_words,
+        )
+    )
+    responder_llm = FakeChatModel(
+        model="fake-responder",
+        latency=args.llm_latency,
+        answer_words=args.answer_words,
+        num_queries=args.num_queries,
+    )
+    revisor_llm = FakeChatModel(
+        model="fake-revisor", latency=args.llm_latency, answer_words=args.answer_words
+    )
+    # Each fake tool batch runs its queries concurrently, so one batch
+    # takes one search latency
+    latencies = {
+        "draft": args.llm_latency,
+        "revise": args.llm_latency,
+        "execute_tools": args.search_latency,
+        "judge": args.judge_latency,
+    }
+
+    examples = [
+        {"question": f"Benchmark question {i}: who founded the city museum?"}
+        for i in range(args.questions)
+    ]
+
+    if args.pool_sizes:
+        _pool_report(examples, args)
+        return
+    if args.matrix:
+        _matrix_report(examples, args)
+        return
+
+    report: Dict[str, Any] = {"config": vars(args), "levels": []}
+    for concurrency in args.concurrency:
+        row = asyncio.run(
+            _run_level(
+                examples,
+                responder_llm,
+                revisor_llm,
+                concurrency,
+                args.judge_mode,
+                reference=args.run_pair,
+            )
+        )
+        row["overhead"] = _stage_overhead(row["summary"], latencies)
+        report["levels"].append(row)
+    report["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+
+    # === Report ===
+    print(
+        f"{'conc':>4} {'q/s':>7} {'speedup':>7} {'p50 q':>7}  "
+        "overhead p50/p95 ms per stage"
+    )
+    base_rate = report["levels"][0]["questions_per_s"] if report["levels"] else 0.0
+    for row in report["levels"]:
+        overhead = "  ".join(
+            f"{stage} {o['p50_ms']:.1f}/{o['p95_ms']:.1f}"
+            for stage, o in row["overhead"].items()
+        )
+        print(
+            f"{row['concurrency']:>4} {row['questions_per_s']:>7.2f} "
+            f"{row['questions_per_s'] / base_rate if base_rate else 0:>6.1f}x "
+            f"{row['summary']['stages'].get('question', {}).get('p50_s', 0):>6.2f}s  "
+            f"{overhead}"
+        )
+    print(f"peak RSS of the run: {report['peak_rss_mb']:.1f} MiB")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = _check_baseline(report, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
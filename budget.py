@@ -0,0 +1,345 @@
+# === budget.py ===
+
+"""Run-wide token, cost and time accounting with run and question budgets.
+
+A callback handler registered as a LangChain configure hook sees every chat
+model call of the process (responder, revisor and judge, OpenAI and Ollama)
+and adds its tokens, estimated cost and wall time to a ledger per model and
+to the metrics of the question it runs for. A stream closed before its end
+(a thinking cap) reports no usage, its tokens so far are estimated.
+
+Budgets never abort a call that is already running:
+
+- once the run budget is spent, no new question is started; questions in
+  flight are finished (drafts without their revision) and saved
+- once a question's budget is spent, its graph ends after the current step,
+  i.e. the revision (or a further revise round) is skipped
+"""
+
+from __future__ import annotations
+
+# === Imports ===
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from instrumentation import count_tokens, current_question
+
+if TYPE_CHECKING:
+    from langchain_core.outputs import LLMResult
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Constants ===
+BUDGET_KEYS = ("tokens", "cost_usd", "seconds")
+# USD per 1M tokens: input, cached input, output. Models not listed (e.g. all
+# Ollama models) count as free, their cost is the wall time
+PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+
+def parse_budget(spec: str) -> Dict[str, float]:
+    """Parse a budget such as "cost_usd=5,tokens=2e6" (keys: BUDGET_KEYS)."""
+    limits: Dict[str, float] = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        key, _, value = part.partition("=")
+        if key not in BUDGET_KEYS or not value:
+            raise ValueError(
+                f"Unknown budget '{part}', expected KEY=VALUE {BUDGET_KEYS}"
+            )
+        limits[key] = float(value)
+    return limits
+
+
+def estimate_cost(model: str, usage: Dict[str, int]) -> float:
+    """Estimated USD cost of one call of *model* with the given token counts."""
+    prices = PRICES.get(model)
+    if prices is None:
+        return 0.0
+    cached = usage.get("cached_input_tokens", 0)
+    return (
+        (usage.get("input_tokens", 0) - cached) * prices[0]
+        + cached * prices[1]
+        + usage.get("output_tokens", 0) * prices[2]
+    ) / 1e6
+
+
+# === Ledger ===
+
+
+class Ledger:
+    """Tokens, cost and wall time per model, shared by all threads and tasks."""
+
+    def __init__(self) -> None:
+        self.models: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, model: str, usage: Dict[str, int], seconds: float) -> float:
+        """Book one call, returns its estimated cost."""
+        cost = estimate_cost(model, usage)
+        with self._lock:
+            row = self.models.setdefault(
+                model,
+                {
+                    "calls": 0,
+                    "input_tokens": 0,
+                    "cached_input_tokens": 0,
+                    "output_tokens": 0,
+                    "cost_usd": 0.0,
+                    "seconds": 0.0,
+                },
+            )
+            row["calls"] += 1
+            for key in ("input_tokens", "cached_input_tokens", "output_tokens"):
+                row[key] += usage.get(key, 0)
+            row["cost_usd"] += cost
+            row["seconds"] += seconds
+        return cost
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Copy of the rows per model."""
+        with self._lock:
+            return {name: dict(row) for name, row in self.models.items()}
+
+    def totals(self) -> Dict[str, float]:
+        """Spend of the whole run in the units of BUDGET_KEYS."""
+        rows = self.snapshot().values()
+        return {
+            "tokens": sum(r["input_tokens"] + r["output_tokens"] for r in rows),
+            "cost_usd": sum(r["cost_usd"] for r in rows),
+            "seconds": sum(r["seconds"] for r in rows),
+        }
+
+
+class AccountingCallback(BaseCallbackHandler):
+    """Books every chat model call in the ledger and the current question."""
+
+    run_inline = True
+
+    def __init__(self, ledger: Ledger) -> None:
+        self.ledger = ledger
+        self._started: Dict[UUID, Tuple[str, float, List[List[Any]]]] = {}
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[Any]],
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        invocation_params: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        params = invocation_params or {}
+        model = (metadata or {}).get("ls_model_name") or params.get(
+            "model", params.get("model_name", "unknown")
+        )
+        self._started[run_id] = (str(model), time.perf_counter(), messages)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        model, start, _ = self._started.pop(
+            run_id, ("unknown", time.perf_counter(), [])
+        )
+        usage = {"input_tokens": 0, "cached_input_tokens": 0, "output_tokens": 0}
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(
+                    getattr(generation, "message", None), "usage_metadata", None
+                )
+                if not metadata:
+                    continue
+                usage["input_tokens"] += metadata.get("input_tokens", 0)
+                usage["output_tokens"] += metadata.get("output_tokens", 0)
+                usage["cached_input_tokens"] += (
+                    metadata.get("input_token_details") or {}
+                ).get("cache_read") or 0
+        self._book(model, usage, time.perf_counter() - start)
+
+    def on_llm_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        response: Optional[LLMResult] = None,
+        **kwargs: Any,
+    ) -> None:
+        started = self._started.pop(run_id, None)
+        if started is None or response is None:
+            return
+        # A stream closed early (e.g. at a thinking cap) ends here instead of
+        # in on_llm_end, without the usage the server reports at the end:
+        # book the tokens it produced so far, estimated from the text
+        output = "".join(
+            generation.text
+            for generations in response.generations
+            for generation in generations
+        )
+        if not output:
+            return
+        model, start, messages = started
+        prompt = "".join(
+            message.content
+            for batch in messages
+            for message in batch
+            if isinstance(getattr(message, "content", None), str)
+        )
+        usage = {
+            "input_tokens": count_tokens(prompt),
+            "cached_input_tokens": 0,
+            "output_tokens": count_tokens(output),
+        }
+        self._book(model, usage, time.perf_counter() - start)
+
+    def _book(self, model: str, usage: Dict[str, int], seconds: float) -> None:
+        """Add one call to the ledger and the spend of the current question."""
+        cost = self.ledger.add(model, usage, seconds)
+        metrics = current_question()
+        if metrics is not None:
+            metrics.spend["tokens"] += usage["input_tokens"] + usage["output_tokens"]
+            metrics.spend["cost_usd"] += cost
+            metrics.spend["seconds"] += seconds
+
+
+# === State ===
+_handler: ContextVar[Optional[AccountingCallback]] = ContextVar(
+    "accounting_handler", default=None
+)
+_ledger: Optional[Ledger] = None
+_run_limits: Dict[str, float] = {}
+_question_limits: Dict[str, float] = {}
+_exhausted: Optional[str] = None
+_stats = {"questions_skipped": 0, "questions_cut": 0}
+_hook_registered = False
+
+
+def configure_budget(
+    run: Optional[Dict[str, float]] = None,
+    question: Optional[Dict[str, float]] = None,
+) -> Ledger:
+    """Start accounting for all chat model calls of this context.
+
+    *run* and *question* map BUDGET_KEYS to limits, empty means unlimited.
+    Must be called before the event loop starts so that its tasks inherit it.
+    """
+    global _ledger, _run_limits, _question_limits, _exhausted, _hook_registered
+    if not _hook_registered:
+        from langchain_core.tracers.context import register_configure_hook
+
+        register_configure_hook(_handler, inheritable=True)
+        _hook_registered = True
+    _ledger = Ledger()
+    _run_limits = dict(run or {})
+    _question_limits = dict(question or {})
+    _exhausted = None
+    _stats.update(questions_skipped=0, questions_cut=0)
+    _handler.set(AccountingCallback(_ledger))
+    if _run_limits or _question_limits:
+        logger.info("Budget: run %s, per question %s", _run_limits, _question_limits)
+    return _ledger
+
+
+def run_exhausted() -> Optional[str]:
+    """Name of the first run budget spent (e.g. "cost_usd"), else None."""
+    global _exhausted
+    if _exhausted is None and _ledger is not None and _run_limits:
+        totals = _ledger.totals()
+        for key, limit in _run_limits.items():
+            if totals[key] >= limit:
+                _exhausted = key
+                logger.warning(
+                    "Run budget spent (%s %.4g >= %.4g), no new questions are "
+                    "started",
+                    key,
+                    totals[key],
+                    limit,
+                )
+                break
+    return _exhausted
+
+
+def question_exhausted() -> bool:
+    """True if the question of the current task has spent its budget."""
+    metrics = current_question()
+    if metrics is None or not _question_limits:
+        return False
+    return any(metrics.spend[key] >= limit for key, limit in _question_limits.items())
+
+
+def note_skipped() -> None:
+    """Count a question that was not started because the run budget is spent."""
+    _stats["questions_skipped"] += 1
+
+
+def note_cut() -> None:
+    """Count a question whose graph was ended early by a budget."""
+    _stats["questions_cut"] += 1
+
+
+def summary() -> Dict[str, Any]:
+    """Spend per model and in total, the budgets and what they stopped."""
+    if _ledger is None:
+        return {}
+    models = {
+        name: {
+            **row,
+            "cost_usd": round(row["cost_usd"], 6),
+            "seconds": round(row["seconds"], 3),
+        }
+        for name, row in _ledger.snapshot().items()
+    }
+    totals = _ledger.totals()
+    return {
+        "models": models,
+        "total": {
+            "tokens": totals["tokens"],
+            "cost_usd": round(totals["cost_usd"], 6),
+            "seconds": round(totals["seconds"], 3),
+        },
+        "run_budget": _run_limits,
+        "question_budget": _question_limits,
+        "exhausted": _exhausted,
+        **_stats,
+    }
+
+
+def log_summary() -> None:
+    """Write the spend per model to the log."""
+    report = summary()
+    if not report:
+        return
+    logger.info("=== Spend per model ===")
+    for name, row in report["models"].items():
+        logger.info(
+            "%-14s calls=%-5s tokens=%-9s cost=$%.4f time=%.1fs",
+            name,
+            row["calls"],
+            row["input_tokens"] + row["output_tokens"],
+            row["cost_usd"],
+            row["seconds"],
+        )
+    total = report["total"]
+    logger.info(
+        "Total: %s tokens, $%.4f, %.1fs model time%s",
+        total["tokens"],
+        total["cost_usd"],
+        total["seconds"],
+        (
+            f" (run budget '{report['exhausted']}' spent: "
+            f"{report['questions_skipped']} questions not started)"
+            if report["exhausted"]
+            else ""
+        ),
+    )
+    if report["questions_cut"]:
+        logger.info("Questions ended early by a budget: %s", report["questions_cut"])
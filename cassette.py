@@ -0,0 +1,184 @@
+# === cassette.py ===
+
+"""Record/replay of responder, revisor and search calls.
+
+record: every call is forwarded to the real backend and its response stored.
+replay: responses are served from the cassette, no backend is contacted and
+        a call that was never recorded fails with CassetteMiss. The models
+        are ReplayModel stand-ins, so no client or API key is needed, and
+        judge results come from the judge cache only (a miss is a
+        CassetteMiss as well, see evaluator.configure_judge_cache()).
+
+Responses are keyed on stage, model, the stage options that change the
+response without showing in the input (thinking mode and cap) and the exact
+input. As long as the inputs and options match, a replayed run reproduces
+the answers, reasoning, tool use, string scores and judge evaluations of
+the recorded one. Its metrics (latencies, spend) are those of the replay.
+"""
+
+from __future__ import annotations
+
+# === Imports ===
+import logging
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Final, List, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from disk_cache import DiskCache
+
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Constants ===
+CASSETTE_MODES: Final = ("off", "record", "replay")
+CASSETTE_PATH = Path("cache/cassette.sqlite")
+
+
+class CassetteMiss(RuntimeError):
+    """Raised in replay mode for a call that is not on the cassette."""
+
+
+class ReplayModel(Runnable[Any, Any]):
+    """Stand-in chat model of a replayed run; calling it is a CassetteMiss.
+
+    Chains can be built on it (bind_tools, with_structured_output) as the
+    cassette or the judge cache answer all of their calls.
+    """
+
+    def __init__(self, model: str) -> None:
+        self.model = model  # read by chains.model_name_of()
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> ReplayModel:
+        return self
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> ReplayModel:
+        return self
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        raise CassetteMiss(f"Model '{self.model}' called in replay mode")
+
+
+class Cassette:
+    """Store of recorded responses, see module docstring for the modes."""
+
+    def __init__(self, mode: str, path: str | Path = CASSETTE_PATH) -> None:
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode '{mode}'")
+        self.mode = mode
+        self.store = DiskCache(path, name=f"cassette ({mode})")
+
+    def lookup(
+        self,
+        stage: str,
+        model: str,
+        payload: Any,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        """Return the recorded response for a call, raise CassetteMiss if absent."""
+        options = options or {}
+        response = self.store.get([stage, model, options, payload])
+        if response is None:
+            raise CassetteMiss(
+                f"No recorded {stage} response for model '{model}' with {options}"
+            )
+        return response
+
+    def record(
+        self,
+        stage: str,
+        model: str,
+        payload: Any,
+        response: Any,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Store the *response* of a call."""
+        self.store.set([stage, model, options or {}, payload], response)
+
+    def wrap(
+        self,
+        runnable: Runnable,
+        stage: str,
+        model: str,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> Runnable:
+        """Wrap a chain that maps a message list to one AI message.
+
+        *options* are the settings of the chain that are not part of its
+        input, e.g. {"think": "512"}; they are part of the key.
+        """
+        options = dict(options or {})
+        from langchain_core.messages import (
+            message_to_dict,
+            messages_from_dict,
+            messages_to_dict,
+        )
+        from langchain_core.runnables import RunnableLambda
+
+        def _payload(messages: List[BaseMessage]) -> Any:
+            # MessageGraph assigns random ids to new messages, ignore them
+            payload = messages_to_dict(messages)
+            for message in payload:
+                message["data"].pop("id", None)
+            return payload
+
+        def _replay(messages: List[BaseMessage]) -> BaseMessage:
+            recorded = self.lookup(stage, model, _payload(messages), options)
+            return messages_from_dict([recorded])[0]
+
+        def _invoke(messages: List[BaseMessage], config: Any = None) -> BaseMessage:
+            if self.mode == "replay":
+                return _replay(messages)
+            response = runnable.invoke(messages, config)
+            self.record(
+                stage, model, _payload(messages), message_to_dict(response), options
+            )
+            return response
+
+        async def _ainvoke(
+            messages: List[BaseMessage], config: Any = None
+        ) -> BaseMessage:
+            if self.mode == "replay":
+                return _replay(messages)
+            response = await runnable.ainvoke(messages, config)
+            self.record(
+                stage, model, _payload(messages), message_to_dict(response), options
+            )
+            return response
+
+        return RunnableLambda(_invoke, afunc=_ainvoke, name=runnable.get_name())
+
+
+# === Active cassette ===
+_cassette: Optional[Cassette] = None
+
+
+def configure_cassette(mode: str = "off", path: str | Path = CASSETTE_PATH) -> None:
+    """Select the cassette mode for all chains built afterwards."""
+    global _cassette
+    if mode not in CASSETTE_MODES:
+        raise ValueError(f"Unknown cassette mode '{mode}', expected {CASSETTE_MODES}")
+    _cassette = None if mode == "off" else Cassette(mode, path)
+    logger.info("Cassette mode: %s", mode)
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Return the active cassette, None when recording/replay is off."""
+    return _cassette
+
+
+def wrap(
+    runnable: Runnable,
+    stage: str,
+    model: str,
+    options: Optional[Dict[str, Any]] = None,
+) -> Runnable:
+    """Route *runnable* through the active cassette, if there is one."""
+    if _cassette is None:
+        return runnable
+    return _cassette.wrap(runnable, stage, model, options)
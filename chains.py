@@ -3,36 +3,60 @@
 """
 Factory functions that build the responder and revisor LangChain agents.
 Both share one prompt template but bind different tool schemas.
+
+Thinking models (qwen3) can run each agent with thinking on, off (the
+/no_think switch) or capped: the response is streamed and, once the
+<think> block exceeds the cap, cut off and requested again without thinking.
 """
 
 import datetime
+import re
+from contextlib import aclosing, closing
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
 
 from dotenv import load_dotenv
-from langchain_core.output_parsers.openai_tools import (
-    JsonOutputToolsParser,
-    PydanticToolsParser,
-)
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
+import cassette
+from instrumentation import count_tokens, current_stage
 from schemas import AnswerQuestion, ReviseAnswer
 
 load_dotenv()
 
-# Parses tool output
-parser = JsonOutputToolsParser(return_id=True)
-parser_pydantic = PydanticToolsParser(tools=[AnswerQuestion])
+# === Prompt time ===
+
+# A timestamp that changes on every call changes the prompt prefix and
+# defeats Ollama's KV cache and OpenAI's prompt caching, so it is rounded
+TIME_FORMATS = {
+    "date": "%Y-%m-%d",
+    "hour": "%Y-%m-%d %H:00",
+    "minute": "%Y-%m-%d %H:%M",
+    "second": "%Y-%m-%dT%H:%M:%S",
+}
+DEFAULT_TIME_GRANULARITY = "date"
+_time_format = TIME_FORMATS[DEFAULT_TIME_GRANULARITY]
+
+
+def configure_time_granularity(granularity: str) -> None:
+    """Select how precisely the current time is given in the prompt."""
+    global _time_format
+    if granularity not in TIME_FORMATS:
+        raise ValueError(
+            f"Unknown time granularity '{granularity}', expected {list(TIME_FORMATS)}"
+        )
+    _time_format = TIME_FORMATS[granularity]
+
+
+def current_time() -> str:
+    return datetime.datetime.now().strftime(_time_format)
 
 
 # === Prompt template used by both responder and revisor ===
 
-# Defines format and behavior for messages sent to LLM
-actor_prompt_template = ChatPromptTemplate.from_messages(
-    [
-        # System message
-        (
-            "system",
-            """You are a knowledgeable assistant.
-Current time: {time}
+# Defines format and behavior for messages sent to LLM.
+# The static instructions come first so that they form a cacheable prefix,
+# the time is the last line of the system message
+actor_system_prompt = """You are a knowledgeable assistant.
 
 Answer the question in a clear, fact-based and direct manner (max. 150 words).
 Do not speculate or include opinions. 
@@ -46,14 +70,126 @@ Examples:
 
 If you are not fully confident in your answer,
 YOU MUST use the tool to verify or obtain the necessary
-information.""",
-        ),
-        # Placeholder for conversation history
-        MessagesPlaceholder(variable_name="messages"),
-        # Final instruction
-        ("system", "Answer the user's question above using the required format."),
-    ]
-).partial(time=lambda: datetime.datetime.now().isoformat())
+information.
+
+Current time: {time}"""
+
+
+@lru_cache(maxsize=None)
+def actor_prompt_template(thinking: bool = True):
+    """Prompt template of both agents, built on first use.
+
+    Without *thinking* the final instruction ends with qwen3's /no_think
+    switch, the cacheable prefix stays the same.
+    """
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+    final_instruction = "Answer the user's question above using the required format."
+    if not thinking:
+        final_instruction += f" {NO_THINK_SWITCH}"
+    return ChatPromptTemplate.from_messages(
+        [
+            # System message
+            ("system", actor_system_prompt),
+            # Placeholder for conversation history
+            MessagesPlaceholder(variable_name="messages"),
+            # Final instruction
+            ("system", final_instruction),
+        ]
+    ).partial(time=current_time)
+
+
+# === Thinking mode ===
+
+THINK_MODES = ("on", "off")  # or a positive number of reasoning tokens
+NO_THINK_SWITCH = "/no_think"
+_THINK_BLOCK = re.compile(r"<think>(.*?)(?:</think>|$)", re.DOTALL)
+
+
+def parse_think_mode(value: str) -> str:
+    """Validate a thinking mode: on, off or a token cap such as 512."""
+    if value in THINK_MODES or (value.isdigit() and int(value) > 0):
+        return value
+    raise ValueError(f"Unknown thinking mode '{value}', expected on, off or N > 0")
+
+
+def split_reasoning(text: str) -> Tuple[str, Optional[str]]:
+    """Text without its <think> blocks and their content (None if empty)."""
+    reasoning = "\n".join(m.strip() for m in _THINK_BLOCK.findall(text))
+    return _THINK_BLOCK.sub("", text).strip(), reasoning.strip() or None
+
+
+def _thinking_open(message: Any) -> bool:
+    """True while a streamed response is still inside its <think> block."""
+    content = message.content if isinstance(message.content, str) else ""
+    return content.lstrip().startswith("<think>") and "</think>" not in content
+
+
+def _note_thinking(output: Any, think: str, capped: bool = False) -> Any:
+    """Add the thinking mode and reasoning tokens to the current stage."""
+    entry = current_stage()
+    if entry is not None:
+        content = output.content if isinstance(output.content, str) else ""
+        _, reasoning = split_reasoning(content)
+        entry["think"] = think
+        entry["reasoning_tokens"] = count_tokens(reasoning) if reasoning else 0
+        if capped:
+            entry["think_capped"] = True
+    return output
+
+
+def _with_reasoning(output: Any, reasoning: str) -> Any:
+    """Answer without thinking, preceded by the <think> block cut at the cap."""
+    answer, _ = split_reasoning(
+        output.content if isinstance(output.content, str) else ""
+    )
+    return output.model_copy(update={"content": f"{reasoning}</think>\n{answer}"})
+
+
+def _think_control(thinking_chain, direct_chain, think: str):
+    """Runnable running one agent in the given thinking mode."""
+    from langchain_core.messages.utils import message_chunk_to_message
+    from langchain_core.runnables import RunnableLambda
+
+    def _streamed_message(message: Any) -> Any:
+        if message is None:
+            raise ValueError(f"{thinking_chain.get_name()} streamed no message")
+        return message_chunk_to_message(message)
+
+    if think in THINK_MODES:
+        chain = thinking_chain if think == "on" else direct_chain
+        return chain | RunnableLambda(lambda output: _note_thinking(output, think))
+
+    cap = int(think)
+
+    def _invoke(value: Any, config: Any = None) -> Any:
+        message, chunks = None, 0
+        with closing(thinking_chain.stream(value, config)) as stream:
+            for chunk in stream:
+                message = chunk if message is None else message + chunk
+                chunks += 1  # Ollama streams about one token per chunk
+                if chunks > cap and _thinking_open(message):
+                    break
+            else:
+                return _note_thinking(_streamed_message(message), think)
+        output = direct_chain.invoke(value, config)
+        return _note_thinking(_with_reasoning(output, message.content), think, True)
+
+    async def _ainvoke(value: Any, config: Any = None) -> Any:
+        message, chunks = None, 0
+        async with aclosing(thinking_chain.astream(value, config)) as stream:
+            async for chunk in stream:
+                message = chunk if message is None else message + chunk
+                chunks += 1
+                if chunks > cap and _thinking_open(message):
+                    break
+            else:
+                return _note_thinking(_streamed_message(message), think)
+        output = await direct_chain.ainvoke(value, config)
+        return _note_thinking(_with_reasoning(output, message.content), think, True)
+
+    return RunnableLambda(_invoke, afunc=_ainvoke, name=thinking_chain.get_name())
+
 
 # === Shared revisor instructions ===
 
@@ -82,31 +218,65 @@ References:
 # === Builders for responder and revisor ===
 
 
+def model_name_of(llm) -> str:
+    """Model name of a ChatOllama / ChatOpenAI instance."""
+    return str(getattr(llm, "model_name", None) or getattr(llm, "model", "unknown"))
+
+
+def _stage_options(think: str) -> Dict[str, Any]:
+    """Settings of an agent that change its answer but not its input."""
+    return {
+        "think": "on" if think.isdigit() else think,
+        "think_cap": int(think) if think.isdigit() else None,
+    }
+
+
+def _agent(llm, tool, instruction: str, think: str):
+    """Prompt and tool-bound model of one agent in the given thinking mode."""
+    bound = llm.bind_tools(
+        tools=[tool],
+        tool_choice=None,  # Let the model choose when to use the tool
+    )
+    thinking_chain, direct_chain = (
+        actor_prompt_template(thinking).partial(first_instruction=instruction) | bound
+        for thinking in (True, False)
+    )
+    return _think_control(thinking_chain, direct_chain, think)
+
+
 # Creates the responder agent
-def build_responder(llm):
-    return (
-        actor_prompt_template.partial(
-            # Additional instruction for responder
-            first_instruction="""Answer the question as clearly and factually
+def build_responder(llm, think: str = "on"):
+    chain = _agent(
+        llm,
+        AnswerQuestion,  # The Tool the responder can use
+        # Additional instruction for responder
+        """Answer the question as clearly and factually
             as possible (max. 150 words).
             - First try to answer using only your internal knowledge.
             - If you are uncertain or the question is likely to require
             up-to-date, external, or detailed information,
             YOU MUST use the tool.
-            """
-        )
-        | llm.bind_tools(
-            tools=[AnswerQuestion],  # The Tool the responder can use
-            tool_choice=None,  # Let the model choose when to use the tool
-        )
+            """,
+        think,
+    )
+    # Record or replay the LLM call if a cassette is active
+    return cassette.wrap(
+        chain,
+        stage="responder",
+        model=model_name_of(llm),
+        options=_stage_options(think),
     )
 
 
 # Creates the revisor agent
-def build_revisor(llm):
-    return actor_prompt_template.partial(
-        first_instruction=revise_instructions
-    ) | llm.bind_tools(
-        tools=[ReviseAnswer],  # The Tool the revisor can use
-        tool_choice=None,  # Let the model decide when to use it
+def build_revisor(llm, think: str = "on"):
+    chain = _agent(
+        llm,
+        ReviseAnswer,  # The Tool the revisor can use
+        revise_instructions,
+        think,
+    )
+    # Record or replay the LLM call if a cassette is active
+    return cassette.wrap(
+        chain, stage="revisor", model=model_name_of(llm), options=_stage_options(think)
     )
@@ -0,0 +1,301 @@
+# === columnar_store.py ===
+
+"""
+Columnar storage of result records with a separate blob store for texts.
+
+A store is a directory with two files:
+
+- results.parquet: one row per record with the numeric and categorical
+  fields (model pair, 0/1 scores and outcomes from analytics.flatten(),
+  pair-wise winner, tool flags, latencies and token counts). Analyses read
+  only the columns they need instead of parsing every record.
+- blobs.bin: append-only store of the large texts (answers with their
+  <think> reasoning, judge reasoning, the per-stage metrics). Every text is
+  stored once, identical texts (e.g. a draft that is also the final answer,
+  a question asked to several pairs) share one blob. Blobs are referenced by
+  (offset, length) and read through a memory map.
+
+Each row also references the record's skeleton, the record as JSON with its
+long strings replaced by blob references, so export_json() reproduces the
+results.json of the JSONL file byte for byte.
+
+Run: python columnar_store.py --results results/results.jsonl
+     python columnar_store.py --export results/results.json
+"""
+
+from __future__ import annotations
+
+# === Imports ===
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from analytics import PAIR_COLUMNS, flatten
+from results_store import RESULTS_JSON, RESULTS_JSONL, iter_records, write_json_list
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Constants ===
+COLUMNAR_DIR = Path("results/columnar")
+TABLE_NAME = "results.parquet"
+BLOBS_NAME = "blobs.bin"
+MIN_BLOB_CHARS = 64  # shorter strings stay inline in the skeleton
+STAGES = ("draft", "execute_tools", "revise", "judge")
+
+_HEADER = 8  # little-endian payload length in front of every blob
+_REF_KEY = "$blob"
+
+BlobRef = Tuple[int, int]
+
+
+# === Blob store ===
+
+
+class BlobStore:
+    """Append-only, content-deduplicated store of UTF-8 texts."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.touch(exist_ok=True)
+        self._index: Dict[bytes, BlobRef] = {}
+        self._map: Optional[mmap.mmap] = None
+        self._scan()
+        self._file = self.path.open("ab")
+        self.added = 0
+        self.reused = 0
+
+    def _scan(self) -> None:
+        """Rebuild the dedup index, cut off a blob truncated by a crash."""
+        size = self.path.stat().st_size
+        offset = 0
+        with self.path.open("rb") as f:
+            while offset + _HEADER <= size:
+                f.seek(offset)
+                length = int.from_bytes(f.read(_HEADER), "little")
+                if offset + _HEADER + length > size:
+                    break
+                payload = f.read(length)
+                self._index[hashlib.sha1(payload).digest()] = (
+                    offset + _HEADER,
+                    length,
+                )
+                offset += _HEADER + length
+        if offset != size:
+            logger.warning("Truncating incomplete blob at %s in %s", offset, self.path)
+            os.truncate(self.path, offset)
+
+    def put(self, text: str) -> BlobRef:
+        """Store *text* (once) and return its (offset, length)."""
+        payload = text.encode("utf-8")
+        digest = hashlib.sha1(payload).digest()
+        ref = self._index.get(digest)
+        if ref is not None:
+            self.reused += 1
+            return ref
+        offset = self._file.tell()
+        self._file.write(len(payload).to_bytes(_HEADER, "little") + payload)
+        ref = (offset + _HEADER, len(payload))
+        self._index[digest] = ref
+        self.added += 1
+        return ref
+
+    def get(self, offset: int, length: int) -> str:
+        """Read one blob through the memory map."""
+        end = offset + length
+        if self._map is None or len(self._map) < end:
+            self.flush()
+            if self._map is not None:
+                self._map.close()
+            with self.path.open("rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:end].decode("utf-8")
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self) -> BlobStore:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+# === Skeletons ===
+
+
+def _strip_texts(value: Any, blobs: BlobStore) -> Any:
+    """Replace every long string in *value* with a blob reference."""
+    if isinstance(value, str) and len(value) >= MIN_BLOB_CHARS:
+        return {_REF_KEY: list(blobs.put(value))}
+    if isinstance(value, dict):
+        return {k: _strip_texts(v, blobs) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_strip_texts(v, blobs) for v in value]
+    return value
+
+
+def _restore_texts(value: Any, blobs: BlobStore) -> Any:
+    if isinstance(value, dict):
+        if len(value) == 1 and _REF_KEY in value:
+            return blobs.get(*value[_REF_KEY])
+        return {k: _restore_texts(v, blobs) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_restore_texts(v, blobs) for v in value]
+    return value
+
+
+# === Columns ===
+
+
+def _metric_columns(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Latency and token columns of one record."""
+    metrics = record.get("metrics") or {}
+    row: Dict[str, Any] = {
+        "total_s": metrics.get("total_s"),
+        **{f"{stage}_s": 0.0 for stage in STAGES},
+        "input_tokens": 0,
+        "output_tokens": 0,
+    }
+    for entry in metrics.get("stages", []):
+        if entry.get("stage") in STAGES:
+            row[f"{entry['stage']}_s"] += entry.get("seconds", 0.0)
+        row["input_tokens"] += entry.get("input_tokens", 0)
+        row["output_tokens"] += entry.get("output_tokens", 0)
+    return row
+
+
+def _frame(records: List[Dict[str, Any]], blobs: BlobStore) -> pd.DataFrame:
+    """Columnar rows of *records*, with a skeleton reference per row."""
+    frame = flatten(records)
+    frame.insert(
+        0,
+        "question_index",
+        pd.array([r.get("question_index") for r in records], dtype="Int64"),
+    )
+    frame["pairwise_winner"] = [
+        (r.get("evaluation") or {}).get("pairwise_winner", "Invalid") for r in records
+    ]
+    extra = pd.DataFrame([_metric_columns(r) for r in records], index=frame.index)
+    frame = pd.concat([frame, extra], axis=1)
+
+    refs = [
+        blobs.put(json.dumps(_strip_texts(r, blobs), ensure_ascii=False))
+        for r in records
+    ]
+    frame["skeleton_offset"] = pd.array([o for o, _ in refs], dtype="int64")
+    frame["skeleton_length"] = pd.array([n for _, n in refs], dtype="int64")
+    for column in [*PAIR_COLUMNS, "pairwise_winner"]:
+        frame[column] = frame[column].astype("category")
+    return frame
+
+
+def write_columnar(
+    records: Iterable[Dict[str, Any]], out_dir: str | Path = COLUMNAR_DIR
+) -> Dict[str, Any]:
+    """
+    Write *records* as a columnar store in *out_dir* (the table is replaced,
+    the blob store is appended to). Returns the sizes of both files.
+    """
+    out_dir = Path(out_dir)
+    with BlobStore(out_dir / BLOBS_NAME) as blobs:
+        frame = _frame(list(records), blobs)
+        blobs.flush()
+        stats = {"records": len(frame), "blobs_added": blobs.added}
+        stats["blobs_reused"] = blobs.reused
+
+    table = out_dir / TABLE_NAME
+    tmp = table.with_suffix(".tmp")
+    frame.to_parquet(tmp, compression="zstd", index=False)
+    os.replace(tmp, table)
+    stats["table_bytes"] = table.stat().st_size
+    stats["blob_bytes"] = (out_dir / BLOBS_NAME).stat().st_size
+    logger.info(
+        "Columnar store %s: %s records, table %.1f KB, blobs %.1f KB "
+        "(%s texts added, %s deduplicated)",
+        out_dir,
+        stats["records"],
+        stats["table_bytes"] / 1024,
+        stats["blob_bytes"] / 1024,
+        stats["blobs_added"],
+        stats["blobs_reused"],
+    )
+    return stats
+
+
+def read_table(
+    store_dir: str | Path = COLUMNAR_DIR, columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """Read the columnar table, only *columns* if given."""
+    return pd.read_parquet(Path(store_dir) / TABLE_NAME, columns=columns)
+
+
+def iter_store_records(store_dir: str | Path = COLUMNAR_DIR) -> Iterator[Dict]:
+    """Yield the full records of a columnar store in order."""
+    store_dir = Path(store_dir)
+    refs = read_table(store_dir, ["skeleton_offset", "skeleton_length"])
+    with BlobStore(store_dir / BLOBS_NAME) as blobs:
+        for offset, length in refs.itertuples(index=False):
+            skeleton = json.loads(blobs.get(int(offset), int(length)))
+            yield _restore_texts(skeleton, blobs)
+
+
+def export_json(
+    store_dir: str | Path = COLUMNAR_DIR, json_path: str | Path = RESULTS_JSON
+) -> int:
+    """Write the records of a columnar store in the results.json format."""
+    count = write_json_list(iter_store_records(store_dir), json_path)
+    logger.info("Exported %s records from %s to %s", count, store_dir, json_path)
+    return count
+
+
+# === CLI ===
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--results",
+        default=str(RESULTS_JSONL),
+        help="JSONL (or results.json) file to convert.",
+    )
+    parser.add_argument("--store", default=str(COLUMNAR_DIR))
+    parser.add_argument(
+        "--export",
+        default=None,
+        metavar="JSON",
+        help="Export the store to a results.json file instead of converting.",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.export:
+        export_json(args.store, args.export)
+        return
+    path = Path(args.results)
+    records = (
+        iter_records(path)
+        if path.suffix == ".jsonl"
+        else json.loads(path.read_text(encoding="utf-8"))
+    )
+    stats = write_columnar(records, args.store)
+    print(json.dumps({**stats, "source_bytes": path.stat().st_size}))
+
+
+if __name__ == "__main__":
+    main()
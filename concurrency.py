@@ -0,0 +1,81 @@
+# === concurrency.py ===
+
+"""Per-backend concurrency limits shared by the pipeline, tools and judges.
+
+Every network-bound call (Ollama, OpenAI, the judge LLM and Tavily) acquires
+a slot of its backend before it is sent, so many questions can be in flight
+at once without overloading a single backend.
+"""
+
+from __future__ import annotations
+
+# === Imports ===
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Final, Tuple
+
+if TYPE_CHECKING:
+    from langchain_core.runnables import Runnable
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Constants ===
+DEFAULT_LIMITS: Final[Dict[str, int]] = {
+    "ollama": 2,
+    "openai": 8,
+    "judge": 8,
+    "tavily": 4,
+}
+DEFAULT_MAX_CONCURRENCY = 4  # questions in flight per model pair
+
+# === State ===
+_limits: Dict[str, int] = dict(DEFAULT_LIMITS)
+_semaphores: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = {}
+
+
+def configure_limits(**limits: int) -> None:
+    """Override the concurrency limit of one or more backends."""
+    for backend, limit in limits.items():
+        if limit < 1:
+            raise ValueError(f"Concurrency limit for '{backend}' must be >= 1")
+        _limits[backend] = limit
+    _semaphores.clear()
+    logger.info("Backend concurrency limits: %s", _limits)
+
+
+def get_limit(backend: str) -> int:
+    """Return the configured concurrency limit for *backend*."""
+    return _limits.get(backend, 1)
+
+
+def _semaphore(backend: str) -> asyncio.Semaphore:
+    """Return the semaphore of *backend* for the running event loop."""
+    loop = asyncio.get_running_loop()
+    entry = _semaphores.get(backend)
+    if entry is None or entry[0] is not loop:
+        entry = (loop, asyncio.Semaphore(get_limit(backend)))
+        _semaphores[backend] = entry
+    return entry[1]
+
+
+@asynccontextmanager
+async def backend_slot(backend: str) -> AsyncIterator[None]:
+    """Hold one concurrency slot of *backend* for the duration of the block."""
+    async with _semaphore(backend):
+        yield
+
+
+def limit_runnable(runnable: Runnable, backend: str) -> Runnable:
+    """Wrap *runnable* so that its async calls respect the *backend* limit."""
+    from langchain_core.runnables import RunnableLambda
+
+    def _invoke(value: Any, config: Any = None) -> Any:
+        return runnable.invoke(value, config)
+
+    async def _ainvoke(value: Any, config: Any = None) -> Any:
+        async with backend_slot(backend):
+            return await runnable.ainvoke(value, config)
+
+    return RunnableLambda(_invoke, afunc=_ainvoke, name=runnable.get_name())
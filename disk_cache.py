@@ -0,0 +1,185 @@
+# === disk_cache.py ===
+
+"""Small SQLite-backed, content-addressed cache for JSON-serialisable values.
+
+Entries are keyed on a SHA-256 hash of their key parts, the least recently
+used entries are evicted once *max_entries* is exceeded and entries stored
+with a time-to-live are dropped once they expire.
+
+Eviction is amortised: a set() only counts, once the cache holds
+EVICT_SLACK more entries than allowed a batch of the oldest ones is deleted
+through the index on the access time; expired entries are purged at most
+every PURGE_INTERVAL seconds. Async code uses aget()/aset(), which run the
+SQLite work in a thread instead of on the event loop.
+"""
+
+from __future__ import annotations
+
+# === Imports ===
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Constants ===
+EVICT_SLACK = 0.01  # fraction of max_entries allowed over the limit before eviction
+PURGE_INTERVAL = 60.0  # seconds between deletions of expired entries
+
+
+def make_key(parts: Sequence[Any]) -> str:
+    """Return the content hash of *parts* (any JSON-serialisable values)."""
+    payload = json.dumps(list(parts), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """Persistent key/value cache with hit/miss counters and LRU eviction."""
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_entries: Optional[int] = None,
+        name: str = "cache",
+        ttl: Optional[float] = None,
+    ) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL,"
+            " expires REAL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+        if "expires" not in columns:
+            self._conn.execute("ALTER TABLE entries ADD COLUMN expires REAL")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)"
+        )
+        self._conn.commit()
+        # Upper bound of the row count (a replaced key is counted again),
+        # made exact on every eviction
+        self._count = len(self)
+        self._purged = 0.0
+        logger.info("%s: using %s (%s entries)", self.name, self.path, self._count)
+
+    def get(self, parts: Sequence[Any]) -> Optional[Any]:
+        """Return the cached value for *parts*, or None on a miss."""
+        key = make_key(parts)
+        with self._lock:
+            now = time.time()
+            row = self._conn.execute(
+                "SELECT value, expires FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] is not None and row[1] <= now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE entries SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def set(
+        self, parts: Sequence[Any], value: Any, ttl: Optional[float] = None
+    ) -> None:
+        """Store *value* under *parts*, evicting a batch of old entries if needed.
+
+        *ttl* (seconds) overrides the cache-wide time-to-live for this entry.
+        """
+        key = make_key(parts)
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expires = now + ttl if ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries"
+                " (key, value, created, accessed, expires) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now, expires),
+            )
+            self._count += 1
+            if now - self._purged >= PURGE_INTERVAL:
+                self._purge_expired(now)
+            if self.max_entries is not None and self._count > self.max_entries + max(
+                1, int(self.max_entries * EVICT_SLACK)
+            ):
+                self._evict()
+            self._conn.commit()
+
+    def _purge_expired(self, now: float) -> None:
+        """Delete expired entries (caller holds the lock)."""
+        self._conn.execute(
+            "DELETE FROM entries WHERE expires IS NOT NULL AND expires <= ?", (now,)
+        )
+        self._purged = now
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries beyond max_entries."""
+        assert self.max_entries is not None
+        self._count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        excess = self._count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                " SELECT key FROM entries ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+            self._count -= excess
+
+    async def aget(self, parts: Sequence[Any]) -> Optional[Any]:
+        """get() in a worker thread, for use on the event loop."""
+        return await asyncio.to_thread(self.get, parts)
+
+    async def aset(
+        self, parts: Sequence[Any], value: Any, ttl: Optional[float] = None
+    ) -> None:
+        """set() in a worker thread, for use on the event loop."""
+        await asyncio.to_thread(self.set, parts, value, ttl)
+
+    def clear(self) -> None:
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._count = 0
+        self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters, hit rate and current size."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self),
+        }
@@ -1,16 +1,29 @@
 # === evaluator.py ===
 
-"""Wrapper around LangChain evaluators."""
+"""Wrapper around LangChain evaluators.
+
+The judge LLM and the evaluators are created on first use, so importing this
+module stays cheap and needs no API key. The judge runs on OpenAI (default)
+or on a local Ollama model, see configure_judge_backend().
+"""
 
 # === Imports ===
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import Any, Dict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
 
 from dotenv import load_dotenv
-from langchain.evaluation import EvaluatorType, load_evaluator
-from langchain_openai import ChatOpenAI
+
+from cassette import CassetteMiss
+from concurrency import backend_slot
+from disk_cache import DiskCache
+from instrumentation import UsageCallback, track
+from resilience import call_with_retries, call_with_retries_sync
+from schemas import JointEvaluation
 
 # === Logging ===
 logger = logging.getLogger(__name__)
@@ -18,12 +31,15 @@ logger = logging.getLogger(__name__)
 # === Environment ===
 load_dotenv()
 
-# === Initialize evaluation LLM ===
-llm = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0,
-)
-logger.info("Evaluation LLM initialised with model 'gpt-4o-mini'")
+# === Evaluation LLM (created lazily) ===
+JUDGE_BACKENDS = ("openai", "ollama")
+DEFAULT_JUDGE_MODELS = {"openai": "gpt-4o-mini", "ollama": "qwen3:8b"}
+JUDGE_BACKEND = "openai"
+JUDGE_MODEL = DEFAULT_JUDGE_MODELS[JUDGE_BACKEND]
+
+_judge_options: Dict[str, Any] = {}  # extra ChatOllama arguments
+_judge_llm: Any = None
+_judges: Optional[Tuple[Dict[str, Any], Any, Any]] = None
 
 # === Single‑response evaluators ===
 _eval_types = [
@@ -34,17 +50,238 @@ _eval_types = [
     ("coherence", "coherence"),
 ]
 
-_single_evaluators = {
-    name: load_evaluator(EvaluatorType.CRITERIA, llm=llm, config={"criteria": crit})
-    for name, crit in _eval_types
+# === Single‑call multi‑criteria judge ===
+# Same criterion questions as LangChain's CRITERIA evaluators, so the two
+# judge modes stay comparable
+_criteria_questions = {
+    "helpfulness": "Is the submission helpful, insightful, and appropriate?",
+    "correctness": "Is the submission correct, accurate, and factual?",
+    "relevance": "Is the submission referring to a real quote from the text?",
+    "conciseness": "Is the submission concise and to the point?",
+    "coherence": "Is the submission coherent, well-structured, and organized?",
 }
-logger.debug("Loaded single‑response evaluators: %s", list(_single_evaluators))
 
-# === Pair‑wise evaluator ===
-pairwise_eval = load_evaluator(
-    EvaluatorType.PAIRWISE_STRING, llm=llm, config={"criteria": "overall"}
-)
-logger.debug("Loaded pair‑wise evaluator")
+# Built into a ChatPromptTemplate together with the judges
+_combined_messages = [
+    (
+        "system",
+        """Please act as an impartial judge and evaluate the responses of two
+AI assistants (A and B) to the user question displayed below.
+
+1. Grade each response on its own against every criterion and answer
+   'Y' if it meets the criterion, otherwise 'N':
+{criteria}
+2. Compare both responses and choose the one that answers the user's
+   question better overall ('A', 'B' or 'C' for a tie). Avoid position
+   bias and do not let the length of the responses influence you.
+
+Reason step by step before each verdict and keep the reasoning short.""",
+    ),
+    (
+        "human",
+        """[User Question]
+{input}
+
+[The Start of Assistant A's Answer]
+{prediction}
+[The End of Assistant A's Answer]
+
+[The Start of Assistant B's Answer]
+{prediction_b}
+[The End of Assistant B's Answer]""",
+    ),
+]
+
+
+def _load_evaluators(judge_llm):
+    """Build the single‑response, pair‑wise and combined judges for *judge_llm*."""
+    from langchain.evaluation import EvaluatorType, load_evaluator
+    from langchain_core.prompts import ChatPromptTemplate
+
+    single = {
+        name: load_evaluator(
+            EvaluatorType.CRITERIA, llm=judge_llm, config={"criteria": crit}
+        )
+        for name, crit in _eval_types
+    }
+    logger.debug("Loaded single‑response evaluators: %s", list(single))
+
+    # === Pair‑wise evaluator ===
+    pairwise = load_evaluator(
+        EvaluatorType.PAIRWISE_STRING, llm=judge_llm, config={"criteria": "overall"}
+    )
+    logger.debug("Loaded pair‑wise evaluator")
+
+    combined_prompt = ChatPromptTemplate.from_messages(_combined_messages).partial(
+        criteria="\n".join(
+            f"   - {name}: {text}" for name, text in _criteria_questions.items()
+        )
+    )
+    combined = combined_prompt | judge_llm.with_structured_output(JointEvaluation)
+    logger.debug("Loaded single‑call multi‑criteria judge")
+    return single, pairwise, combined
+
+
+def get_judges() -> Tuple[Dict[str, Any], Any, Any]:
+    """Return the (single, pair‑wise, combined) judges, creating them on first use."""
+    global _judge_llm, _judges
+    if _judges is None:
+        if _judge_llm is None:
+            _judge_llm = _build_judge_llm()
+            logger.info(
+                "Evaluation LLM initialised with %s model '%s'",
+                JUDGE_BACKEND,
+                JUDGE_MODEL,
+            )
+        _judges = _load_evaluators(_judge_llm)
+    return _judges
+
+
+def _build_judge_llm():
+    if JUDGE_BACKEND == "ollama":
+        from ollama_pool import chat_ollama
+
+        return chat_ollama(model=JUDGE_MODEL, temperature=0, **_judge_options)
+    from langchain_openai import ChatOpenAI
+
+    # Retries are done by resilience.py, not by the client as well
+    return ChatOpenAI(model=JUDGE_MODEL, temperature=0, max_retries=0)
+
+
+def configure_judge_backend(
+    backend: str = "openai", model: Optional[str] = None, **options: Any
+) -> None:
+    """
+    Select the backend and model of the judge (default model per backend).
+    *options* are passed to ChatOllama, e.g. keep_alive and num_ctx. Judge
+    calls of all questions share the "judge" concurrency limit, for Ollama it
+    should match the parallel request slots (OLLAMA_NUM_PARALLEL) of all
+    endpoints of the pool.
+    """
+    global _judge_llm, _judges, _judge_options, JUDGE_BACKEND, JUDGE_MODEL
+    if backend not in JUDGE_BACKENDS:
+        raise ValueError(
+            f"Unknown judge backend '{backend}', expected one of {JUDGE_BACKENDS}"
+        )
+    JUDGE_BACKEND = backend
+    JUDGE_MODEL = model or DEFAULT_JUDGE_MODELS[backend]
+    _judge_options = options if backend == "ollama" else {}
+    _judge_llm = None
+    _judges = None
+    logger.info("Judge backend: %s, model '%s'", JUDGE_BACKEND, JUDGE_MODEL)
+
+
+def configure_judge(judge_llm, model: str) -> None:
+    """
+    Replace the judge LLM of all evaluators, e.g. with an offline stand-in.
+    *model* is used in the judge cache keys and the metrics.
+    """
+    global _judge_llm, _judges, JUDGE_MODEL
+    _judge_llm = judge_llm
+    _judges = None
+    JUDGE_MODEL = model
+    logger.info("Evaluation LLM replaced with model '%s'", model)
+
+
+# === Constants ===
+JUDGE_MODES = ("criteria", "combined")
+CRITERIA = tuple(name for name, _ in _eval_types)
+DEFAULT_MAX_CONCURRENCY = 11  # 5 criteria × 2 answers + 1 pair-wise call
+JUDGE_CACHE_PATH = Path("cache/judge_cache.sqlite")
+JUDGE_CACHE_MAX_ENTRIES = 200_000
+
+# === Judge result cache ===
+_judge_cache_enabled = True
+_judge_cache_only = False
+_judge_cache: Optional[DiskCache] = None
+
+
+def configure_judge_cache(
+    enabled: bool = True,
+    path: str | Path = JUDGE_CACHE_PATH,
+    max_entries: Optional[int] = JUDGE_CACHE_MAX_ENTRIES,
+    cache_only: bool = False,
+) -> None:
+    """Enable, relocate or bypass the persistent judge result cache.
+
+    With *cache_only* (cassette replay) the judge is never called, a result
+    missing from the cache raises CassetteMiss and fails the question.
+    """
+    global _judge_cache, _judge_cache_enabled, _judge_cache_only
+    if cache_only and not enabled:
+        raise ValueError("A cache-only judge needs the judge cache")
+    _judge_cache_enabled = enabled
+    _judge_cache_only = cache_only
+    _judge_cache = (
+        DiskCache(path, max_entries=max_entries, name="judge cache")
+        if enabled
+        else None
+    )
+    if not enabled:
+        logger.info("Judge cache bypassed")
+
+
+def get_judge_cache() -> Optional[DiskCache]:
+    """Return the judge cache, opening it on first use; None if bypassed."""
+    global _judge_cache
+    if _judge_cache is None and _judge_cache_enabled:
+        _judge_cache = DiskCache(
+            JUDGE_CACHE_PATH, max_entries=JUDGE_CACHE_MAX_ENTRIES, name="judge cache"
+        )
+    return _judge_cache
+
+
+def _cache_parts(criterion, question, prediction, prediction_b=None):
+    """Content address of one judge call."""
+    return [JUDGE_MODEL, criterion, question, prediction, prediction_b]
+
+
+def _cache_miss(parts) -> CassetteMiss:
+    return CassetteMiss(f"No cached '{parts[1]}' judge result for model '{parts[0]}'")
+
+
+def _cached(parts, call, *args, **kwargs):
+    """Return the cached result of a judge call or run and store it."""
+    cache = get_judge_cache()
+    if cache is not None:
+        hit = cache.get(parts)
+        if hit is not None:
+            return hit
+    if _judge_cache_only:
+        raise _cache_miss(parts)
+    result = call(*args, **kwargs)
+    if cache is not None:
+        cache.set(parts, result)
+    return result
+
+
+def _tracked(call, **kwargs):
+    """Run one LangChain evaluator call, recording latency and token usage."""
+
+    def _attempt():
+        with track("judge", JUDGE_MODEL) as entry:
+            return call(callbacks=[UsageCallback(entry)], **kwargs)
+
+    return call_with_retries_sync("judge", _attempt)
+
+
+async def _acached(parts, call, *args, **kwargs):
+    """Async variant of _cached, a hit never waits for a judge slot.
+
+    The SQLite reads and writes run in a worker thread, not on the loop.
+    """
+    cache = get_judge_cache()
+    if cache is not None:
+        hit = await cache.aget(parts)
+        if hit is not None:
+            return hit
+    if _judge_cache_only:
+        raise _cache_miss(parts)
+    result = await call(*args, **kwargs)
+    if cache is not None:
+        await cache.aset(parts, result)
+    return result
+
 
 # --- Evaluation wrapper function ---
 
@@ -57,16 +294,27 @@ def evaluate_pairwise(question, responder, revisor):
     logger.info("Evaluating answers for question: %.60s…", question)
 
     evaluations: Dict[str, Any] = {}
+    single_evaluators, pairwise_eval, _ = get_judges()
 
     # --- single‑response scores ---
-    for name, evaluator in _single_evaluators.items():
+    for name, evaluator in single_evaluators.items():
         try:
-            evaluations[f"{name}_responder"] = evaluator.evaluate_strings(
-                input=question, prediction=responder
+            evaluations[f"{name}_responder"] = _cached(
+                _cache_parts(name, question, responder),
+                _tracked,
+                evaluator.evaluate_strings,
+                input=question,
+                prediction=responder,
             )
-            evaluations[f"{name}_revisor"] = evaluator.evaluate_strings(
-                input=question, prediction=revisor
+            evaluations[f"{name}_revisor"] = _cached(
+                _cache_parts(name, question, revisor),
+                _tracked,
+                evaluator.evaluate_strings,
+                input=question,
+                prediction=revisor,
             )
+        except CassetteMiss:
+            raise
         except Exception as exc:
             logger.exception("%s evaluator failed", name)
             evaluations[f"{name}_responder"] = {"error": str(exc)}
@@ -74,30 +322,247 @@ def evaluate_pairwise(question, responder, revisor):
 
     # --- pair‑wise winner ---
     try:
-        pairwise_result = pairwise_eval.evaluate_string_pairs(
+        pairwise_result = _cached(
+            _cache_parts("pairwise", question, responder, revisor),
+            _tracked,
+            pairwise_eval.evaluate_string_pairs,
+            input=question,
+            prediction=responder,
+            prediction_b=revisor,
+        )
+    except CassetteMiss:
+        raise
+    except Exception as exc:
+        logger.exception("Pair-wise evaluation failed")
+        pairwise_result = exc
+
+    _record_pairwise(evaluations, pairwise_result)
+    return evaluations
+
+
+async def aevaluate_pairwise(
+    question, responder, revisor, max_concurrency: Optional[int] = None
+):
+    """
+    Async variant of evaluate_pairwise.
+    Sends all criterion × answer evaluations and the pairwise call together,
+    bounded by *max_concurrency* per question and the global judge limit.
+    Returns the same dictionary as evaluate_pairwise.
+    """
+    logger.info("Evaluating answers for question: %.60s…", question)
+
+    limit = asyncio.Semaphore(max_concurrency or DEFAULT_MAX_CONCURRENCY)
+
+    @asynccontextmanager
+    async def _slot():
+        async with limit, backend_slot("judge"):
+            yield
+
+    async def _bounded(call, **kwargs):
+        async def _attempt():
+            with track("judge", JUDGE_MODEL) as entry:
+                return await call(callbacks=[UsageCallback(entry)], **kwargs)
+
+        # The judge timeout only covers the call, not the wait for a slot
+        return await call_with_retries("judge", _attempt, slot=_slot)
+
+    # --- single‑response and pair‑wise calls, fanned out together ---
+    single_evaluators, pairwise_eval, _ = get_judges()
+    keys = []
+    calls = []
+    for name, evaluator in single_evaluators.items():
+        for role, prediction in (("responder", responder), ("revisor", revisor)):
+            keys.append(f"{name}_{role}")
+            calls.append(
+                _acached(
+                    _cache_parts(name, question, prediction),
+                    _bounded,
+                    evaluator.aevaluate_strings,
+                    input=question,
+                    prediction=prediction,
+                )
+            )
+    calls.append(
+        _acached(
+            _cache_parts("pairwise", question, responder, revisor),
+            _bounded,
+            pairwise_eval.aevaluate_string_pairs,
             input=question,
             prediction=responder,
             prediction_b=revisor,
         )
+    )
+
+    outcomes = await asyncio.gather(*calls, return_exceptions=True)
+    for outcome in outcomes:
+        if isinstance(outcome, CassetteMiss):
+            raise outcome
 
-        if isinstance(pairwise_result, dict):
-            evaluations["pairwise_winner"] = (
-                pairwise_result.get("value") or "tie"
-            ).strip()
-            evaluations["pairwise_reasoning"] = pairwise_result.get("reasoning", "")
+    evaluations: Dict[str, Any] = {}
+    for key, outcome in zip(keys, outcomes[:-1]):
+        if isinstance(outcome, BaseException):
+            logger.error("%s evaluator failed: %s", key, outcome, exc_info=outcome)
+            evaluations[key] = {"error": str(outcome)}
         else:
-            evaluations["pairwise_winner"] = "Invalid"
-            evaluations["pairwise_reasoning"] = "No result from pairwise evaluator"
+            evaluations[key] = outcome
+
+    pairwise_result = outcomes[-1]
+    if isinstance(pairwise_result, BaseException):
+        logger.error(
+            "Pair-wise evaluation failed: %s", pairwise_result, exc_info=pairwise_result
+        )
+
+    _record_pairwise(evaluations, pairwise_result)
+    return evaluations
+
+
+def evaluate_combined(question, responder, revisor):
+    """
+    Evaluates both responses with a single structured‑output judge call.
+    Returns the same dictionary as evaluate_pairwise.
+    """
+    logger.info("Evaluating answers (combined) for question: %.60s…", question)
+
+    def _attempt():
+        with track("judge", JUDGE_MODEL) as entry:
+            return get_judges()[2].invoke(
+                {"input": question, "prediction": responder, "prediction_b": revisor},
+                config={"callbacks": [UsageCallback(entry)]},
+            )
+
+    def _judge():
+        return call_with_retries_sync("judge", _attempt).model_dump()
 
+    try:
+        result = JointEvaluation.model_validate(
+            _cached(_cache_parts("combined", question, responder, revisor), _judge)
+        )
+    except CassetteMiss:
+        raise
     except Exception as exc:
-        logger.exception("Pair-wise evaluation failed")
+        logger.exception("Combined evaluation failed")
+        result = exc
+    return _map_joint_evaluation(result)
+
+
+async def aevaluate_combined(question, responder, revisor):
+    """Async variant of evaluate_combined."""
+    logger.info("Evaluating answers (combined) for question: %.60s…", question)
+
+    async def _attempt():
+        with track("judge", JUDGE_MODEL) as entry:
+            return await get_judges()[2].ainvoke(
+                {"input": question, "prediction": responder, "prediction_b": revisor},
+                config={"callbacks": [UsageCallback(entry)]},
+            )
+
+    async def _ajudge():
+        result = await call_with_retries(
+            "judge", _attempt, slot=lambda: backend_slot("judge")
+        )
+        return result.model_dump()
+
+    try:
+        result = JointEvaluation.model_validate(
+            await _acached(
+                _cache_parts("combined", question, responder, revisor), _ajudge
+            )
+        )
+    except CassetteMiss:
+        raise
+    except Exception as exc:
+        logger.exception("Combined evaluation failed")
+        result = exc
+    return _map_joint_evaluation(result)
+
+
+async def aevaluate(question, responder, revisor, mode: str = "criteria"):
+    """Evaluate both responses with the selected judge mode."""
+    if mode == "combined":
+        return await aevaluate_combined(question, responder, revisor)
+    if mode == "criteria":
+        return await aevaluate_pairwise(question, responder, revisor)
+    raise ValueError(f"Unknown judge mode '{mode}', expected one of {JUDGE_MODES}")
+
+
+def gold_evaluation(string_scores: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Evaluation without a judge call, from conclusive string scores of both
+    answers (see scoring.py). Only correctness is graded, an equally correct
+    pair is a tie. "graded_by" marks it, analytics.py keeps these questions
+    out of the judge statistics.
+    """
+    evaluations: Dict[str, Any] = {"graded_by": "gold"}
+    for role in ("responder", "revisor"):
+        correct = string_scores[role]["correct"]
+        evaluations[f"correctness_{role}"] = {
+            "reasoning": "Graded by the gold answer (exact match/containment/yes-no)",
+            "value": "Y" if correct else "N",
+            "score": 1 if correct else 0,
+        }
+    responder_correct = string_scores["responder"]["correct"]
+    revisor_correct = string_scores["revisor"]["correct"]
+    winner = (
+        None
+        if responder_correct == revisor_correct
+        else "A" if responder_correct else "B"
+    )
+    _record_pairwise(
+        evaluations,
+        {"value": winner, "reasoning": "Decided by the gold answer, no judge call"},
+    )
+    return evaluations
+
+
+def _map_joint_evaluation(result: Any) -> Dict[str, Any]:
+    """Map a JointEvaluation onto the result keys of evaluate_pairwise."""
+    evaluations: Dict[str, Any] = {}
+
+    if not isinstance(result, JointEvaluation):
+        error = str(result) if isinstance(result, BaseException) else "No result"
+        for name in CRITERIA:
+            evaluations[f"{name}_responder"] = {"error": error}
+            evaluations[f"{name}_revisor"] = {"error": error}
+        _record_pairwise(evaluations, RuntimeError(error))
+        return evaluations
+
+    for role, assessment in (
+        ("responder", result.responder),
+        ("revisor", result.revisor),
+    ):
+        for name in CRITERIA:
+            verdict = getattr(assessment, name)
+            evaluations[f"{name}_{role}"] = {
+                "reasoning": verdict.reasoning,
+                "value": verdict.value,
+                "score": 1 if verdict.value == "Y" else 0,
+            }
+
+    # The PAIRWISE_STRING evaluator reports a tie as value None
+    _record_pairwise(
+        evaluations,
+        {
+            "value": None if result.pairwise_winner == "C" else result.pairwise_winner,
+            "reasoning": result.pairwise_reasoning,
+        },
+    )
+    return evaluations
+
+
+def _record_pairwise(evaluations: Dict[str, Any], pairwise_result: Any) -> None:
+    """Store the pair‑wise winner, reasoning and LangSmith scores."""
+    if isinstance(pairwise_result, BaseException):
+        evaluations["pairwise_winner"] = "Invalid"
+        evaluations["pairwise_reasoning"] = f"Error: {pairwise_result}"
+    elif isinstance(pairwise_result, dict):
+        evaluations["pairwise_winner"] = (pairwise_result.get("value") or "tie").strip()
+        evaluations["pairwise_reasoning"] = pairwise_result.get("reasoning", "")
+    else:
         evaluations["pairwise_winner"] = "Invalid"
-        evaluations["pairwise_reasoning"] = f"Error: {exc}"
+        evaluations["pairwise_reasoning"] = "No result from pairwise evaluator"
 
     # --- LangSmith Scores ---
     winner = evaluations["pairwise_winner"]
     evaluations["pairwise_scores"] = (
         [1, 0] if winner == "A" else [0, 1] if winner == "B" else [0, 0]
     )
-
-    return evaluations
@@ -0,0 +1,330 @@
+# === fakes.py ===
+
+"""Offline stand-ins for the chat models, the Tavily search tool and Ollama.
+
+They let the real chains, graph, tool node and evaluators run without
+Ollama, OpenAI or Tavily. Latency and payload size are configurable so the
+benchmark can emulate slow local models or large search results.
+FakeOllamaServer speaks enough of the Ollama HTTP API for the real
+ChatOllama client, the warm-up and the health checks of an endpoint pool.
+"""
+
+from __future__ import annotations
+
+# === Imports ===
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# === Constants ===
+_ANSWER_TOOLS = ("AnswerQuestion", "ReviseAnswer")
+_WORDS = (
+    "the capital city river founded century museum league season album film "
+    "director president company university population election border"
+).split()
+
+
+def _text(words: int, rng: random.Random) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def _verdict(rng: random.Random) -> Dict[str, str]:
+    return {"reasoning": _text(12, rng), "value": rng.choice("YN")}
+
+
+def _answer_args(
+    tool_name: str, rng: random.Random, answer_words: int, num_queries: int
+) -> Dict[str, Any]:
+    """Arguments of an AnswerQuestion / ReviseAnswer tool call."""
+    args: Dict[str, Any] = {
+        "answer": _text(answer_words, rng),
+        "reflection": {"missing": _text(15, rng), "superfluous": _text(15, rng)},
+        "search_queries": [_text(5, rng) for _ in range(num_queries)],
+    }
+    if tool_name == "ReviseAnswer":
+        args["references"] = [f"https://example.com/{i}" for i in range(2)]
+    return args
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers after a fixed delay without any backend.
+
+    - bound to AnswerQuestion / ReviseAnswer it returns a tool call
+      with an answer of *answer_words* words and *num_queries* search queries
+      (*parallel_calls* such calls, like a model calling tools in parallel)
+    - bound to JointEvaluation it returns a structured verdict
+    - unbound (LangChain CRITERIA / PAIRWISE evaluators) it returns a
+      reasoning text ending in a parsable verdict
+    """
+
+    model: str = "fake-model"
+    latency: float = 0.5  # seconds per call
+    jitter: float = 0.0  # uniform +/- seconds added to latency
+    answer_words: int = 120
+    num_queries: int = 2
+    parallel_calls: int = 1
+    seed: int = 0
+    tool_name: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> FakeChatModel:
+        name = convert_to_openai_tool(tools[0])["function"]["name"]
+        return self.model_copy(update={"tool_name": name})
+
+    def _delay(self, rng: random.Random) -> float:
+        return max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+
+    def _respond(self, messages: List[BaseMessage], rng: random.Random) -> AIMessage:
+        prompt_tokens = sum(len(str(m.content).split()) for m in messages)
+        if self.tool_name in _ANSWER_TOOLS:
+            args: Dict[str, Any] = _answer_args(
+                self.tool_name, rng, self.answer_words, self.num_queries
+            )
+            content = ""
+        elif self.tool_name == "JointEvaluation":
+            assessment = {
+                c: _verdict(rng)
+                for c in (
+                    "helpfulness",
+                    "correctness",
+                    "relevance",
+                    "conciseness",
+                    "coherence",
+                )
+            }
+            args = {
+                "responder": assessment,
+                "revisor": assessment,
+                "pairwise_reasoning": _text(20, rng),
+                "pairwise_winner": rng.choice("ABC"),
+            }
+            content = ""
+        else:
+            args = {}
+            winner = rng.choice("ABC")
+            content = f"{_text(30, rng)} [[{winner}]]\n{rng.choice('YN')}"
+
+        calls = self.parallel_calls if self.tool_name in _ANSWER_TOOLS else 1
+        tool_calls = (
+            [
+                {
+                    "name": self.tool_name,
+                    "args": args,
+                    "id": f"call_{rng.getrandbits(32)}",
+                }
+                for _ in range(calls)
+            ]
+            if self.tool_name
+            else []
+        )
+        output_tokens = len(content.split()) + sum(
+            len(str(v).split()) for v in args.values()
+        )
+        return AIMessage(
+            content=content,
+            tool_calls=tool_calls,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": prompt_tokens + output_tokens,
+            },
+        )
+
+    def _rng(self, messages: List[BaseMessage]) -> random.Random:
+        return random.Random(f"{self.seed}:{self.tool_name}:{len(messages)}")
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        rng = self._rng(messages)
+        time.sleep(self._delay(rng))
+        return ChatResult(
+            generations=[ChatGeneration(message=self._respond(messages, rng))]
+        )
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        rng = self._rng(messages)
+        await asyncio.sleep(self._delay(rng))
+        return ChatResult(
+            generations=[ChatGeneration(message=self._respond(messages, rng))]
+        )
+
+
+def fake_search_tool(
+    latency: float = 0.3, results_per_query: int = 5, snippet_words: int = 120
+):
+    """Stand-in for TavilySearch with the same result layout."""
+
+    def _result(query: str) -> Dict[str, Any]:
+        rng = random.Random(query)
+        return {
+            "query": query,
+            "results": [
+                {
+                    "url": f"https://example.com/{abs(hash((query, i))) % 10**8}",
+                    "title": _text(6, rng),
+                    "content": _text(snippet_words, rng),
+                    "score": round(rng.random(), 3),
+                }
+                for i in range(results_per_query)
+            ],
+        }
+
+    def _search(request: Dict[str, Any]) -> Dict[str, Any]:
+        time.sleep(latency)
+        return _result(request["query"])
+
+    async def _asearch(request: Dict[str, Any]) -> Dict[str, Any]:
+        await asyncio.sleep(latency)
+        return _result(request["query"])
+
+    return RunnableLambda(_search, afunc=_asearch, name="FakeTavilySearch")
+
+
+class FakeOllamaServer:
+    """
+    Local HTTP server answering like one Ollama endpoint.
+
+    It serves /api/tags, /api/generate (warm-up) and /api/chat (streamed or
+    not). Chat requests bound to AnswerQuestion / ReviseAnswer get a tool
+    call, others a short text. Like a real server it works on at most
+    *slots* requests at once (OLLAMA_NUM_PARALLEL), each taking *latency*
+    seconds. Setting *healthy* to False makes every request fail with 503.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        slots: int = 1,
+        models: Sequence[str] = ("fake-ollama",),
+        answer_words: int = 120,
+        num_queries: int = 2,
+    ) -> None:
+        self.latency = latency
+        self.models = list(models)
+        self.answer_words = answer_words
+        self.num_queries = num_queries
+        self.healthy = True
+        self.requests = 0
+        self._slots = threading.BoundedSemaphore(slots)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> FakeOllamaServer:
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-ollama", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> FakeOllamaServer:
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def _chat(self, request: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Response chunks of one /api/chat request, the last one is done."""
+        messages = request.get("messages", [])
+        rng = random.Random(json.dumps(messages, sort_keys=True))
+        with self._slots:
+            self.requests += 1
+            time.sleep(self.latency)
+        tools = request.get("tools") or []
+        message: Dict[str, Any] = {"role": "assistant", "content": ""}
+        name = tools[0]["function"]["name"] if tools else None
+        if name in _ANSWER_TOOLS:
+            args = _answer_args(name, rng, self.answer_words, self.num_queries)
+            message["tool_calls"] = [{"function": {"name": name, "arguments": args}}]
+        else:
+            message["content"] = _text(30, rng)
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages)
+        base = {"model": request.get("model"), "created_at": "1970-01-01T00:00:00Z"}
+        done = {
+            **base,
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int(self.latency * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": len(json.dumps(message).split()),
+        }
+        return [{**base, "message": message, "done": False}, done]
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _send(self, chunks: List[Dict[str, Any]], status: int = 200) -> None:
+                body = b"".join(json.dumps(c).encode() + b"\n" for c in chunks)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                if not server.healthy:
+                    self._send([{"error": "unavailable"}], 503)
+                elif self.path == "/api/tags":
+                    self._send([{"models": [{"name": m} for m in server.models]}])
+                else:
+                    self._send([{"error": "not found"}], 404)
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not server.healthy:
+                    self._send([{"error": "unavailable"}], 503)
+                elif self.path == "/api/generate":
+                    self._send([{"response": "", "done": True, "load_duration": 0}])
+                elif self.path == "/api/chat":
+                    chunks = server._chat(request)
+                    if not request.get("stream", True):
+                        chunks = [{**chunks[-1], "message": chunks[0]["message"]}]
+                    self._send(chunks)
+                else:
+                    self._send([{"error": "not found"}], 404)
+
+        return Handler
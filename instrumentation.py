@@ -0,0 +1,363 @@
+# === instrumentation.py ===
+
+"""Per-question latency and token instrumentation.
+
+Each question gets a QuestionMetrics object in a context variable, so every
+graph node and judge call running for that question (in any asyncio task
+spawned from it) appends its timing and token usage to the same record.
+RunSummary aggregates the records of a whole run into p50/p95/p99 latency
+per stage and tokens/sec, prompt cache hits and prefill time per model.
+"""
+
+from __future__ import annotations
+
+# === Imports ===
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+if TYPE_CHECKING:
+    from langchain_core.outputs import LLMResult
+    from langchain_core.runnables import Runnable
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Constants ===
+PERCENTILES = (50, 95, 99)
+
+
+# === Token counting ===
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """tiktoken encoding used to count tokens, None if it cannot be loaded."""
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        logger.info("tiktoken encoding not available, estimating 4 chars per token")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens of *text* (an estimate without the tiktoken encoding)."""
+    encoding = _encoding()
+    if encoding is None:
+        return -(-len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class QuestionMetrics:
+    """Timing and token usage of all stages of one question."""
+
+    def __init__(self) -> None:
+        self.stages: List[Dict[str, Any]] = []
+        # Judge prompt tokens avoided by stripping the answers' reasoning
+        self.judge_tokens_saved = 0
+        # Tokens, estimated cost and model time of all calls, see budget.py
+        self.spend = {"tokens": 0, "cost_usd": 0.0, "seconds": 0.0}
+        # Why the graph ended after the draft: "no_search" or "budget"
+        self.revise_reason: Optional[str] = None
+        # Set by end_question() once the question is recorded or dropped
+        self.finished = False
+        self._start = time.perf_counter()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total_s": round(time.perf_counter() - self._start, 3),
+            "stages": self.stages,
+            "judge_tokens_saved": self.judge_tokens_saved,
+            "cost_usd": round(self.spend["cost_usd"], 6),
+        }
+
+
+_current: ContextVar[Optional[QuestionMetrics]] = ContextVar(
+    "question_metrics", default=None
+)
+# Entry of the stage currently tracked, code running inside a stage (e.g. a
+# tool) can add its own counters to it
+_stage: ContextVar[Optional[Dict[str, Any]]] = ContextVar("stage_entry", default=None)
+
+
+def start_question() -> QuestionMetrics:
+    """Start collecting metrics for the question of the current task."""
+    metrics = QuestionMetrics()
+    _current.set(metrics)
+    return metrics
+
+
+def resume_question(metrics: QuestionMetrics) -> None:
+    """Continue collecting into *metrics* from another task, e.g. a later phase."""
+    _current.set(metrics)
+
+
+def end_question(metrics: QuestionMetrics) -> None:
+    """Mark the question of *metrics* as done, e.g. its Ollama endpoint is freed."""
+    metrics.finished = True
+
+
+def current_question() -> Optional[QuestionMetrics]:
+    """Metrics of the question of the current task, None outside of one."""
+    return _current.get()
+
+
+def current_stage() -> Optional[Dict[str, Any]]:
+    """Entry of the enclosing track() block, None outside of any stage."""
+    return _stage.get()
+
+
+def add_usage(entry: Dict[str, Any], usage: Optional[Dict[str, Any]]) -> None:
+    """Add the token counts of a usage_metadata dict to a stage entry."""
+    if not usage:
+        return
+    for key in ("input_tokens", "output_tokens"):
+        entry[key] = entry.get(key, 0) + int(usage.get(key, 0) or 0)
+    # Prompt tokens served from the backend's prompt cache (OpenAI)
+    cached = (usage.get("input_token_details") or {}).get("cache_read")
+    if cached:
+        entry["cached_input_tokens"] = entry.get("cached_input_tokens", 0) + cached
+
+
+def add_message_stats(entry: Dict[str, Any], message: Any) -> None:
+    """Add the token usage and prefill time of an AI message to a stage entry."""
+    add_usage(entry, getattr(message, "usage_metadata", None))
+    # Ollama reports the prompt evaluation (prefill) time in nanoseconds
+    metadata = getattr(message, "response_metadata", None) or {}
+    if metadata.get("prompt_eval_duration"):
+        entry["prefill_s"] = round(
+            entry.get("prefill_s", 0.0) + metadata["prompt_eval_duration"] / 1e9, 4
+        )
+
+
+@contextmanager
+def track(stage: str, model: str) -> Iterator[Dict[str, Any]]:
+    """Time the enclosed block as one call of *stage* and yield its entry.
+
+    Outside of a question (no active metrics) the entry is simply discarded.
+    """
+    entry: Dict[str, Any] = {"stage": stage, "model": model}
+    token = _stage.set(entry)
+    start = time.perf_counter()
+    try:
+        yield entry
+    except BaseException as exc:
+        # A failed, timed out or cancelled (hedged) attempt
+        entry["error"] = type(exc).__name__
+        raise
+    finally:
+        _stage.reset(token)
+        entry["seconds"] = round(time.perf_counter() - start, 4)
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.stages.append(entry)
+
+
+class UsageCallback(BaseCallbackHandler):
+    """Collects the token usage of every LLM call into a stage entry."""
+
+    def __init__(self, entry: Dict[str, Any]) -> None:
+        self.entry = entry
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                add_message_stats(self.entry, getattr(generation, "message", None))
+
+
+def instrument(runnable: Runnable, stage: str, model: str) -> Runnable:
+    """Wrap a graph node so that each call is tracked as *stage*."""
+    from langchain_core.runnables import RunnableLambda
+
+    def _invoke(value: Any, config: Any = None) -> Any:
+        with track(stage, model) as entry:
+            output = runnable.invoke(value, config)
+            add_message_stats(entry, output)
+        return output
+
+    async def _ainvoke(value: Any, config: Any = None) -> Any:
+        with track(stage, model) as entry:
+            output = await runnable.ainvoke(value, config)
+            add_message_stats(entry, output)
+        return output
+
+    return RunnableLambda(_invoke, afunc=_ainvoke, name=runnable.get_name())
+
+
+# === Run summary ===
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Linear-interpolated percentile of an already sorted list."""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (
+        rank - low
+    )
+
+
+class RunSummary:
+    """Aggregates the metrics of all questions of a run."""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {}
+        self.models: Dict[str, Dict[str, float]] = {}
+        self.search = {"calls": 0, "raw_tokens": 0, "tokens": 0}
+        # Per "stage/thinking mode", e.g. "draft/off" or "revise/512"
+        self.thinking: Dict[str, Dict[str, float]] = {}
+        self.judge_tokens_saved = 0
+        self.questions = 0
+
+    def observe(self, metrics: Optional[Dict[str, Any]]) -> None:
+        """Add the metrics dict stored with one result record."""
+        if not metrics:
+            return
+        self.questions += 1
+        self.latencies.setdefault("question", []).append(metrics["total_s"])
+        self.judge_tokens_saved += metrics.get("judge_tokens_saved", 0)
+        for entry in metrics["stages"]:
+            self.latencies.setdefault(entry["stage"], []).append(entry["seconds"])
+            model = self.models.setdefault(
+                entry["model"],
+                {
+                    "calls": 0,
+                    "seconds": 0.0,
+                    "input_tokens": 0,
+                    "cached_input_tokens": 0,
+                    "output_tokens": 0,
+                    "prefill_s": 0.0,
+                },
+            )
+            model["calls"] += 1
+            model["seconds"] += entry["seconds"]
+            for key in ("input_tokens", "cached_input_tokens", "output_tokens"):
+                model[key] += entry.get(key, 0)
+            model["prefill_s"] += entry.get("prefill_s", 0.0)
+            if "think" in entry:
+                mode = self.thinking.setdefault(
+                    f"{entry['stage']}/{entry['think']}",
+                    {"calls": 0, "seconds": 0.0, "reasoning_tokens": 0, "capped": 0},
+                )
+                mode["calls"] += 1
+                mode["seconds"] += entry["seconds"]
+                mode["reasoning_tokens"] += entry.get("reasoning_tokens", 0)
+                mode["capped"] += entry.get("think_capped", False)
+            if "result_tokens_raw" in entry:
+                self.search["calls"] += 1
+                self.search["raw_tokens"] += entry["result_tokens_raw"]
+                self.search["tokens"] += entry["result_tokens"]
+
+    def summary(self) -> Dict[str, Any]:
+        """p50/p95/p99 latency per stage and tokens/sec per model."""
+        stages = {}
+        for stage, values in self.latencies.items():
+            ordered = sorted(values)
+            stages[stage] = {
+                "n": len(ordered),
+                **{f"p{p}_s": round(percentile(ordered, p), 3) for p in PERCENTILES},
+            }
+        models = {}
+        for name, totals in self.models.items():
+            models[name] = {
+                **totals,
+                "seconds": round(totals["seconds"], 3),
+                "prefill_s": round(totals["prefill_s"], 3),
+                "cache_hit_rate": (
+                    round(totals["cached_input_tokens"] / totals["input_tokens"], 3)
+                    if totals["input_tokens"]
+                    else 0.0
+                ),
+                "output_tokens_per_s": (
+                    round(totals["output_tokens"] / totals["seconds"], 2)
+                    if totals["seconds"]
+                    else 0.0
+                ),
+            }
+        search = {
+            **self.search,
+            "reduction": (
+                round(1 - self.search["tokens"] / self.search["raw_tokens"], 3)
+                if self.search["raw_tokens"]
+                else 0.0
+            ),
+        }
+        thinking = {
+            name: {
+                "calls": totals["calls"],
+                "mean_s": round(totals["seconds"] / totals["calls"], 3),
+                "mean_reasoning_tokens": round(
+                    totals["reasoning_tokens"] / totals["calls"], 1
+                ),
+                "capped": totals["capped"],
+            }
+            for name, totals in self.thinking.items()
+        }
+        return {
+            "questions": self.questions,
+            "stages": stages,
+            "models": models,
+            "search_results": search,
+            "thinking": thinking,
+            "judge_tokens_saved": self.judge_tokens_saved,
+        }
+
+    def log(self) -> None:
+        """Write the summary to the log as two small tables."""
+        summary = self.summary()
+        logger.info("=== Latency per stage (%s questions) ===", summary["questions"])
+        for stage, row in summary["stages"].items():
+            logger.info(
+                "%-14s n=%-4s p50=%7.2fs p95=%7.2fs p99=%7.2fs",
+                stage,
+                row["n"],
+                row["p50_s"],
+                row["p95_s"],
+                row["p99_s"],
+            )
+        logger.info("=== Tokens per model ===")
+        for name, row in summary["models"].items():
+            logger.info(
+                "%-14s calls=%-5s in=%-8s cached=%-8s out=%-8s "
+                "prefill=%.1fs %.1f tok/s",
+                name,
+                row["calls"],
+                row["input_tokens"],
+                row["cached_input_tokens"],
+                row["output_tokens"],
+                row["prefill_s"],
+                row["output_tokens_per_s"],
+            )
+        for name, row in summary["thinking"].items():
+            logger.info(
+                "Thinking %-14s calls=%-5s mean=%.2fs reasoning=%.0f tok capped=%s",
+                name,
+                row["calls"],
+                row["mean_s"],
+                row["mean_reasoning_tokens"],
+                row["capped"],
+            )
+        if summary["judge_tokens_saved"]:
+            logger.info(
+                "Judge prompt tokens saved by stripping reasoning: %s",
+                summary["judge_tokens_saved"],
+            )
+        search = summary["search_results"]
+        if search["calls"]:
+            logger.info(
+                "Search results: %s tokens → %s tokens after compression "
+                "(-%.0f%%, %s tool calls)",
+                search["raw_tokens"],
+                search["tokens"],
+                100 * search["reduction"],
+                search["calls"],
+            )
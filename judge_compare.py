@@ -0,0 +1,291 @@
+# === judge_compare.py ===
+
+"""
+Comparison harness for the judge modes and judge backends.
+
+Re-grades stored results with the single-call ("combined") judge and reports
+how far its verdicts diverge from the per-criterion LangChain evaluators.
+By default the stored evaluations in results.json are used as reference,
+with --rerun both judge modes are run again on the same answers.
+
+With --judges the answers are graded by every given judge (e.g. the hosted
+OpenAI judge and a local Ollama judge), each with --parallel concurrent
+judge calls across all questions, and the throughput is reported side by
+side. The judge cache is bypassed so that every call is measured.
+
+Run: python judge_compare.py --results results/results.json --limit 10
+     python judge_compare.py --judges openai ollama/qwen3:8b --parallel 8
+"""
+
+# === Imports ===
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from concurrency import configure_limits
+from evaluator import (
+    CRITERIA,
+    DEFAULT_JUDGE_MODELS,
+    JUDGE_BACKENDS,
+    JUDGE_MODES,
+    aevaluate,
+    configure_judge_backend,
+    configure_judge_cache,
+)
+from instrumentation import RunSummary, start_question
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Helpers ===
+
+
+def _score(entry: Any) -> Optional[int]:
+    """Return the 0/1 score of an evaluator entry, None if it failed."""
+    if isinstance(entry, dict) and entry.get("score") in (0, 1):
+        return int(entry["score"])
+    return None
+
+
+def compare_evaluations(
+    reference: List[Dict[str, Any]], candidate: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Compare two lists of evaluation dicts for the same answers.
+    Returns per-key agreement, mean absolute score difference and
+    pair-wise winner agreement.
+    """
+    keys = [f"{name}_{role}" for name in CRITERIA for role in ("responder", "revisor")]
+    report: Dict[str, Any] = {"criteria": {}}
+
+    for key in keys:
+        pairs = [
+            (_score(ref.get(key)), _score(cand.get(key)))
+            for ref, cand in zip(reference, candidate)
+        ]
+        valid = [(a, b) for a, b in pairs if a is not None and b is not None]
+        report["criteria"][key] = {
+            "n": len(valid),
+            "agreement": (
+                sum(a == b for a, b in valid) / len(valid) if valid else None
+            ),
+            "mean_abs_diff": (
+                sum(abs(a - b) for a, b in valid) / len(valid) if valid else None
+            ),
+        }
+
+    winners = [
+        (ref.get("pairwise_winner"), cand.get("pairwise_winner"))
+        for ref, cand in zip(reference, candidate)
+        if "Invalid" not in (ref.get("pairwise_winner"), cand.get("pairwise_winner"))
+    ]
+    report["pairwise"] = {
+        "n": len(winners),
+        "agreement": (
+            sum(a == b for a, b in winners) / len(winners) if winners else None
+        ),
+    }
+    return report
+
+
+async def _run_mode(
+    records: List[Dict[str, Any]], mode: str, summary: Optional[RunSummary] = None
+) -> List[Dict[str, Any]]:
+    """Grade all stored answers with one judge mode, concurrently.
+
+    The judge calls of all questions share the "judge" concurrency limit; their
+    latency and token usage are added to *summary*.
+    """
+
+    async def _grade(record: Dict[str, Any]) -> Dict[str, Any]:
+        metrics = start_question()
+        evaluation = await aevaluate(
+            record["question"],
+            record["responder_answer"],
+            record["revisor_answer"],
+            mode=mode,
+        )
+        if summary is not None:
+            summary.observe(metrics.to_dict())
+        return evaluation
+
+    return await asyncio.gather(*(_grade(r) for r in records))
+
+
+def parse_judge(spec: str) -> Tuple[str, str]:
+    """Return (backend, model) of a --judges spec like ollama/qwen3:8b."""
+    backend, _, model = spec.partition("/")
+    if backend not in JUDGE_BACKENDS:
+        raise ValueError(f"Unknown judge backend in '{spec}'")
+    return backend, model or DEFAULT_JUDGE_MODELS[backend]
+
+
+def throughput(summary: RunSummary, seconds: float) -> Dict[str, Any]:
+    """Questions and judge calls per wall-clock second of one judge run."""
+    stats = summary.summary()
+    judge = stats["stages"].get("judge", {})
+    calls = judge.get("n", 0)
+    output_tokens = sum(m["output_tokens"] for m in stats["models"].values())
+    return {
+        "questions": summary.questions,
+        "calls": calls,
+        "seconds": round(seconds, 2),
+        "questions_per_s": round(summary.questions / seconds, 3) if seconds else 0.0,
+        "calls_per_s": round(calls / seconds, 2) if seconds else 0.0,
+        "p50_call_s": judge.get("p50_s"),
+        "p95_call_s": judge.get("p95_s"),
+        "output_tokens_per_s": round(output_tokens / seconds, 1) if seconds else 0.0,
+    }
+
+
+def _compare_judges(
+    records: List[Dict[str, Any]], judges: List[str], mode: str, parallel: int
+) -> Dict[str, Any]:
+    """Grade *records* with every judge, see module docstring."""
+    from ollama_manager import prepare_ollama
+
+    configure_judge_cache(enabled=False)
+    configure_limits(judge=parallel)
+    local = [
+        model for backend, model in map(parse_judge, judges) if backend == "ollama"
+    ]
+    if local:
+        prepare_ollama(local, num_parallel=parallel)
+
+    report: Dict[str, Any] = {"mode": mode, "parallel": parallel, "judges": {}}
+    reference: Optional[List[Dict[str, Any]]] = None
+    for spec in judges:
+        backend, model = parse_judge(spec)
+        configure_judge_backend(backend, model)
+        summary = RunSummary()
+        start = time.perf_counter()
+        evaluations = asyncio.run(_run_mode(records, mode, summary))
+        row = throughput(summary, time.perf_counter() - start)
+        # Verdicts are compared with the first judge
+        if reference is None:
+            reference = evaluations
+        else:
+            row["agreement"] = compare_evaluations(reference, evaluations)
+        report["judges"][f"{backend}/{model}"] = row
+    return report
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "  n/a" if value is None else f"{value:5.2f}"
+
+
+# === CLI ===
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--results", default="results/results.json")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument(
+        "--rerun",
+        action="store_true",
+        help="Re-run the per-criterion judge instead of using stored evaluations.",
+    )
+    parser.add_argument(
+        "--judges",
+        nargs="+",
+        default=None,
+        metavar="BACKEND[/MODEL]",
+        help="Grade with these judges instead and compare their throughput, "
+        "e.g. openai ollama/qwen3:8b.",
+    )
+    parser.add_argument(
+        "--judge-mode",
+        choices=JUDGE_MODES,
+        default="criteria",
+        help="Judge mode used with --judges.",
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=8,
+        help="Concurrent judge calls with --judges (OLLAMA_NUM_PARALLEL of a "
+        "newly started Ollama server).",
+    )
+    parser.add_argument("--output", default=None, help="Write the report as JSON.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    records = json.loads(Path(args.results).read_text(encoding="utf-8"))
+    records = records[: args.limit]
+
+    if args.judges:
+        try:
+            report = _compare_judges(
+                records, args.judges, args.judge_mode, args.parallel
+            )
+        except ValueError as exc:
+            parser.error(str(exc))
+        print(
+            f"Graded {len(records)} answer pairs ({args.judge_mode} judge, "
+            f"{args.parallel} parallel calls)"
+        )
+        print(
+            f"{'judge':<28} {'q/s':>6} {'calls/s':>8} {'p50 s':>6} {'p95 s':>6} "
+            f"{'out tok/s':>9} {'winner agree':>12}"
+        )
+        for name, row in report["judges"].items():
+            # The first judge is the reference of the winner agreement
+            agreement = (
+                _fmt(row["agreement"]["pairwise"]["agreement"])
+                if "agreement" in row
+                else "ref."
+            )
+            print(
+                f"{name:<28} {row['questions_per_s']:>6.2f} {row['calls_per_s']:>8.2f} "
+                f"{row['p50_call_s'] or 0:>6.2f} {row['p95_call_s'] or 0:>6.2f} "
+                f"{row['output_tokens_per_s']:>9.1f} "
+                f"{agreement:>12}"
+            )
+        if args.output:
+            Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        return
+
+    timings: Dict[str, float] = {}
+    if args.rerun:
+        start = time.perf_counter()
+        reference = asyncio.run(_run_mode(records, "criteria"))
+        timings["criteria"] = time.perf_counter() - start
+    else:
+        reference = [r["evaluation"] for r in records]
+
+    start = time.perf_counter()
+    candidate = asyncio.run(_run_mode(records, "combined"))
+    timings["combined"] = time.perf_counter() - start
+
+    report = compare_evaluations(reference, candidate)
+    report["questions"] = len(records)
+    report["seconds"] = timings
+
+    print(f"Compared {len(records)} answer pairs (criteria vs. combined judge)")
+    print(f"{'key':<26} {'n':>4} {'agree':>6} {'|diff|':>7}")
+    for key, row in report["criteria"].items():
+        print(
+            f"{key:<26} {row['n']:>4} {_fmt(row['agreement']):>6} "
+            f"{_fmt(row['mean_abs_diff']):>7}"
+        )
+    print(
+        f"{'pairwise_winner':<26} {report['pairwise']['n']:>4} "
+        f"{_fmt(report['pairwise']['agreement']):>6}"
+    )
+    for mode, seconds in timings.items():
+        print(f"{mode} judge: {seconds:.1f}s")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
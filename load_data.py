@@ -5,27 +5,98 @@
 # === Imports ===
 from __future__ import annotations
 
-import datetime as _dt
+import hashlib
 import json
 import logging
 import random
+from collections import defaultdict
 from pathlib import Path
-from typing import Dict, Final, List
-
-from datasets import load_dataset
+from typing import Dict, Final, List, Sequence, Tuple
 
 # === Logging ===
 logger = logging.getLogger(__name__)
 
+# === Constants ===
+DEFAULT_SEED: Final[int] = 42
+DEFAULT_FIELDS: Final = ("id", "question", "answer", "type", "level")
+SUBSET_DIR: Final[Path] = Path("data/subsets")
+
+
+def _subset_path(
+    num_samples: int, seed: int, stratify: Sequence[str], fields: Sequence[str]
+) -> Path:
+    """Location of the cached subset for one sampling configuration."""
+    strat = "-".join(stratify) or "none"
+    fields_hash = hashlib.sha256(",".join(fields).encode()).hexdigest()[:8]
+    name = f"hotpotqa_n{num_samples}_seed{seed}_strat-{strat}_{fields_hash}.json"
+    return SUBSET_DIR / name
 
-def get_hotpotqa_subset(num_samples: int = 3) -> List[Dict]:
+
+def _sample_indices(
+    dataset, num_samples: int, rng: random.Random, stratify: Sequence[str]
+) -> List[int]:
+    """
+    Draw row indices without touching any column except the strata.
+    With *stratify*, every (type, level, …) group gets a share proportional
+    to its size (largest remainder), otherwise indices are drawn uniformly.
     """
-    Loads a random subset of the HotpotQA validation dataset.
-    Args: num_samples (int): Number of questions to sample.
+    if not stratify:
+        return rng.sample(range(len(dataset)), num_samples)
+
+    # Only the stratification columns are read from the Arrow table
+    columns = [dataset[column] for column in stratify]
+    groups: Dict[Tuple, List[int]] = defaultdict(list)
+    for idx, key in enumerate(zip(*columns)):
+        groups[key].append(idx)
+
+    total = len(dataset)
+    quotas = {key: num_samples * len(rows) / total for key, rows in groups.items()}
+    counts = {key: int(quota) for key, quota in quotas.items()}
+    remainder = num_samples - sum(counts.values())
+    by_fraction = sorted(quotas, key=lambda k: quotas[k] - counts[k], reverse=True)
+    for key in by_fraction[:remainder]:
+        counts[key] += 1
+
+    indices = [
+        idx
+        for key in sorted(groups)
+        for idx in rng.sample(groups[key], min(counts[key], len(groups[key])))
+    ]
+    rng.shuffle(indices)
+    return indices
+
+
+def get_hotpotqa_subset(
+    num_samples: int = 3,
+    seed: int = DEFAULT_SEED,
+    stratify: Sequence[str] = (),
+    fields: Sequence[str] = DEFAULT_FIELDS,
+    use_cache: bool = True,
+) -> List[Dict]:
+    """
+    Loads a seeded random subset of the HotpotQA validation dataset.
+    Rows are picked by index on the Arrow-backed dataset and only *fields*
+    are materialised, the large context paragraphs stay on disk.
+    Subsets are cached in data/subsets/ per (seed, n, stratify, fields).
+    Args:
+        num_samples (int): Number of questions to sample.
+        seed (int): Seed of the sampler, same seed gives the same subset.
+        stratify (list[str]): Columns to stratify by, e.g. ["type", "level"].
+        fields (list[str]): Columns to keep in the returned records.
+        use_cache (bool): Reuse / store the subset in data/subsets/.
     Returns: list: Random sample of HotpotQA questions.
     """
+    stratify = tuple(stratify)
+    fields = tuple(fields)
+    path = _subset_path(num_samples, seed, stratify, fields)
+    if use_cache and path.exists():
+        logger.info("Loading cached HotpotQA subset from %s", path)
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    # Load distractor version of HotpotQA (datasets is slow to import,
+    # a cached subset never needs it)
+    from datasets import load_dataset
 
-    # Load distractor version of HotpotQA
     logger.info("Getting HotpotQA validation data.")
     dataset = load_dataset(
         "hotpot_qa",
@@ -34,16 +105,21 @@ def get_hotpotqa_subset(num_samples: int = 3) -> List[Dict]:
         trust_remote_code=True,  # distractor needs custom loading script
     )
 
-    # Sample number of examples
-    subset = random.sample(list(dataset), num_samples)
-    logger.info("Sampled %s questions from HotpotQA", num_samples)
+    # Sample row indices, then materialise only the selected rows and fields
+    rng = random.Random(seed)
+    indices = _sample_indices(dataset, num_samples, rng, stratify)
+    subset = dataset.select(indices).select_columns(list(fields)).to_list()
+    logger.info(
+        "Sampled %s questions from HotpotQA (seed=%s, stratify=%s)",
+        len(subset),
+        seed,
+        list(stratify) or None,
+    )
 
-    # Generate filename with timestamp
-    timestamp: Final[str] = _dt.datetime.now().strftime("%Y%m%d_%H%M%S")
-    path = Path("data") / f"hotpotqa_subset_{timestamp}.json"
-    path.parent.mkdir(exist_ok=True)
-    path.write_text(json.dumps(subset, indent=2), encoding="utf-8")
-    logger.info("Saved HotpotQA subset to %s", path)
+    if use_cache:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(subset, indent=2), encoding="utf-8")
+        logger.info("Saved HotpotQA subset to %s", path)
 
     return subset
 
@@ -55,3 +131,20 @@ def load_custom_questions(path: str | Path) -> List[Dict]:
         data = json.load(f)
     logger.info("Loaded %s custom questions", len(data))
     return data
+
+
+def shard_examples(
+    examples: List[Dict], shard_index: int = 0, num_shards: int = 1
+) -> List[Dict]:
+    """
+    Deterministic round-robin share of one shard: question i goes to shard
+    i % num_shards. Every returned example carries its question_index in
+    the full list, so the shard results can be merged back in order.
+    """
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"Shard index {shard_index} not in [0, {num_shards})")
+    return [
+        {**ex, "question_index": idx}
+        for idx, ex in enumerate(examples)
+        if idx % num_shards == shard_index
+    ]
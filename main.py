@@ -17,230 +17,735 @@ Workflow:
 To process your own questions:
 1. Define your questions in my_questions.json.
 2. Run: python main.py --questions data/my_questions.json
+
+Backends, evaluators and the dataset are only loaded once the CLI has been
+parsed and only for the selected model pairs, so --help and OpenAI-only runs
+start quickly.
 """
 
 # === Imports ===
+import time
+
+_T0 = time.perf_counter()  # start of the imports, see the startup report
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import logging  # noqa: E402
+from contextlib import ExitStack  # noqa: E402
+from datetime import datetime  # noqa: E402
+from pathlib import Path  # noqa: E402
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple  # noqa: E402
+
+from budget import configure_budget, log_summary, parse_budget  # noqa: E402
+from budget import summary as spend_summary  # noqa: E402
+from cassette import (  # noqa: E402
+    CASSETTE_MODES,
+    CASSETTE_PATH,
+    ReplayModel,
+    configure_cassette,
+)
+from chains import (  # noqa: E402
+    DEFAULT_TIME_GRANULARITY,
+    TIME_FORMATS,
+    configure_time_granularity,
+    parse_think_mode,
+)
+from concurrency import (  # noqa: E402
+    DEFAULT_LIMITS,
+    DEFAULT_MAX_CONCURRENCY,
+    configure_limits,
+)
+from evaluator import (  # noqa: E402
+    DEFAULT_JUDGE_MODELS,
+    JUDGE_BACKENDS,
+    JUDGE_CACHE_MAX_ENTRIES,
+    JUDGE_CACHE_PATH,
+    JUDGE_MODES,
+    configure_judge,
+    configure_judge_backend,
+    configure_judge_cache,
+    get_judge_cache,
+)
+from load_data import (  # noqa: E402
+    DEFAULT_SEED,
+    get_hotpotqa_subset,
+    load_custom_questions,
+    shard_examples,
+)
 
-import argparse
-import json
-import logging
-from datetime import datetime
-from pathlib import Path
-from typing import List, cast
-
-from langchain_core.messages import BaseMessage, HumanMessage
-from langchain_ollama import ChatOllama
-from langchain_openai import ChatOpenAI
-from langgraph.graph import END, MessageGraph
-from langsmith import traceable
+# Local utility modules
+from ollama_manager import (  # noqa: E402
+    DEFAULT_KEEP_ALIVE,
+    OLLAMA_HOST,
+    local_hosts,
+    prepare_ollama,
+)
+from resilience import (  # noqa: E402
+    DEFAULT_MAX_ATTEMPTS,
+    DEFAULT_TIMEOUTS,
+    HEDGE_BACKENDS,
+    configure_resilience,
+    parse_backend_values,
+)
+from resilience import log_summary as log_call_summary  # noqa: E402
+from resilience import summary as call_summary  # noqa: E402
+from results_store import (  # noqa: E402
+    RESULTS_JSON,
+    RESULTS_JSONL,
+    JsonlResultWriter,
+    RecordKey,
+    completed_keys,
+    export_json,
+    iter_records,
+    load_pending,
+    pending_path,
+    shard_path,
+    write_manifest,
+)
+from tool_executor import (  # noqa: E402
+    SEARCH_CACHE_TTL,
+    SEARCH_TOKEN_BUDGET,
+    configure_compression,
+    configure_search_cache,
+    get_search_cache,
+)
 
-from chains import build_responder, build_revisor
-from evaluator import evaluate_pairwise
-from load_data import get_hotpotqa_subset, load_custom_questions
+if TYPE_CHECKING:
+    from scheduler import ModelSpec
 
-# Local utility modules
-from ollama_manager import prepare_ollama
-from tool_executor import execute_tools
+# The pipeline (LangGraph, LangSmith, LangChain chains) is imported in main()
+# once the CLI has been parsed
+IMPORT_S = time.perf_counter() - _T0
 
 # === Logging ===
-log_dir = Path("logs")
-log_dir.mkdir(exist_ok=True)
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-log_file = log_dir / f"run_{timestamp}.log"
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(log_file, encoding="utf-8"),
-    ],
-    force=True,
-)
 logger = logging.getLogger(__name__)
 
+
+def setup_logging() -> None:
+    """Log to the console and to logs/run_<timestamp>.log."""
+    log_dir = Path("logs")
+    log_dir.mkdir(exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    log_file = log_dir / f"run_{timestamp}.log"
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        handlers=[
+            logging.StreamHandler(),
+            logging.FileHandler(log_file, encoding="utf-8"),
+        ],
+        force=True,
+    )
+
+
 # === Constants ===
 
+RUN_SUMMARY_JSON = Path("results/run_summary.json")
 NUM_QUESTIONS = 10
 MAX_MESSAGES = 3
 
 OLLAMA_MODEL_NAME = "qwen3:32b"
 OPENAI_MODEL_NAME = "gpt-4.1"
 
-# === Start Ollama ===
-
-prepare_ollama(model=OLLAMA_MODEL_NAME)
-
-# === Define model configurations ===
-
-model_configs = {
-    "ollama": ChatOllama(model=OLLAMA_MODEL_NAME),
-    "openai": ChatOpenAI(model=OPENAI_MODEL_NAME),
+# Shortcuts for --pairs, any other model is given as backend/name
+MODEL_SHORTCUTS = {
+    "ollama": ("ollama", OLLAMA_MODEL_NAME),
+    "openai": ("openai", OPENAI_MODEL_NAME),
 }
-
-# === Define model names for result recording ===
-
-model_names = {"ollama": OLLAMA_MODEL_NAME, "openai": OPENAI_MODEL_NAME}
+DEFAULT_PAIRS = ["ollama,ollama", "openai,openai"]
 
 # === CLI ===
 
-parser = argparse.ArgumentParser()
-parser.add_argument(
-    "--questions",
-    help="Path to my_questions.json file.",
-    default=None,
-)
-cli_args = parser.parse_args()
 
-# === Load Dataset ===
-
-if cli_args.questions:
-    examples = load_custom_questions(cli_args.questions)
-    NUM_QUESTIONS = len(examples)
-else:
-    examples = get_hotpotqa_subset(num_samples=NUM_QUESTIONS)
-
-logger.info("Loaded %s questions", NUM_QUESTIONS)
-
-# === Results Placeholder ===
-
-results = []
-
-# === Extract Final Answer ===
-
-
-def extract_answer(step):
-    return (
-        step.tool_calls[0]["args"]["answer"]
-        if step.tool_calls
-        else step.content if isinstance(step.content, str) else "(No answer found)"
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--questions",
+        help="Path to my_questions.json file.",
+        default=None,
     )
-
-
-# === Evaluation ===
-
-
-@traceable(name="HotpotQA Evaluation")
-def evaluate_question(
-    question,
-    responder_answer,
-    revisor_answer,
-):
-    # Pairwise evaluation function
-    return evaluate_pairwise(
-        question=question,
-        responder=responder_answer,
-        revisor=revisor_answer,
+    parser.add_argument(
+        "--num-questions",
+        type=int,
+        default=NUM_QUESTIONS,
+        help="Number of HotpotQA questions to sample.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=DEFAULT_SEED,
+        help="Seed of the HotpotQA sampler, the same seed gives the same questions.",
+    )
+    parser.add_argument(
+        "--stratify",
+        nargs="*",
+        choices=["type", "level"],
+        default=[],
+        help="Sample HotpotQA proportionally per question type and/or level.",
+    )
+    parser.add_argument(
+        "--pairs",
+        nargs="+",
+        default=DEFAULT_PAIRS,
+        metavar="RESPONDER,REVISOR",
+        help="Model pairs to compare. A model is 'ollama', 'openai' or backend/name, "
+        "e.g. ollama/llama3.1:8b,openai.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the previous run, skipping questions already stored in "
+        "results/results.jsonl.",
+    )
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        default=0,
+        help="Shard handled by this process: questions i with "
+        "i %% num-shards == index.",
+    )
+    parser.add_argument(
+        "--num-shards",
+        type=int,
+        default=1,
+        help="Number of processes/machines sharing the run, merge the shard files "
+        "afterwards with merge_results.py.",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=DEFAULT_MAX_CONCURRENCY,
+        help="Number of questions processed concurrently per model pair.",
+    )
+    parser.add_argument(
+        "--always-revise",
+        action="store_true",
+        help="Run the revisor even when the draft requests no search.",
+    )
+    parser.add_argument(
+        "--judge-mode",
+        choices=JUDGE_MODES,
+        default="criteria",
+        help="criteria: one LangChain evaluator call per criterion and answer; "
+        "combined: all criteria and the pair-wise winner in one call.",
+    )
+    parser.add_argument(
+        "--judge-gate",
+        action="store_true",
+        help="Call the LLM judge only when exact match, F1 and containment "
+        "against the gold answer are inconclusive.",
+    )
+    parser.add_argument(
+        "--run-budget",
+        type=parse_budget,
+        default={},
+        metavar="KEY=VALUE,...",
+        help="Stop starting new questions once the run has spent e.g. "
+        "cost_usd=5,tokens=2e6,seconds=3600 (seconds: summed model time); "
+        "questions in flight are finished and saved.",
+    )
+    parser.add_argument(
+        "--question-budget",
+        type=parse_budget,
+        default={},
+        metavar="KEY=VALUE,...",
+        help="End a question's graph early (skip the revision) once it has "
+        "spent e.g. tokens=20000.",
+    )
+    parser.add_argument(
+        "--judge-backend",
+        choices=JUDGE_BACKENDS,
+        default="openai",
+        help="openai: hosted judge; ollama: local judge, run as one batch after "
+        "all local models, with --judge-limit parallel requests. Revised "
+        "questions wait for it in results/results.pending.jsonl, --resume "
+        "judges them without drafting them again.",
     )
+    parser.add_argument(
+        "--judge-model",
+        default=None,
+        help="Judge model (default: "
+        + ", ".join(f"{b}: {m}" for b, m in DEFAULT_JUDGE_MODELS.items())
+        + ").",
+    )
+    parser.add_argument(
+        "--judge-cache",
+        default=str(JUDGE_CACHE_PATH),
+        help="SQLite file caching judge results across runs.",
+    )
+    parser.add_argument(
+        "--judge-cache-max-entries",
+        type=int,
+        default=JUDGE_CACHE_MAX_ENTRIES,
+        help="Least recently used judge results beyond this size are evicted.",
+    )
+    parser.add_argument(
+        "--no-judge-cache",
+        action="store_true",
+        help="Bypass the judge cache and always call the judge LLM.",
+    )
+    parser.add_argument(
+        "--search-cache-ttl",
+        type=float,
+        default=SEARCH_CACHE_TTL,
+        help="Seconds a cached Tavily result stays valid.",
+    )
+    parser.add_argument(
+        "--no-search-cache",
+        action="store_true",
+        help="Bypass the search cache and always call Tavily.",
+    )
+    parser.add_argument(
+        "--search-token-budget",
+        type=int,
+        default=SEARCH_TOKEN_BUDGET,
+        help="Tokens of deduplicated, ranked search results passed to the "
+        "revisor per tool call, 0 passes the raw Tavily results.",
+    )
+    parser.add_argument(
+        "--cassette-mode",
+        choices=CASSETTE_MODES,
+        default="off",
+        help="record: store every responder/revisor/search response; "
+        "replay: serve them from the cassette and the judge results from the "
+        "judge cache, without creating or contacting any backend.",
+    )
+    parser.add_argument(
+        "--cassette",
+        default=str(CASSETTE_PATH),
+        help="SQLite file holding the recorded responses.",
+    )
+    parser.add_argument(
+        "--time-granularity",
+        choices=list(TIME_FORMATS),
+        default=DEFAULT_TIME_GRANULARITY,
+        help="Precision of the current time in the prompt, coarser keeps the prompt "
+        "prefix cacheable for longer.",
+    )
+    for stage in ("draft", "revise"):
+        parser.add_argument(
+            f"--think-{stage}",
+            type=parse_think_mode,
+            default="on",
+            metavar="{on,off,N}",
+            help=f"Thinking mode of the {stage} stage on Ollama models (qwen3): "
+            "on, off (/no_think) or capped at N reasoning tokens.",
+        )
+    parser.add_argument(
+        "--keep-alive",
+        default=DEFAULT_KEEP_ALIVE,
+        help="How long Ollama keeps a model loaded after a request, e.g. 30m or -1m.",
+    )
+    parser.add_argument(
+        "--ollama-hosts",
+        nargs="+",
+        default=None,
+        metavar="URL",
+        help="Ollama endpoints to balance requests over, e.g. "
+        "http://gpu1:11434 http://gpu2:11434 (default: OLLAMA_HOST).",
+    )
+    parser.add_argument(
+        "--ollama-instances",
+        type=int,
+        default=1,
+        help=f"Start this many local Ollama servers on consecutive ports from "
+        f"{OLLAMA_HOST} and balance requests over them.",
+    )
+    parser.add_argument(
+        "--num-ctx",
+        type=int,
+        default=None,
+        help="Context window of the Ollama models (default: Ollama's setting).",
+    )
+    parser.add_argument(
+        "--timeouts",
+        type=parse_backend_values,
+        default={},
+        metavar="BACKEND=S,...",
+        help="Per-attempt timeouts in seconds (default: "
+        + ",".join(f"{b}={t:g}" for b, t in DEFAULT_TIMEOUTS.items())
+        + ").",
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=DEFAULT_MAX_ATTEMPTS,
+        help="Attempts per LLM, judge or Tavily call; transient errors are "
+        "retried with jittered backoff or after the rate-limit reset.",
+    )
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        default=None,
+        help="Send a duplicate request when a cloud call (openai, judge, tavily) "
+        "runs longer than this latency percentile, e.g. 95.",
+    )
+    for backend, limit in DEFAULT_LIMITS.items():
+        parser.add_argument(
+            f"--{backend}-limit",
+            type=int,
+            default=limit,
+            help=f"Max. concurrent requests to the {backend} backend.",
+        )
+    return parser
 
 
 # === Compare responder/revisor model pairs ===
 
-model_pairs = [
-    ("ollama", "ollama"),
-    ("openai", "openai"),
-]
-
-# === Main Loop ===
-
-for responder_model_name, revisor_model_name in model_pairs:
-    logger.info(
-        "=== Running: Responder=%s, Revisor=%s ===",
-        responder_model_name,
-        revisor_model_name,
-    )
-
-    # Load LLMs
-    responder_llm = model_configs[responder_model_name]
-    revisor_llm = model_configs[revisor_model_name]
 
-    # Model name for results metadata
-    responder_model_actual = model_names[responder_model_name]
-    revisor_model_actual = model_names[revisor_model_name]
+def parse_model(spec: str) -> Optional[Tuple[str, str]]:
+    """Return (backend, model name) of a --pairs model spec, None if unknown."""
+    if spec in MODEL_SHORTCUTS:
+        return MODEL_SHORTCUTS[spec]
+    backend, _, name = spec.partition("/")
+    if backend not in MODEL_SHORTCUTS or not name:
+        return None
+    return backend, name
 
-    for idx, ex in enumerate(examples):
-        question = ex["question"]
 
-        # === Build responder and revisor chains ===
-        responder_chain = build_responder(responder_llm)
-        revisor_chain = build_revisor(revisor_llm)
+def build_model(backend: str, name: str, args: argparse.Namespace) -> "ModelSpec":
+    """Create the chat model of one matrix entry, importing only its backend."""
+    from scheduler import ModelSpec
 
-        # === Define LangGraph ===
-        builder = MessageGraph()
+    if args.cassette_mode == "replay":
+        # Every call is served from the cassette, no client is created
+        return ModelSpec(backend, name, ReplayModel(name))
+    if backend == "ollama":
+        from ollama_pool import chat_ollama
 
-        # Nodes / Steps
-        builder.add_node("draft", responder_chain)  # Initial draft generation
-        builder.add_node("execute_tools", execute_tools)  # Execute tools after draft
-        builder.add_node("revise", revisor_chain)  # Final revision step
+        # A pooled model when several Ollama endpoints are configured
+        llm: Any = chat_ollama(
+            model=name, keep_alive=args.keep_alive, num_ctx=args.num_ctx
+        )
+    else:
+        from langchain_openai import ChatOpenAI
 
-        # Edges / Transitions
-        builder.add_edge("draft", "execute_tools")  # From draft to tools
-        builder.add_edge("execute_tools", "revise")  # From tools to revision
+        # Retries are done by resilience.py, not by the client as well
+        llm = ChatOpenAI(model=name, max_retries=0)
+    return ModelSpec(backend, name, llm)
 
-        # Entry point / Start
-        builder.set_entry_point("draft")  # Start from the draft ste
 
-        def event_loop(state: List[BaseMessage]) -> str:
-            # If we have reached the maximum number of steps, stop the graph
-            # Otherwise, go back to execute_tools
-            return END if len(state) >= MAX_MESSAGES else "execute_tools"
+# === Load Dataset ===
 
-        # After revise, use the event_loop function to decide:
-        # - to stop (END)
-        # - loop back to execute_tools
-        builder.add_conditional_edges("revise", event_loop)
 
-        # Compile LangGraph pipeline
-        graph = builder.compile()
+def load_examples(args: argparse.Namespace) -> List[Dict]:
+    if args.questions:
+        return load_custom_questions(args.questions)
+    return get_hotpotqa_subset(
+        num_samples=args.num_questions, seed=args.seed, stratify=args.stratify
+    )
 
-        # === Execute pipeline ===
-        logger.info("QUESTION %s/%s: %s", idx + 1, NUM_QUESTIONS, question)
 
-        try:
-            raw_result = graph.invoke([HumanMessage(content=question)])
+# === Main ===
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = build_parser()
+    cli_args = parser.parse_args(argv)
+    if not 0 <= cli_args.shard_index < cli_args.num_shards:
+        parser.error("--shard-index must be in [0, --num-shards)")
+    if cli_args.ollama_instances < 1:
+        parser.error("--ollama-instances must be >= 1")
+    if cli_args.ollama_hosts and cli_args.ollama_instances > 1:
+        parser.error("--ollama-hosts and --ollama-instances are exclusive")
+    if cli_args.cassette_mode == "replay" and cli_args.no_judge_cache:
+        parser.error("--cassette-mode replay serves the judge from the judge cache")
+
+    model_pairs: List[Tuple[Tuple[str, str], Tuple[str, str]]] = []
+    for pair in cli_args.pairs:
+        responder_spec, _, revisor_spec = pair.partition(",")
+        responder = parse_model(responder_spec)
+        revisor = parse_model(revisor_spec or responder_spec)
+        if responder is None or revisor is None:
+            parser.error(
+                f"Unknown model in pair '{pair}', expected ollama, openai or "
+                "backend/name"
+            )
+        model_pairs.append((responder, revisor))
+
+    setup_logging()
+    startup: Dict[str, float] = {
+        "imports_s": round(IMPORT_S, 3),
+        "cli_s": round(time.perf_counter() - _T0, 3),
+    }
+
+    from instrumentation import RunSummary
+    from scheduler import PairJob, run_matrix
+
+    startup["pipeline_s"] = round(time.perf_counter() - _T0, 3)
+
+    configure_limits(
+        **{backend: getattr(cli_args, f"{backend}_limit") for backend in DEFAULT_LIMITS}
+    )
+    local_judge = cli_args.judge_backend == "ollama"
+    configure_resilience(
+        timeouts=cli_args.timeouts,
+        max_attempts=cli_args.max_attempts,
+        hedge_percentile=cli_args.hedge_percentile,
+        # Duplicates of a local judge would compete for the same GPU
+        hedge_backends=[
+            b for b in HEDGE_BACKENDS if not (local_judge and b == "judge")
+        ],
+    )
+    configure_judge_backend(
+        cli_args.judge_backend,
+        cli_args.judge_model,
+        **(
+            {"keep_alive": cli_args.keep_alive, "num_ctx": cli_args.num_ctx}
+            if local_judge
+            else {}
+        ),
+    )
+    configure_judge_cache(
+        enabled=not cli_args.no_judge_cache,
+        path=cli_args.judge_cache,
+        max_entries=cli_args.judge_cache_max_entries,
+        cache_only=cli_args.cassette_mode == "replay",
+    )
+    configure_search_cache(
+        enabled=not cli_args.no_search_cache,
+        ttl=cli_args.search_cache_ttl,
+    )
+    configure_compression(cli_args.search_token_budget)
+    configure_cassette(mode=cli_args.cassette_mode, path=cli_args.cassette)
+    configure_time_granularity(cli_args.time_granularity)
+
+    # === Start Ollama ===
+
+    # Every local model used by a selected pair is pulled and warmed up in
+    # parallel, an OpenAI-only run never touches Ollama. A replayed run serves
+    # all LLM calls from the cassette and the judge cache, no server needed
+    replay = cli_args.cassette_mode == "replay"
+    ollama_models = []
+    if not replay:
+        ollama_models = [
+            name
+            for pair in model_pairs
+            for backend, name in pair
+            if backend == "ollama"
+        ]
+    judge_model = cli_args.judge_model or DEFAULT_JUDGE_MODELS[cli_args.judge_backend]
+    if local_judge and not replay:
+        ollama_models.append(judge_model)
+    if replay:
+        configure_judge(ReplayModel(judge_model), judge_model)
+    load_seconds: Dict[str, float] = {}
+    if ollama_models:
+        warm_up_stats = prepare_ollama(
+            ollama_models,
+            keep_alive=cli_args.keep_alive,
+            num_ctx=cli_args.num_ctx,
+            # Enough parallel slots for the judge limit, judge calls of many
+            # questions are then processed together
+            num_parallel=(
+                max(cli_args.ollama_limit, cli_args.judge_limit)
+                if local_judge
+                else None
+            ),
+            hosts=cli_args.ollama_hosts or local_hosts(cli_args.ollama_instances),
+        )
+        # The warm-up load time estimates what every avoided model swap saves
+        for stats in warm_up_stats:
+            load_seconds[stats["model"]] = max(
+                load_seconds.get(stats["model"], 0.0), stats.get("load_s", 0.0)
+            )
+        # The Ollama limits are per endpoint, a pool serves that many per server
+        from ollama_pool import pool_size
+
+        endpoints = pool_size()
+        if endpoints > 1:
+            configure_limits(
+                ollama=cli_args.ollama_limit * endpoints,
+                **({"judge": cli_args.judge_limit * endpoints} if local_judge else {}),
+            )
+
+    # === Define model configurations ===
+
+    models = {
+        model: build_model(*model, cli_args) for pair in model_pairs for model in pair
+    }
+    startup["backends_s"] = round(time.perf_counter() - _T0, 3)
+
+    # === Load Dataset ===
+
+    examples = load_examples(cli_args)
+    logger.info("Loaded %s questions", len(examples))
+
+    # === Shard ===
+
+    # Every question keeps its index in the full list for the merge
+    examples = shard_examples(examples, cli_args.shard_index, cli_args.num_shards)
+    sharded = cli_args.num_shards > 1
+    results_jsonl = RESULTS_JSONL
+    run_summary_json = RUN_SUMMARY_JSON
+    if sharded:
+        results_jsonl = shard_path(
+            RESULTS_JSONL, cli_args.shard_index, cli_args.num_shards
+        )
+        run_summary_json = shard_path(
+            RUN_SUMMARY_JSON, cli_args.shard_index, cli_args.num_shards
+        )
+        write_manifest(
+            results_jsonl,
+            cli_args.shard_index,
+            cli_args.num_shards,
+            [ex["question_index"] for ex in examples],
+            [(models[r].name, models[v].name) for r, v in model_pairs],
+        )
+        logger.info(
+            "Shard %s/%s: %s questions -> %s",
+            cli_args.shard_index,
+            cli_args.num_shards,
+            len(examples),
+            results_jsonl,
+        )
+    startup["ready_s"] = round(time.perf_counter() - _T0, 3)
+    logger.info(
+        "Startup: imports %.2fs, CLI %.2fs, pipeline %.2fs, backends %.2fs, "
+        "ready %.2fs",
+        startup["imports_s"],
+        startup["cli_s"],
+        startup["pipeline_s"],
+        startup["backends_s"],
+        startup["ready_s"],
+    )
 
-        except Exception:
-            logger.exception("Graph invocation failed for question: %s", question)
-            continue
+    # === Main Loop ===
+
+    run_summary = RunSummary()
+
+    # Questions graded by the gold answer alone vs. by the LLM judge
+    grading = {"judge_skipped": 0, "judged": 0}
+
+    def store_result(record: Dict[str, Any]) -> None:
+        """Persist one record and add its metrics to the run summary."""
+        run_summary.observe(record.get("metrics"))
+        grading["judge_skipped" if record.get("judge_skipped") else "judged"] += 1
+        writer.write(record)
+
+    async def run_all_pairs(done: Set[RecordKey]) -> Dict[str, Any]:
+        # Calls of one local model run as one batch, cloud pairs run alongside
+        jobs = [
+            PairJob(
+                examples,
+                responder=models[responder],
+                revisor=models[revisor],
+                on_result=store_result,
+                max_concurrency=cli_args.max_concurrency,
+                max_messages=MAX_MESSAGES,
+                judge_mode=cli_args.judge_mode,
+                skip=done,
+                skip_revise=not cli_args.always_revise,
+                defer_judge=local_judge,
+                on_revised=pending_writer.write if pending_writer else None,
+                revised=revised,
+                judge_gate=cli_args.judge_gate,
+                # Thinking is only controlled on local (qwen3) models
+                responder_think=(
+                    cli_args.think_draft if models[responder].is_local else "on"
+                ),
+                revisor_think=(
+                    cli_args.think_revise if models[revisor].is_local else "on"
+                ),
+            )
+            for responder, revisor in model_pairs
+        ]
+        logger.info("=== Running pairs: %s ===", ", ".join(map(repr, jobs)))
+        return await run_matrix(
+            jobs, load_seconds, local_judge=judge_model if local_judge else None
+        )
 
-        result: List[BaseMessage] = cast(List[BaseMessage], raw_result)
+    # Every record is appended and fsynced as soon as its question is done
+    done: Set[RecordKey] = completed_keys(results_jsonl) if cli_args.resume else set()
+    if done:
+        logger.info("Resuming: %s records already in %s", len(done), results_jsonl)
 
-        responder_tool_used = bool(getattr(result[1], "tool_calls", []))
-        revisor_tool_used = bool(getattr(result[-1], "tool_calls", []))
+    # Revised questions waiting for the local judge batch are fsynced too
+    pending_jsonl = pending_path(results_jsonl)
+    revised = (
+        load_pending(pending_jsonl, done) if cli_args.resume and local_judge else {}
+    )
+    if revised:
+        logger.info("Resuming: %s revised questions left to judge", len(revised))
+
+    # Every chat model call is accounted, the budgets stop new work
+    configure_budget(run=cli_args.run_budget, question=cli_args.question_budget)
+    with ExitStack() as stack:
+        writer = stack.enter_context(
+            JsonlResultWriter(results_jsonl, append=cli_args.resume)
+        )
+        pending_writer = (
+            stack.enter_context(
+                JsonlResultWriter(pending_jsonl, append=cli_args.resume)
+            )
+            if local_judge
+            else None
+        )
+        schedule = asyncio.run(run_all_pairs(done))
+        logger.info("Stored %s new records in %s", writer.count, results_jsonl)
+    if local_judge and not load_pending(pending_jsonl, completed_keys(results_jsonl)):
+        # Every revised question got its record
+        pending_jsonl.unlink(missing_ok=True)
+
+    # Latency percentiles per stage and tokens/sec per model of this run
+    run_summary.log()
+    log_summary()
+    log_call_summary()
+    pool_report: Dict[str, Any] = {}
+    if ollama_models:
+        import ollama_pool
+
+        ollama_pool.log_summary()
+        pool_report = ollama_pool.summary()
+    if cli_args.judge_gate:
+        logger.info(
+            "Judge gate: %s of %s questions graded without a judge call",
+            grading["judge_skipped"],
+            sum(grading.values()),
+        )
+    run_summary_json.write_text(
+        json.dumps(
+            {
+                **run_summary.summary(),
+                "schedule": schedule,
+                "grading": grading,
+                "spend": spend_summary(),
+                "calls": call_summary(),
+                "ollama_pool": pool_report,
+                "startup": startup,
+            },
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
 
-        responder_answer = extract_answer(result[1])
-        revisor_answer = extract_answer(result[-1])
+    judge_cache = get_judge_cache()
+    if judge_cache is not None:
+        logger.info("Judge cache: %s", judge_cache.stats())
+    search_cache = get_search_cache()
+    if search_cache is not None:
+        logger.info("Search cache: %s", search_cache.stats())
 
-        logger.info("Responder tool used: %s", responder_tool_used)
-        logger.info("Revisor tool used: %s", revisor_tool_used)
+    # === Save results ===
 
-        # === Evaluate results ===
-        evaluation = evaluate_question(
-            question=question,
-            responder_answer=responder_answer,
-            revisor_answer=revisor_answer,
+    if sharded:
+        logger.info(
+            "Shard done, merge all shards with: "
+            "python merge_results.py --num-shards %s",
+            cli_args.num_shards,
         )
+    else:
+        export_json(RESULTS_JSONL, RESULTS_JSON)
+        logger.info("Results stored in %s", RESULTS_JSON)
 
-        # Append results
-        results.append(
-            {
-                "question": question,
-                "responder_answer": responder_answer,
-                "revisor_answer": revisor_answer,
-                "responder_tool_used": responder_tool_used,
-                "revisor_tool_used": revisor_tool_used,
-                "responder_model": responder_model_actual,
-                "revisor_model": revisor_model_actual,
-                "evaluation": evaluation,
-            }
-        )
+        # Scores, outcomes and latencies for fast analysis, texts as blobs
+        from columnar_store import COLUMNAR_DIR, write_columnar
 
-        logger.info("Evaluation for question %s completed", idx + 1)
+        write_columnar(iter_records(RESULTS_JSONL), COLUMNAR_DIR)
 
-# === Save results ===
 
-results_path = Path("results/results.json")
-results_path.parent.mkdir(exist_ok=True)
-results_path.write_text(json.dumps(results, indent=2), encoding="utf-8")
-logger.info("Results stored in %s", results_path)
+if __name__ == "__main__":
+    main()
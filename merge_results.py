@@ -0,0 +1,89 @@
+# === merge_results.py ===
+
+"""
+Merge the result files of a sharded run.
+
+Each worker of `python main.py --shard-index i --num-shards N` writes
+results/results.shard-i-of-N.jsonl and a manifest of the records it should
+produce. This command combines them into results.jsonl, results.json and the
+columnar store in question order and flags missing shards, missing records
+and duplicates.
+
+Run: python merge_results.py --num-shards 4
+"""
+
+# === Imports ===
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import sys
+
+from columnar_store import COLUMNAR_DIR, write_columnar
+from results_store import (
+    RESULTS_JSON,
+    RESULTS_JSONL,
+    export_json,
+    iter_records,
+    merge_shards,
+)
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+
+# === CLI ===
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--results",
+        default=str(RESULTS_JSONL),
+        help="Unsharded results path the shard files are named after.",
+    )
+    parser.add_argument(
+        "--num-shards",
+        type=int,
+        default=None,
+        help="Number of shards of the run (default: taken from the file names).",
+    )
+    parser.add_argument("--output-jsonl", default=str(RESULTS_JSONL))
+    parser.add_argument("--output-json", default=str(RESULTS_JSON))
+    parser.add_argument(
+        "--output-columnar",
+        default=str(COLUMNAR_DIR),
+        help="Directory of the columnar store (Parquet table and text blobs).",
+    )
+    parser.add_argument(
+        "--allow-incomplete",
+        action="store_true",
+        help="Exit with 0 even if shards or records are missing or duplicated.",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    report = merge_shards(args.results, args.num_shards, args.output_jsonl)
+    export_json(args.output_jsonl, args.output_json)
+    write_columnar(iter_records(args.output_jsonl), args.output_columnar)
+
+    for shard in report["shards_missing"]:
+        print(f"MISSING shard {shard}/{report['num_shards']}")
+    for entry in report["missing"]:
+        print(f"MISSING question {entry['question_index']} for pair {entry['pair']}")
+    for entry in report["duplicates"]:
+        print(
+            f"DUPLICATE question {entry['question_index']} for pair {entry['pair']} "
+            f"in shard {entry['shard']}"
+        )
+    print(json.dumps({k: v for k, v in report.items() if isinstance(v, int)}))
+
+    problems = report["shards_missing"] or report["missing"] or report["duplicates"]
+    if problems and not args.allow_incomplete:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
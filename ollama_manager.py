@@ -3,105 +3,297 @@
 """Utility helpers to start and prepare an Ollama backend.
 
 The functions here are imported by *main.py* to
-- start the local Ollama server (if not already running)
-- make sure a given model is downloaded
-- warm‑up the model so the first real request is fast
+- start the local Ollama server(s) (if not already running)
+- make sure the given models are downloaded
+- warm‑up all models in parallel so the first real request is fast
+
+The backend may be a pool of several endpoints (local servers on
+consecutive ports or remote hosts). Every endpoint is started, checked and
+warmed up in parallel, endpoints that do not come up are left out and the
+rest form the pool of ollama_pool.py, which pins every question to one.
+
+All HTTP requests share one pooled session, readiness is polled with
+exponential backoff.
 """
 
 from __future__ import annotations
 
-import logging
-
 # === Imports ===
+import json
+import logging
 import os
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor
 from subprocess import Popen
-from typing import Final, Optional
+from typing import Any, Dict, Final, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
 
 # === Logging ===
 logger = logging.getLogger(__name__)
 
 # === Constants ===
 OLLAMA_HOST: Final[str] = os.getenv("OLLAMA_HOST", "http://localhost:11434")
-CHECK_URL: Final[str] = f"{OLLAMA_HOST}/api/tags"
+LOCAL_HOSTNAMES: Final[Tuple[str, ...]] = ("localhost", "127.0.0.1", "0.0.0.0", "::1")
+DEFAULT_KEEP_ALIVE: Final[str] = "30m"
+STARTUP_TIMEOUT: Final[float] = 15.0  # seconds until the server must be up
+
+# === HTTP session ===
+# One keep-alive connection pool for probes, model checks and warm-ups
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
+_session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
 
 # === Helpers ===
 
 
-def _is_server_up(timeout: float = 1.5) -> bool:
-    """Return True if the Ollama HTTP endpoint responds within *timeout* seconds."""
+def normalize_host(host: str) -> str:
+    """Return *host* ("gpu1:11434", "http://gpu1:11434/") as a base URL."""
+    host = host.strip().rstrip("/")
+    return host if "://" in host else f"http://{host}"
+
+
+def local_hosts(count: int, base: str = OLLAMA_HOST) -> List[str]:
+    """Base URLs of *count* local servers on consecutive ports from *base*."""
+    parts = urlsplit(normalize_host(base))
+    port = parts.port or 11434
+    return [f"{parts.scheme}://{parts.hostname}:{port + i}" for i in range(count)]
+
+
+def _is_local(host: str) -> bool:
+    return urlsplit(host).hostname in LOCAL_HOSTNAMES
+
+
+def is_server_up(host: str = OLLAMA_HOST, timeout: float = 1.5) -> bool:
+    """Return True if the Ollama HTTP endpoint answers OK within *timeout* seconds."""
     try:
-        requests.get(CHECK_URL, timeout=timeout)
-        return True
+        return _session.get(f"{host}/api/tags", timeout=timeout).ok
     except (requests.ConnectionError, requests.Timeout):
         return False
 
 
-def _start_server(detach: bool = True) -> Optional[Popen[bytes]]:
-    """Run ``ollama serve`` unless it is already running.
-    Returns the subprocess if a new server was started, otherwise None.
+def _wait_until_up(
+    host: str = OLLAMA_HOST,
+    max_wait: float = STARTUP_TIMEOUT,
+    initial_delay: float = 0.05,
+    factor: float = 2.0,
+    max_delay: float = 2.0,
+) -> bool:
+    """Poll the server with exponential backoff, return True once it responds."""
+    deadline = time.monotonic() + max_wait
+    delay = initial_delay
+    while True:
+        if is_server_up(host, timeout=min(1.5, max_delay)):
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * factor, max_delay)
+
+
+def _server_env(host: str, **extra: str) -> Dict[str, str]:
+    """Environment that points ``ollama`` commands at *host*."""
+    return {**os.environ, "OLLAMA_HOST": urlsplit(host).netloc, **extra}
+
+
+def _start_server(
+    host: str = OLLAMA_HOST,
+    detach: bool = True,
+    num_parallel: Optional[int] = None,
+) -> Optional[Popen[bytes]]:
+    """Run ``ollama serve`` on *host* unless it is already running.
+    *num_parallel* sets OLLAMA_NUM_PARALLEL (parallel requests per model) of a
+    newly started server. Returns the subprocess if a new server was started,
+    otherwise None. Remote hosts are only checked, never started.
     """
-    if _is_server_up():
-        logger.info("Ollama server already running at %s", OLLAMA_HOST)
+    if is_server_up(host):
+        logger.info("Ollama server already running at %s", host)
+        if num_parallel:
+            logger.info(
+                "OLLAMA_NUM_PARALLEL=%s not applied, the running server keeps "
+                "its own setting",
+                num_parallel,
+            )
         return None
+    if not _is_local(host):
+        raise RuntimeError(f"Ollama server at {host} is not reachable.")
 
     cmd = ["ollama", "serve"]
-    logger.info("Starting Ollama server …")
+    extra = {"OLLAMA_NUM_PARALLEL": str(num_parallel)} if num_parallel else {}
+    env = _server_env(host, **extra)
+    logger.info("Starting Ollama server at %s …", host)
 
     proc: Popen[bytes]
     if detach:
         proc = subprocess.Popen(
-            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env
         )
     else:
-        proc = subprocess.Popen(cmd)
+        proc = subprocess.Popen(cmd, env=env)
+
+    start = time.perf_counter()
+    if _wait_until_up(host):
+        logger.info(
+            "Ollama server %s is up and responsive after %.2fs",
+            host,
+            time.perf_counter() - start,
+        )
+        return proc
+
+    logger.error("Failed to start Ollama server at %s – timeout reached", host)
+    raise RuntimeError(f"Failed to start Ollama server at {host}.")
 
-    for _ in range(15):
-        if _is_server_up():
-            logger.info("Ollama server is up and responsive")
-            return proc
-        time.sleep(0.6)
 
-    logger.error("Failed to start Ollama server – timeout reached")
-    raise RuntimeError("Failed to start Ollama server.")
+def _warm_up(
+    model: str,
+    host: str = OLLAMA_HOST,
+    keep_alive: Optional[str] = DEFAULT_KEEP_ALIVE,
+    num_ctx: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Send a short prompt so the model is loaded into memory.
 
+    *keep_alive* and *num_ctx* must match the chat model settings, otherwise
+    Ollama reloads the model on the first real request.
+    Returns the load time reported by Ollama and the first-token latency.
+    """
+    payload: Dict[str, Any] = {
+        "model": model,
+        "prompt": "ping",
+        "stream": True,
+        "options": {"num_predict": 1},
+    }
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    if num_ctx is not None:
+        payload["options"]["num_ctx"] = num_ctx
 
-def _warm_up(model: str) -> None:
-    """Send a fake prompt so the model is loaded into memory."""
+    stats: Dict[str, Any] = {"model": model, "host": host}
+    start = time.perf_counter()
     try:
-        resp = requests.post(
-            f"{OLLAMA_HOST}/api/generate",
-            json={"model": model, "prompt": "ping", "stream": False},
-            timeout=30,
+        with _session.post(
+            f"{host}/api/generate", json=payload, stream=True, timeout=300
+        ) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                if "first_token_s" not in stats:
+                    stats["first_token_s"] = round(time.perf_counter() - start, 3)
+                chunk = json.loads(line)
+                if chunk.get("done"):
+                    stats["load_s"] = round(chunk.get("load_duration", 0) / 1e9, 3)
+        stats["total_s"] = round(time.perf_counter() - start, 3)
+        logger.info(
+            "Model '%s' warm on %s: load %.2fs, first token %.2fs",
+            model,
+            host,
+            stats.get("load_s", 0.0),
+            stats.get("first_token_s", 0.0),
         )
-        resp.raise_for_status()
-        snippet = resp.json().get("response", "")[:40]
-        logger.debug("Model '%s' warm‑up response: %s", model, snippet)
     except Exception as exc:
-        logger.warning("Warm‑up skipped (%s)", exc, exc_info=False)
+        logger.warning(
+            "Warm‑up of '%s' on %s skipped (%s)", model, host, exc, exc_info=False
+        )
+        stats["error"] = str(exc)
+    return stats
+
 
+def _available_models(host: str = OLLAMA_HOST) -> set[str]:
+    resp = _session.get(f"{host}/api/tags", timeout=3)
+    resp.raise_for_status()
+    return {m["name"] for m in resp.json().get("models", [])}
 
-def ensure_model(model: str) -> None:
-    """Download the model via ollama pull if it is not yet available locally."""
+
+def ensure_model(
+    model: str, available: Optional[set[str]] = None, host: str = OLLAMA_HOST
+) -> None:
+    """Download the model via ollama pull if *host* does not have it yet."""
     try:
-        resp = requests.get(CHECK_URL, timeout=3)
-        resp.raise_for_status()
-        available = {m["name"] for m in resp.json().get("models", [])}
+        if available is None:
+            available = _available_models(host)
         if model not in available:
-            logger.info("Downloading model '%s' … this may take a while", model)
-            subprocess.run(["ollama", "pull", model], check=True)
+            logger.info(
+                "Downloading model '%s' to %s … this may take a while", model, host
+            )
+            subprocess.run(["ollama", "pull", model], check=True, env=_server_env(host))
     except Exception as exc:
-        logger.exception("Failed to check or pull model '%s'", model)
-        raise RuntimeError(f"Failed to check or pull model '{model}': {exc}") from exc
+        logger.exception("Failed to check or pull model '%s' on %s", model, host)
+        raise RuntimeError(
+            f"Failed to check or pull model '{model}' on {host}: {exc}"
+        ) from exc
+
 
+def _prepare_host(
+    host: str, models: List[str], num_parallel: Optional[int]
+) -> Optional[str]:
+    """Start *host* and pull *models* to it, None if it cannot be used."""
+    try:
+        _start_server(host, num_parallel=num_parallel)
+        try:
+            available: Optional[set[str]] = _available_models(host)
+        except Exception:
+            available = None  # ensure_model retries the check and reports errors
+        for model in models:
+            ensure_model(model, available, host)
+    except (OSError, RuntimeError) as exc:
+        logger.error("Ollama endpoint %s left out: %s", host, exc)
+        return None
+    return host
+
+
+def prepare_ollama(
+    models: str | Iterable[str],
+    keep_alive: Optional[str] = DEFAULT_KEEP_ALIVE,
+    num_ctx: Optional[int] = None,
+    num_parallel: Optional[int] = None,
+    hosts: Optional[Iterable[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Ensure the servers are running, all models present, and warmed up.
+
+    *hosts* are the endpoints of the pool (default: OLLAMA_HOST); they are
+    prepared in parallel and the ones that come up are handed to
+    ollama_pool.configure_pool(). Every model is warmed up on every endpoint
+    in parallel; returns the warm-up stats per model and endpoint.
+    *num_parallel* is passed to servers started here, see _start_server().
+    """
+    from ollama_pool import configure_pool
+
+    models = [models] if isinstance(models, str) else list(dict.fromkeys(models))
+    if not models:
+        return []
+    hosts = list(dict.fromkeys(normalize_host(h) for h in hosts or [OLLAMA_HOST]))
+
+    logger.info("Preparing Ollama backend %s for models %s", hosts, models)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(hosts)) as pool:
+        ready = [
+            h
+            for h in pool.map(lambda h: _prepare_host(h, models, num_parallel), hosts)
+            if h is not None
+        ]
+    if not ready:
+        raise RuntimeError(f"No Ollama server of {hosts} could be started.")
+
+    jobs = [(model, host) for host in ready for model in models]
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        stats = list(
+            pool.map(
+                lambda job: _warm_up(
+                    job[0], job[1], keep_alive=keep_alive, num_ctx=num_ctx
+                ),
+                jobs,
+            )
+        )
 
-def prepare_ollama(model: str) -> None:
-    """Ensure the server is running, model present, and warmed up."""
-    logger.info("Preparing Ollama backend for model '%s'", model)
-    _start_server()
-    ensure_model(model)
-    _warm_up(model)
-    logger.info("Ollama backend ready!")
+    configure_pool(ready)
+    logger.info(
+        "Ollama backend ready after %.2fs with %s of %s endpoints!",
+        time.perf_counter() - start,
+        len(ready),
+        len(hosts),
+    )
+    return stats
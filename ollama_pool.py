@@ -0,0 +1,411 @@
+# === ollama_pool.py ===
+
+"""Pool of Ollama server endpoints with one pinned endpoint per question.
+
+One Ollama server only works on OLLAMA_NUM_PARALLEL requests at once, more
+GPUs or machines add throughput only if the work is spread over several
+servers. With more than one endpoint (see ollama_manager.prepare_ollama())
+the responder, revisor and local judge are PooledChatOllama models holding
+one ChatOllama per endpoint, and every question
+
+- is pinned to the healthy endpoint with the fewest outstanding requests
+  (ties go to the fewest running questions, then round robin): its draft,
+  revision and judge calls all go to that server, which keeps reusing the
+  prompt/KV cache of the earlier calls of the question
+- is unpinned once it is finished (instrumentation.end_question()), so an
+  endpoint whose questions finish early gets the next ones
+- is moved to another endpoint only if its endpoint is drained: a request
+  failing with a connection error, a timeout or a 5xx status counts as a
+  failure of its endpoint, after HEALTH_FAILURES consecutive failures the
+  endpoint gets no new requests (running ones finish)
+
+Calls outside of a question go to the least busy healthy endpoint. A
+background thread probes every endpoint each HEALTH_INTERVAL seconds:
+failed probes drain an endpoint like failed requests, a drained endpoint
+that answers again is put back. If all endpoints are drained, questions are
+spread over all of them rather than failing outright.
+"""
+
+from __future__ import annotations
+
+# === Imports ===
+import logging
+import threading
+import time
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+)
+
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_ollama import ChatOllama
+
+from instrumentation import current_question
+from ollama_manager import is_server_up, normalize_host
+from resilience import is_retryable
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Constants ===
+HEALTH_INTERVAL = 5.0  # seconds between health probes of every endpoint
+HEALTH_TIMEOUT = 2.0
+HEALTH_FAILURES = 3  # consecutive failed requests/probes that drain an endpoint
+
+
+# === Pool ===
+
+
+class Endpoint:
+    """One Ollama server of the pool with its load and request statistics."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.healthy = True
+        self.outstanding = 0
+        self.questions = 0  # questions pinned (or moved) to the endpoint
+        self.failures = 0  # consecutive, reset by a success
+        self.requests = 0
+        self.errors = 0
+        self.drained = 0  # times taken out of rotation
+        self.peak_outstanding = 0
+        self.busy_s = 0.0
+
+    def row(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "questions": self.questions,
+            "requests": self.requests,
+            "errors": self.errors,
+            "drained": self.drained,
+            "peak_outstanding": self.peak_outstanding,
+            "busy_s": round(self.busy_s, 3),
+        }
+
+
+class OllamaPool:
+    """Ollama endpoints with per-question pinning and health checks."""
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        health_interval: float = HEALTH_INTERVAL,
+        max_failures: int = HEALTH_FAILURES,
+    ) -> None:
+        urls = list(dict.fromkeys(normalize_host(u) for u in urls))
+        if not urls:
+            raise ValueError("An Ollama pool needs at least one endpoint")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+        self._lock = threading.Lock()
+        self._turn = 0
+        self._all_drained = False
+        # Endpoint of each running question; finished questions are dropped
+        # on the next pin, forgotten metrics with their last reference
+        self._pins: weakref.WeakKeyDictionary[Any, Endpoint] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def _candidates(self) -> List[Endpoint]:
+        """Healthy endpoints, all of them if every endpoint is drained."""
+        candidates = [e for e in self.endpoints if e.healthy]
+        if not candidates:
+            if not self._all_drained:
+                logger.warning(
+                    "All Ollama endpoints are drained, spreading over all of them"
+                )
+            self._all_drained = True
+            return self.endpoints
+        self._all_drained = False
+        return candidates
+
+    def _least_busy(self, key: Callable[[Endpoint], Any]) -> Endpoint:
+        candidates = self._candidates()
+        # Rotating the start makes min() break ties round robin
+        self._turn = (self._turn + 1) % len(candidates)
+        order = candidates[self._turn :] + candidates[: self._turn]
+        return min(order, key=key)
+
+    def endpoint_for(self, question: Any = None) -> Endpoint:
+        """Endpoint of *question*, pinning it on its first call.
+
+        A question stays on its endpoint until that is drained. Without a
+        question the least busy healthy endpoint is returned.
+        """
+        with self._lock:
+            if question is None:
+                return self._least_busy(lambda e: e.outstanding)
+            pinned = self._pins.get(question)
+            if pinned is not None and (pinned.healthy or self._all_drained):
+                return pinned
+            self._unpin_finished()
+            load = Counter(self._pins.values())
+            endpoint = self._least_busy(lambda e: (e.outstanding, load[e]))
+            if pinned is not None and endpoint is not pinned:
+                logger.info(
+                    "Moving a question from drained %s to %s", pinned.url, endpoint.url
+                )
+            self._pins[question] = endpoint
+            endpoint.questions += 1
+            return endpoint
+
+    def release(self, question: Any) -> None:
+        """Unpin *question*, its endpoint runs one question less."""
+        with self._lock:
+            self._pins.pop(question, None)
+
+    def _unpin_finished(self) -> None:
+        finished = [q for q in self._pins.keys() if getattr(q, "finished", False)]
+        for question in finished:
+            del self._pins[question]
+
+    @contextmanager
+    def lease(self, endpoint: Endpoint) -> Iterator[Endpoint]:
+        """Count a request to *endpoint* for the duration of the block.
+
+        Transient errors of the request count as failures of the endpoint.
+        """
+        with self._lock:
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            endpoint.peak_outstanding = max(
+                endpoint.peak_outstanding, endpoint.outstanding
+            )
+        start = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            yield endpoint
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            # Cancellation (timeouts, hedging, a thinking cap) is no failure
+            with self._lock:
+                endpoint.outstanding -= 1
+                endpoint.busy_s += time.perf_counter() - start
+                if error is None:
+                    endpoint.failures = 0
+                else:
+                    endpoint.errors += 1
+            if error is not None and is_retryable(error):
+                self._failed(endpoint, f"request failed: {error!r}")
+
+    def _failed(self, endpoint: Endpoint, reason: str) -> None:
+        with self._lock:
+            endpoint.failures += 1
+            drain = endpoint.healthy and endpoint.failures >= self.max_failures
+            if drain:
+                endpoint.healthy = False
+                endpoint.drained += 1
+        if drain:
+            logger.warning(
+                "Draining Ollama endpoint %s after %s consecutive failures (%s)",
+                endpoint.url,
+                endpoint.failures,
+                reason,
+            )
+
+    def _recovered(self, endpoint: Endpoint) -> None:
+        with self._lock:
+            restored = not endpoint.healthy
+            endpoint.healthy = True
+            endpoint.failures = 0
+        if restored:
+            logger.info("Ollama endpoint %s is healthy again", endpoint.url)
+
+    # === Health checks ===
+
+    def check_health(self) -> None:
+        """Probe every endpoint once, drain or restore it accordingly."""
+        for endpoint in self.endpoints:
+            if is_server_up(endpoint.url, timeout=HEALTH_TIMEOUT):
+                self._recovered(endpoint)
+            else:
+                self._failed(endpoint, "health check failed")
+
+    def start_monitor(self) -> None:
+        """Probe the endpoints in a daemon thread every health_interval seconds."""
+        if self._monitor is not None or self.health_interval <= 0:
+            return
+
+        def _watch() -> None:
+            while not self._stop.wait(self.health_interval):
+                self.check_health()
+
+        self._monitor = threading.Thread(
+            target=_watch, name="ollama-pool-health", daemon=True
+        )
+        self._monitor.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join(timeout=HEALTH_TIMEOUT + 1)
+            self._monitor = None
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = [e.row() for e in self.endpoints]
+        total = sum(r["requests"] for r in rows)
+        for row in rows:
+            row["share"] = round(row["requests"] / total, 3) if total else 0.0
+        return {"endpoints": rows, "requests": total}
+
+
+class PooledChatOllama(Runnable[LanguageModelInput, Any]):
+    """Chat model over one ChatOllama per endpoint of a pool.
+
+    Every call goes to the endpoint the current question is pinned to.
+    bind_tools() and with_structured_output() are applied to each endpoint's
+    model and return a PooledChatOllama over the results.
+    """
+
+    def __init__(self, pool: OllamaPool, models: Dict[str, Any], model: str) -> None:
+        self.pool = pool
+        self.models = models
+        self.model = model  # read by chains.model_name_of()
+
+    @classmethod
+    def from_pool(cls, pool: OllamaPool, **kwargs: Any) -> PooledChatOllama:
+        models: Dict[str, Any] = {
+            e.url: ChatOllama(base_url=e.url, **kwargs) for e in pool.endpoints
+        }
+        return cls(pool, models, kwargs["model"])
+
+    def _derive(self, build: Callable[[Any], Runnable]) -> PooledChatOllama:
+        models = {url: build(model) for url, model in self.models.items()}
+        return PooledChatOllama(self.pool, models, self.model)
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> PooledChatOllama:
+        return self._derive(lambda model: model.bind_tools(tools, **kwargs))
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> PooledChatOllama:
+        return self._derive(
+            lambda model: model.with_structured_output(schema, **kwargs)
+        )
+
+    def _target(self) -> Endpoint:
+        return self.pool.endpoint_for(current_question())
+
+    def invoke(
+        self,
+        input: LanguageModelInput,
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Any,
+    ) -> Any:
+        endpoint = self._target()
+        with self.pool.lease(endpoint):
+            return self.models[endpoint.url].invoke(input, config, **kwargs)
+
+    async def ainvoke(
+        self,
+        input: LanguageModelInput,
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Any,
+    ) -> Any:
+        endpoint = self._target()
+        with self.pool.lease(endpoint):
+            return await self.models[endpoint.url].ainvoke(input, config, **kwargs)
+
+    def stream(
+        self,
+        input: LanguageModelInput,
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Any,
+    ) -> Iterator[Any]:
+        endpoint = self._target()
+        with self.pool.lease(endpoint):
+            yield from self.models[endpoint.url].stream(input, config, **kwargs)
+
+    async def astream(
+        self,
+        input: LanguageModelInput,
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[Any]:
+        endpoint = self._target()
+        with self.pool.lease(endpoint):
+            async for chunk in self.models[endpoint.url].astream(
+                input, config, **kwargs
+            ):
+                yield chunk
+
+
+# === State ===
+_hosts: List[str] = []
+_pool: Optional[OllamaPool] = None
+
+
+def configure_pool(
+    hosts: Sequence[str], health_interval: float = HEALTH_INTERVAL
+) -> Optional[OllamaPool]:
+    """Use *hosts* for all Ollama models created by chat_ollama().
+
+    A single host is used directly, several form a pool with a health monitor.
+    """
+    global _hosts, _pool
+    if _pool is not None:
+        _pool.close()
+    _hosts = list(dict.fromkeys(normalize_host(h) for h in hosts))
+    _pool = None
+    if len(_hosts) > 1:
+        _pool = OllamaPool(_hosts, health_interval=health_interval)
+        _pool.start_monitor()
+        logger.info("Ollama pool of %s endpoints: %s", len(_hosts), _hosts)
+    return _pool
+
+
+def pool_size() -> int:
+    """Number of Ollama endpoints requests are spread over."""
+    return max(len(_hosts), 1)
+
+
+def chat_ollama(**kwargs: Any) -> Any:
+    """ChatOllama for the configured endpoint(s), pooled if there are several."""
+    if _pool is not None:
+        return PooledChatOllama.from_pool(_pool, **kwargs)
+    if _hosts:
+        kwargs.setdefault("base_url", _hosts[0])
+    return ChatOllama(**kwargs)
+
+
+def summary() -> Dict[str, Any]:
+    """Requests, errors and drains per endpoint, empty without a pool."""
+    return _pool.summary() if _pool is not None else {}
+
+
+def log_summary() -> None:
+    report = summary()
+    if not report:
+        return
+    logger.info("=== Ollama pool ===")
+    for row in report["endpoints"]:
+        logger.info(
+            "%-26s questions=%-4s requests=%-5s share=%3.0f%% errors=%-3s drained=%-2s "
+            "peak=%-3s busy=%.1fs",
+            row["url"],
+            row["questions"],
+            row["requests"],
+            row["share"] * 100,
+            row["errors"],
+            row["drained"],
+            row["peak_outstanding"],
+            row["busy_s"],
+        )
@@ -0,0 +1,429 @@
+# === pipeline.py ===
+
+"""
+LangGraph pipeline used by main.py.
+
+- builds the draft → execute_tools → revise graph for one model pair,
+  a draft without search queries goes straight to END
+- extracts the final answers from the graph output
+- runs many questions concurrently via graph.ainvoke, bounded by the
+  per-backend limits from concurrency.py, and emits the result records
+  in question order
+- scores both answers against the gold answer (scoring.py) and, with the
+  judge gate, calls the LLM judge only if these scores are inconclusive
+- strips the <think> reasoning from the answers before scoring and judging,
+  the reasoning is stored in the record separately
+"""
+
+# === Imports ===
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, cast
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from langsmith import traceable
+
+from budget import note_cut, note_skipped, question_exhausted, run_exhausted
+from chains import build_responder, build_revisor, model_name_of, split_reasoning
+from concurrency import DEFAULT_MAX_CONCURRENCY
+from evaluator import CRITERIA, aevaluate, gold_evaluation
+from instrumentation import (
+    QuestionMetrics,
+    count_tokens,
+    current_question,
+    end_question,
+    instrument,
+    start_question,
+)
+from resilience import resilient_runnable
+from scoring import score_answer_pair
+from tool_executor import build_tool_node
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Constants ===
+MAX_MESSAGES = 3
+
+# === Graph ===
+
+
+def build_graph(
+    responder_llm,
+    revisor_llm,
+    responder_backend: str,
+    revisor_backend: str,
+    max_messages: int = MAX_MESSAGES,
+    skip_revise: bool = True,
+    checkpointer=None,
+    interrupt_before: Optional[List[str]] = None,
+    responder_think: str = "on",
+    revisor_think: str = "on",
+):
+    """Compile the responder/revisor LangGraph pipeline for one model pair.
+
+    With *skip_revise* a draft that requests no search ends the graph, the
+    revisor would only restate it. *checkpointer* and *interrupt_before* are
+    passed to compile(), the scheduler uses them to run the graph in phases.
+    *responder_think* and *revisor_think* are the thinking modes of the two
+    agents, see chains.py.
+    """
+    from langgraph.graph import END, MessageGraph
+
+    # === Build responder and revisor chains ===
+    # Each node is timed (excluding the wait for a backend slot) per question
+    # Every attempt of a timed out or failed call is retried with a new slot,
+    # the timeout only starts once the slot is held
+    responder_chain = resilient_runnable(
+        instrument(
+            build_responder(responder_llm, responder_think),
+            "draft",
+            model_name_of(responder_llm),
+        ),
+        responder_backend,
+    )
+    revisor_chain = resilient_runnable(
+        instrument(
+            build_revisor(revisor_llm, revisor_think),
+            "revise",
+            model_name_of(revisor_llm),
+        ),
+        revisor_backend,
+    )
+    tools_node = instrument(build_tool_node(), "execute_tools", "tavily")
+
+    # === Define LangGraph ===
+    builder = MessageGraph()
+
+    # Nodes / Steps
+    builder.add_node("draft", responder_chain)  # Initial draft generation
+    builder.add_node("execute_tools", tools_node)  # Execute tools after draft
+    builder.add_node("revise", revisor_chain)  # Final revision step
+
+    # Edges / Transitions
+    def after_draft(state: List[BaseMessage]) -> str:
+        # Without search queries execute_tools has nothing to do
+        if skip_revise and not needs_search(state[-1]):
+            note_revise_skipped("no_search")
+            return END
+        if _budget_spent():
+            note_revise_skipped("budget")
+            return END
+        return "execute_tools"
+
+    builder.add_conditional_edges("draft", after_draft)  # To tools or END
+    builder.add_edge("execute_tools", "revise")  # From tools to revision
+
+    # Entry point / Start
+    builder.set_entry_point("draft")  # Start from the draft step
+
+    def event_loop(state: List[BaseMessage]) -> str:
+        # If we have reached the maximum number of steps, stop the graph
+        # Otherwise, go back to execute_tools
+        if len(state) >= max_messages:
+            return END
+        return END if _budget_spent() else "execute_tools"
+
+    # After revise, use the event_loop function to decide:
+    # - to stop (END)
+    # - loop back to execute_tools
+    builder.add_conditional_edges("revise", event_loop)
+
+    # Compile LangGraph pipeline
+    return builder.compile(checkpointer=checkpointer, interrupt_before=interrupt_before)
+
+
+def _budget_spent() -> bool:
+    """True (and counted) if the current question has spent its budget."""
+    if not question_exhausted():
+        return False
+    logger.info("Question budget spent, ending the graph early")
+    note_cut()
+    return True
+
+
+def note_revise_skipped(reason: str) -> None:
+    """Record why the current question ends after its draft."""
+    metrics = current_question()
+    if metrics is not None:
+        metrics.revise_reason = reason
+
+
+def needs_search(step: BaseMessage) -> bool:
+    """True if a draft calls a tool with at least one search query."""
+    return any(
+        call["args"].get("search_queries") for call in getattr(step, "tool_calls", [])
+    )
+
+
+# === Extract Final Answer ===
+
+
+def extract_answer(step):
+    return (
+        step.tool_calls[0]["args"]["answer"]
+        if step.tool_calls
+        else step.content if isinstance(step.content, str) else "(No answer found)"
+    )
+
+
+def extract_answer_and_reasoning(step) -> Tuple[str, Optional[str]]:
+    """Answer of a step without its <think> blocks, and the reasoning."""
+    answer, reasoning = split_reasoning(extract_answer(step))
+    if step.tool_calls and isinstance(step.content, str):
+        # The answer is in the tool call, the reasoning in the message text
+        reasoning = reasoning or split_reasoning(step.content)[1]
+    return answer, reasoning
+
+
+def judge_prompts_per_answer(judge_mode: str) -> int:
+    """Number of judge prompts that contain one answer."""
+    return 1 if judge_mode == "combined" else len(CRITERIA) + 1
+
+
+# === Evaluation ===
+
+
+@traceable(name="HotpotQA Evaluation")
+async def evaluate_question(
+    question,
+    responder_answer,
+    revisor_answer,
+    judge_mode="criteria",
+):
+    # Pairwise evaluation function, all judge calls are sent concurrently
+    return await aevaluate(
+        question=question,
+        responder=responder_answer,
+        revisor=revisor_answer,
+        mode=judge_mode,
+    )
+
+
+# === Runner ===
+
+
+async def run_question(
+    graph,
+    idx: int,
+    total: int,
+    question: str,
+    responder_model: str,
+    revisor_model: str,
+    judge_mode: str = "criteria",
+    question_index: Optional[int] = None,
+    gold: Any = None,
+    judge_gate: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """Answer, revise and evaluate one question.
+
+    If the graph ended after the draft, the draft is also recorded as the
+    revisor answer and revise_reason says why ("no_search" or "budget");
+    revise_skipped marks the drafts that requested no search.
+    Returns the result record, or None if the graph invocation failed so that
+    one broken question never aborts the rest of the run.
+    """
+    logger.info("QUESTION %s/%s: %s", idx + 1, total, question)
+    metrics = start_question()
+
+    try:
+        raw_result = await graph.ainvoke([HumanMessage(content=question)])
+
+    except Exception:
+        logger.exception("Graph invocation failed for question: %s", question)
+        end_question(metrics)
+        return None
+
+    try:
+        return await finish_question(
+            idx,
+            question,
+            cast(List[BaseMessage], raw_result),
+            metrics,
+            responder_model,
+            revisor_model,
+            judge_mode=judge_mode,
+            question_index=question_index,
+            gold=gold,
+            judge_gate=judge_gate,
+        )
+    finally:
+        end_question(metrics)
+
+
+async def finish_question(
+    idx: int,
+    question: str,
+    result: List[BaseMessage],
+    metrics: QuestionMetrics,
+    responder_model: str,
+    revisor_model: str,
+    judge_mode: str = "criteria",
+    question_index: Optional[int] = None,
+    gold: Any = None,
+    judge_gate: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """Evaluate the final graph state of a question and build its record.
+
+    *question_index* is the position of the question in the full question
+    list (it differs from *idx* in a sharded run), it defaults to *idx*.
+    With a *gold* answer both answers get string scores; with *judge_gate*
+    the LLM judge is skipped when both scores are conclusive.
+    """
+    # Question and draft only: the routing after the draft noted why
+    revise_reason = (metrics.revise_reason or "no_search") if len(result) == 2 else None
+    revise_skipped = revise_reason == "no_search"
+    responder_tool_used = bool(getattr(result[1], "tool_calls", []))
+    revisor_tool_used = revise_reason is None and bool(
+        getattr(result[-1], "tool_calls", [])
+    )
+
+    responder_answer, responder_reasoning = extract_answer_and_reasoning(result[1])
+    revisor_answer, revisor_reasoning = extract_answer_and_reasoning(result[-1])
+
+    logger.info("Responder tool used: %s", responder_tool_used)
+    logger.info("Revisor tool used: %s", revisor_tool_used)
+    if revise_skipped:
+        logger.info("Revise skipped, the draft requested no search")
+    elif revise_reason == "budget":
+        logger.info("Revise skipped, the budget is spent")
+
+    # === Evaluate results ===
+    string_scores = score_answer_pair(responder_answer, revisor_answer, gold)
+    judge_skipped = (
+        judge_gate
+        and string_scores is not None
+        and all(s["correct"] is not None for s in string_scores.values())
+    )
+    try:
+        if judge_skipped and string_scores is not None:
+            logger.info("Judge skipped, both answers graded by the gold answer")
+            evaluation = gold_evaluation(string_scores)
+        else:
+            evaluation = await evaluate_question(
+                question=question,
+                responder_answer=responder_answer,
+                revisor_answer=revisor_answer,
+                judge_mode=judge_mode,
+            )
+    except Exception:
+        logger.exception("Evaluation failed for question: %s", question)
+        return None
+
+    logger.info("Evaluation for question %s completed", idx + 1)
+    if not judge_skipped:
+        # Reasoning tokens kept out of the judge prompts by stripping it
+        metrics.judge_tokens_saved = judge_prompts_per_answer(judge_mode) * sum(
+            count_tokens(r) for r in (responder_reasoning, revisor_reasoning) if r
+        )
+
+    return {
+        "question_index": idx if question_index is None else question_index,
+        "question": question,
+        "responder_answer": responder_answer,
+        "revisor_answer": revisor_answer,
+        "responder_tool_used": responder_tool_used,
+        "revisor_tool_used": revisor_tool_used,
+        "revise_skipped": revise_skipped,
+        "revise_reason": revise_reason,
+        "responder_reasoning": responder_reasoning,
+        "revisor_reasoning": revisor_reasoning,
+        "responder_model": responder_model,
+        "revisor_model": revisor_model,
+        "gold_answer": gold,
+        "string_scores": string_scores,
+        "judge_skipped": judge_skipped,
+        "evaluation": evaluation,
+        "metrics": metrics.to_dict(),
+    }
+
+
+class OrderedEmitter:
+    """Reorder buffer: hands records to *on_result* in question order."""
+
+    def __init__(self, on_result: Callable[[Dict[str, Any]], None]) -> None:
+        self.on_result = on_result
+        self.emitted = 0
+        self._finished: Dict[int, Optional[Dict[str, Any]]] = {}
+        self._next_idx = 0
+
+    def put(self, idx: int, record: Optional[Dict[str, Any]]) -> None:
+        """Store the record of question *idx* (None if it failed or was skipped)."""
+        self._finished[idx] = record
+        while self._next_idx in self._finished:
+            ready = self._finished.pop(self._next_idx)
+            self._next_idx += 1
+            if ready is not None:
+                self.on_result(ready)
+                self.emitted += 1
+
+
+async def run_pair(
+    examples: List[Dict],
+    responder_llm,
+    revisor_llm,
+    responder_backend: str,
+    revisor_backend: str,
+    responder_model: str,
+    revisor_model: str,
+    on_result: Callable[[Dict[str, Any]], None],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    max_messages: int = MAX_MESSAGES,
+    judge_mode: str = "criteria",
+    skip: Optional[Set[Tuple[str, str, str]]] = None,
+    skip_revise: bool = True,
+    judge_gate: bool = False,
+    responder_think: str = "on",
+    revisor_think: str = "on",
+) -> int:
+    """Run all *examples* through one responder/revisor pair concurrently.
+
+    At most *max_concurrency* questions are in flight at once; the individual
+    LLM, judge and Tavily calls are additionally bounded per backend.
+    Each record is handed to *on_result* as soon as all earlier questions are
+    done, so records arrive in question order without buffering the whole
+    run. Failed questions and (question, responder, revisor) triples in
+    *skip* are left out. Returns the number of records emitted.
+    """
+    graph = build_graph(
+        responder_llm,
+        revisor_llm,
+        responder_backend,
+        revisor_backend,
+        max_messages=max_messages,
+        skip_revise=skip_revise,
+        responder_think=responder_think,
+        revisor_think=revisor_think,
+    )
+    in_flight = asyncio.Semaphore(max_concurrency)
+    skip = skip or set()
+    emitter = OrderedEmitter(on_result)
+
+    async def _bounded(idx: int, ex: Dict) -> None:
+        if (ex["question"], responder_model, revisor_model) in skip:
+            logger.info("QUESTION %s/%s already done, skipping", idx + 1, len(examples))
+            record = None
+        else:
+            async with in_flight:
+                if run_exhausted():
+                    note_skipped()
+                    emitter.put(idx, None)
+                    return
+                record = await run_question(
+                    graph,
+                    idx,
+                    len(examples),
+                    ex["question"],
+                    responder_model,
+                    revisor_model,
+                    judge_mode=judge_mode,
+                    question_index=ex.get("question_index"),
+                    gold=ex.get("answer"),
+                    judge_gate=judge_gate,
+                )
+        emitter.put(idx, record)
+
+    await asyncio.gather(*(_bounded(idx, ex) for idx, ex in enumerate(examples)))
+    return emitter.emitted
@@ -0,0 +1,425 @@
+# === resilience.py ===
+
+"""Timeouts, retries and hedged requests for LLM, judge and search calls.
+
+Every call of a backend (see concurrency.py) runs through call_with_retries():
+
+- each attempt first waits for a slot of its backend, untimed, then has a
+  per-backend timeout for the call itself
+- transient failures (timeouts, connection errors, HTTP 408/409/425/429/5xx)
+  are retried with full-jitter exponential backoff; a Retry-After or
+  x-ratelimit-reset header of a rate-limited response sets the delay instead
+- with hedging enabled, a call still running after the backend's latency
+  percentile (of its recent successful attempts) gets a duplicate request,
+  the first answer wins and the other one is cancelled
+
+Retry, timeout and hedge counts plus tail latencies per backend are kept for
+the run summary.
+"""
+
+from __future__ import annotations
+
+# === Imports ===
+import asyncio
+import logging
+import random
+import re
+import time
+from collections import deque
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncContextManager,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Optional,
+    TypeVar,
+)
+
+from concurrency import backend_slot
+from instrumentation import PERCENTILES, percentile
+
+if TYPE_CHECKING:
+    from langchain_core.runnables import Runnable
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Constants ===
+DEFAULT_TIMEOUTS: Dict[str, float] = {
+    "ollama": 300.0,  # long prefills of large local models
+    "openai": 60.0,
+    "judge": 60.0,
+    "tavily": 20.0,
+}
+DEFAULT_MAX_ATTEMPTS = 4
+BASE_DELAY = 0.5  # seconds, doubled per attempt
+MAX_DELAY = 30.0
+HEDGE_BACKENDS = ("openai", "judge", "tavily")  # duplicates cost no local GPU
+HEDGE_MIN_SAMPLES = 20  # successful attempts before a backend is hedged
+LATENCY_WINDOW = 500  # recent attempt latencies used for the hedge threshold
+RETRY_STATUS = frozenset({408, 409, 425, 429})  # and every 5xx
+# Exception class names of connection-level failures across the clients
+# (openai, httpx, requests, aiohttp)
+_CONNECTION_ERRORS = frozenset(
+    {
+        "APIConnectionError",
+        "APITimeoutError",
+        "TransportError",
+        "ConnectionError",
+        "ClientConnectionError",
+        "ServerDisconnectedError",
+        "Timeout",
+    }
+)
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT_SECONDS = {"ms": 1e-3, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+T = TypeVar("T")
+Slot = Callable[[], AsyncContextManager[Any]]
+
+# === State ===
+_timeouts: Dict[str, float] = dict(DEFAULT_TIMEOUTS)
+_max_attempts = DEFAULT_MAX_ATTEMPTS
+_hedge_percentile: Optional[float] = None
+_hedge_backends = set(HEDGE_BACKENDS)
+_latencies: Dict[str, Deque[float]] = {}
+_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def parse_backend_values(spec: str) -> Dict[str, float]:
+    """Parse "openai=30,tavily=10" into {backend: value}."""
+    values: Dict[str, float] = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        backend, _, value = part.partition("=")
+        if backend not in DEFAULT_TIMEOUTS or not value:
+            raise ValueError(
+                f"Unknown setting '{part}', expected BACKEND=VALUE "
+                f"with a backend of {list(DEFAULT_TIMEOUTS)}"
+            )
+        values[backend] = float(value)
+    return values
+
+
+def configure_resilience(
+    timeouts: Optional[Dict[str, float]] = None,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    hedge_percentile: Optional[float] = None,
+    hedge_backends=HEDGE_BACKENDS,
+) -> None:
+    """Set the timeouts, the attempts per call and the hedge threshold.
+
+    *hedge_percentile* (e.g. 95) enables hedging for *hedge_backends*.
+    """
+    global _max_attempts, _hedge_percentile, _hedge_backends
+    if max_attempts < 1:
+        raise ValueError("max_attempts must be >= 1")
+    _timeouts.update(timeouts or {})
+    _max_attempts = max_attempts
+    _hedge_percentile = hedge_percentile
+    _hedge_backends = set(hedge_backends)
+    _latencies.clear()
+    _stats.clear()
+    logger.info(
+        "Resilience: timeouts %s, %s attempts, hedging %s",
+        _timeouts,
+        _max_attempts,
+        (
+            f"after p{hedge_percentile:g} on {sorted(_hedge_backends)}"
+            if hedge_percentile
+            else "off"
+        ),
+    )
+
+
+def _backend_stats(backend: str) -> Dict[str, Any]:
+    return _stats.setdefault(
+        backend,
+        {
+            "calls": 0,
+            "attempts": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "rate_limited": 0,
+            "failures": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "latencies": [],
+        },
+    )
+
+
+# === Error classification ===
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    """HTTP status of a client exception, if it carries one."""
+    for owner in (exc, getattr(exc, "response", None)):
+        for name in ("status_code", "status"):
+            value = getattr(owner, name, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """True for timeouts, connection errors and transient HTTP statuses."""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    status = _status(exc)
+    if status is not None:
+        return status in RETRY_STATUS or status >= 500
+    return any(cls.__name__ in _CONNECTION_ERRORS for cls in type(exc).__mro__)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds to wait according to the rate-limit headers of *exc*."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    if value := headers.get("retry-after-ms"):
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    if value := headers.get("retry-after"):
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+            except (TypeError, ValueError):
+                pass
+    # OpenAI: time until the request/token window resets, e.g. "6m0s"
+    resets = [
+        sum(float(n) * _UNIT_SECONDS[unit] for n, unit in _DURATION.findall(value))
+        for key in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+        if (value := headers.get(key))
+    ]
+    return max(resets) if resets else None
+
+
+def _delay(attempt: int, exc: BaseException) -> float:
+    """Backoff before retry number *attempt* (1-based)."""
+    hinted = retry_after(exc)
+    if hinted is not None:
+        # Spread the retries of many waiting calls a little
+        return min(hinted, MAX_DELAY) + random.uniform(0, BASE_DELAY)
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** (attempt - 1)))
+
+
+# === Calls ===
+
+
+def _hedge_after(backend: str) -> Optional[float]:
+    """Hedge threshold of *backend* in seconds, None if it is not hedged."""
+    if _hedge_percentile is None or backend not in _hedge_backends:
+        return None
+    window = _latencies.get(backend)
+    if window is None or len(window) < HEDGE_MIN_SAMPLES:
+        return None
+    return percentile(sorted(window), _hedge_percentile)
+
+
+async def _attempt(
+    backend: str,
+    call: Callable[[], Awaitable[T]],
+    slot: Optional[Slot],
+    holding: Optional[asyncio.Event] = None,
+) -> T:
+    """One attempt with the backend's timeout, its latency is recorded.
+
+    The wait for *slot* is neither part of the timeout nor of the latency,
+    *holding* is set once the slot is acquired.
+    """
+    async with slot() if slot is not None else nullcontext():
+        if holding is not None:
+            holding.set()
+        start = time.perf_counter()
+        result = await asyncio.wait_for(call(), _timeouts.get(backend))
+        _latencies.setdefault(backend, deque(maxlen=LATENCY_WINDOW)).append(
+            time.perf_counter() - start
+        )
+    return result
+
+
+async def _hedged(
+    backend: str, call: Callable[[], Awaitable[T]], slot: Optional[Slot]
+) -> T:
+    """One attempt, duplicated once it runs longer than the hedge threshold."""
+    threshold = _hedge_after(backend)
+    if threshold is None:
+        return await _attempt(backend, call, slot)
+    holding = asyncio.Event()
+    first = asyncio.ensure_future(_attempt(backend, call, slot, holding))
+    tasks = {first}
+    try:
+        # The hedge clock starts once the first attempt holds its slot
+        waiter = asyncio.ensure_future(holding.wait())
+        await asyncio.wait({first, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        done, _ = await asyncio.wait(tasks, timeout=threshold)
+        if done:
+            return first.result()
+        _backend_stats(backend)["hedged"] += 1
+        second = asyncio.ensure_future(_attempt(backend, call, slot))
+        tasks.add(second)
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        _backend_stats(backend)["hedge_wins"] += 1
+                    return task.result()
+                error = task.exception()
+        assert error is not None
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def call_with_retries(
+    backend: str, call: Callable[[], Awaitable[T]], slot: Optional[Slot] = None
+) -> T:
+    """Run *call* (a coroutine factory) with timeouts, retries and hedging.
+
+    *slot* (a factory of async context managers, e.g. a backend_slot) is held
+    by every attempt, a hedged duplicate takes a slot of its own.
+    """
+    stats = _backend_stats(backend)
+    stats["calls"] += 1
+    start = time.perf_counter()
+    for attempt in range(1, _max_attempts + 1):
+        stats["attempts"] += 1
+        try:
+            result = await _hedged(backend, call, slot)
+        except Exception as exc:
+            if isinstance(exc, TimeoutError):
+                stats["timeouts"] += 1
+            if _status(exc) == 429:
+                stats["rate_limited"] += 1
+            if attempt == _max_attempts or not is_retryable(exc):
+                stats["failures"] += 1
+                raise
+            delay = _delay(attempt, exc)
+            stats["retries"] += 1
+            logger.warning(
+                "%s call failed (%s: %s), retry %s/%s in %.1fs",
+                backend,
+                type(exc).__name__,
+                exc,
+                attempt,
+                _max_attempts - 1,
+                delay,
+            )
+            await asyncio.sleep(delay)
+        else:
+            stats["latencies"].append(time.perf_counter() - start)
+            return result
+    raise AssertionError("unreachable")
+
+
+def call_with_retries_sync(backend: str, call: Callable[[], T]) -> T:
+    """Blocking variant of call_with_retries, without timeouts and hedging."""
+    stats = _backend_stats(backend)
+    stats["calls"] += 1
+    start = time.perf_counter()
+    for attempt in range(1, _max_attempts + 1):
+        stats["attempts"] += 1
+        try:
+            result = call()
+        except Exception as exc:
+            if _status(exc) == 429:
+                stats["rate_limited"] += 1
+            if attempt == _max_attempts or not is_retryable(exc):
+                stats["failures"] += 1
+                raise
+            stats["retries"] += 1
+            delay = _delay(attempt, exc)
+            logger.warning(
+                "%s call failed (%s), retry %s/%s in %.1fs",
+                backend,
+                type(exc).__name__,
+                attempt,
+                _max_attempts - 1,
+                delay,
+            )
+            time.sleep(delay)
+        else:
+            stats["latencies"].append(time.perf_counter() - start)
+            return result
+    raise AssertionError("unreachable")
+
+
+def resilient_runnable(runnable: Runnable, backend: str) -> Runnable:
+    """Wrap *runnable* so that its calls go through call_with_retries.
+
+    Every async attempt holds a slot of *backend*, see concurrency.py.
+    """
+    from langchain_core.runnables import RunnableLambda
+
+    def _invoke(value: Any, config: Any = None) -> Any:
+        return call_with_retries_sync(backend, lambda: runnable.invoke(value, config))
+
+    async def _ainvoke(value: Any, config: Any = None) -> Any:
+        return await call_with_retries(
+            backend,
+            lambda: runnable.ainvoke(value, config),
+            slot=lambda: backend_slot(backend),
+        )
+
+    return RunnableLambda(_invoke, afunc=_ainvoke, name=runnable.get_name())
+
+
+# === Summary ===
+
+
+def summary() -> Dict[str, Dict[str, Any]]:
+    """Retry counts and p50/p95/p99/max call latency per backend."""
+    report = {}
+    for backend, stats in _stats.items():
+        ordered = sorted(stats["latencies"])
+        row = {k: v for k, v in stats.items() if k != "latencies"}
+        if ordered:
+            row.update(
+                {f"p{p}_s": round(percentile(ordered, p), 3) for p in PERCENTILES}
+            )
+            row["max_s"] = round(ordered[-1], 3)
+        threshold = _hedge_after(backend)
+        if threshold is not None:
+            row["hedge_after_s"] = round(threshold, 3)
+        report[backend] = row
+    return report
+
+
+def log_summary() -> None:
+    """Write the retry and tail-latency statistics to the log."""
+    report = summary()
+    if not report:
+        return
+    logger.info("=== Calls per backend ===")
+    for backend, row in report.items():
+        logger.info(
+            "%-7s calls=%-5s retries=%-3s timeouts=%-3s 429=%-3s failed=%-3s "
+            "hedged=%s (won %s) p95=%.2fs p99=%.2fs max=%.2fs",
+            backend,
+            row["calls"],
+            row["retries"],
+            row["timeouts"],
+            row["rate_limited"],
+            row["failures"],
+            row["hedged"],
+            row["hedge_wins"],
+            row.get("p95_s", 0.0),
+            row.get("p99_s", 0.0),
+            row.get("max_s", 0.0),
+        )
@@ -0,0 +1,281 @@
+# === results_store.py ===
+
+"""Streaming storage of result records.
+
+Every finished question is appended to a JSONL file and fsynced, so a crash
+loses at most the question in flight. The final results.json is produced by
+streaming the JSONL file record by record.
+
+With a deferred (local) judge, revised questions wait for the final judge
+batch. They are fsynced to a pending file next to the results as they are
+revised. A resumed run only judges the pending questions that have no
+record yet.
+
+A sharded run writes one JSONL file plus a manifest of the expected records
+per shard; merge_shards() combines them in question order.
+"""
+
+from __future__ import annotations
+
+# === Imports ===
+import json
+import logging
+import os
+import re
+import textwrap
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Constants ===
+RESULTS_JSONL = Path("results/results.jsonl")
+RESULTS_JSON = Path("results/results.json")
+
+RecordKey = Tuple[str, str, str]
+
+
+def record_key(record: Dict[str, Any]) -> RecordKey:
+    """Identity of a record: (question, responder model, revisor model)."""
+    return (record["question"], record["responder_model"], record["revisor_model"])
+
+
+class JsonlResultWriter:
+    """Append-only JSONL writer that makes every record durable on write."""
+
+    def __init__(self, path: str | Path = RESULTS_JSONL, append: bool = True) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.count = 0
+        self._file = self.path.open("a" if append else "w", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """Append *record* as one line and fsync it to disk."""
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.count += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> JsonlResultWriter:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def iter_records(path: str | Path = RESULTS_JSONL) -> Iterator[Dict[str, Any]]:
+    """Yield the records of a JSONL file one by one.
+
+    A truncated last line, e.g. from a crash during a write, is skipped.
+    """
+    path = Path(path)
+    if not path.exists():
+        return
+    with path.open("r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning("Skipping unreadable line %s in %s", line_no, path)
+
+
+def completed_keys(path: str | Path = RESULTS_JSONL) -> Set[RecordKey]:
+    """Return the keys of all records already stored in *path*."""
+    return {record_key(record) for record in iter_records(path)}
+
+
+def pending_path(jsonl_path: str | Path) -> Path:
+    """results/results.jsonl -> results/results.pending.jsonl"""
+    return Path(jsonl_path).with_suffix(".pending.jsonl")
+
+
+def load_pending(
+    path: str | Path, done: Set[RecordKey]
+) -> Dict[RecordKey, Dict[str, Any]]:
+    """Pending (revised, not yet judged) entries of *path* not in *done*."""
+    return {
+        record_key(entry): entry
+        for entry in iter_records(path)
+        if record_key(entry) not in done
+    }
+
+
+def export_json(
+    jsonl_path: str | Path = RESULTS_JSONL, json_path: str | Path = RESULTS_JSON
+) -> int:
+    """Stream a JSONL file into the results.json list format.
+
+    Returns the number of exported records.
+    """
+    count = write_json_list(iter_records(jsonl_path), json_path)
+    logger.info("Exported %s records from %s to %s", count, jsonl_path, json_path)
+    return count
+
+
+def write_json_list(records: Iterable[Dict[str, Any]], json_path: str | Path) -> int:
+    """Write *records* like json.dumps(records, indent=2), one at a time."""
+    json_path = Path(json_path)
+    json_path.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with json_path.open("w", encoding="utf-8") as out:
+        for record in records:
+            out.write("[\n" if count == 0 else ",\n")
+            out.write(textwrap.indent(json.dumps(record, indent=2), "  "))
+            count += 1
+        out.write("\n]" if count else "[]")
+    return count
+
+
+# === Shards ===
+
+
+def shard_path(path: str | Path, shard_index: int, num_shards: int) -> Path:
+    """results/results.jsonl -> results/results.shard-0-of-4.jsonl"""
+    path = Path(path)
+    return path.with_name(
+        f"{path.stem}.shard-{shard_index}-of-{num_shards}{path.suffix}"
+    )
+
+
+def manifest_path(jsonl_path: str | Path) -> Path:
+    return Path(jsonl_path).with_suffix(".manifest.json")
+
+
+def write_manifest(
+    jsonl_path: str | Path,
+    shard_index: int,
+    num_shards: int,
+    question_indices: List[int],
+    pairs: List[Tuple[str, str]],
+) -> None:
+    """Record which (question, pair) records a shard is expected to produce."""
+    manifest = {
+        "shard_index": shard_index,
+        "num_shards": num_shards,
+        "question_indices": question_indices,
+        "pairs": [list(pair) for pair in pairs],
+    }
+    path = manifest_path(jsonl_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(manifest), encoding="utf-8")
+
+
+def merge_shards(
+    base_path: str | Path = RESULTS_JSONL,
+    num_shards: int | None = None,
+    out_path: str | Path = RESULTS_JSONL,
+) -> Dict[str, Any]:
+    """
+    Merge the shard files of *base_path* into *out_path*.
+
+    Records are written pair by pair (in the order of the manifests) and in
+    question order within a pair. Only line offsets are kept in memory, each
+    record is copied from its shard file as is. Returns a report with the
+    shards found, missing shards and records, and duplicates (only the first
+    copy of a duplicate is kept).
+    """
+    base_path = Path(base_path)
+    pattern = re.compile(
+        rf"{re.escape(base_path.stem)}\.shard-(\d+)-of-(\d+){re.escape(base_path.suffix)}$"
+    )
+    shards: Dict[int, Path] = {}
+    for candidate in sorted(base_path.parent.glob(f"{base_path.stem}.shard-*")):
+        match = pattern.match(candidate.name)
+        if match is None:
+            continue
+        index, total = int(match.group(1)), int(match.group(2))
+        if num_shards is None:
+            num_shards = total
+        if total == num_shards:
+            shards[index] = candidate
+    if num_shards is None:
+        raise FileNotFoundError(f"No shard files found for {base_path}")
+
+    # Expected records and pair order from the manifests
+    pairs: List[Tuple[str, str]] = []
+    expected: Set[Tuple[int, str, str]] = set()
+    for index in sorted(shards):
+        manifest_file = manifest_path(shards[index])
+        if not manifest_file.exists():
+            logger.warning("Shard %s has no manifest, cannot check it", index)
+            continue
+        manifest = json.loads(manifest_file.read_text(encoding="utf-8"))
+        for responder, revisor in manifest["pairs"]:
+            if (responder, revisor) not in pairs:
+                pairs.append((responder, revisor))
+            for question_index in manifest["question_indices"]:
+                expected.add((question_index, responder, revisor))
+
+    # Byte offset of every record, keyed on (pair, question_index)
+    located: Dict[Tuple[int, str, str], Tuple[Path, int]] = {}
+    duplicates: List[Dict[str, Any]] = []
+    for index in sorted(shards):
+        with shards[index].open("rb") as f:
+            offset = 0
+            for line in f:
+                start, offset = offset, offset + len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Skipping unreadable line in %s", shards[index])
+                    continue
+                key = (
+                    record.get("question_index", -1),
+                    record["responder_model"],
+                    record["revisor_model"],
+                )
+                if key in located:
+                    duplicates.append(
+                        {
+                            "question_index": key[0],
+                            "pair": list(key[1:]),
+                            "shard": index,
+                        }
+                    )
+                    continue
+                located[key] = (shards[index], start)
+                if (key[1], key[2]) not in pairs:
+                    pairs.append((key[1], key[2]))
+
+    pair_order = {pair: i for i, pair in enumerate(pairs)}
+    ordered = sorted(located, key=lambda k: (pair_order[(k[1], k[2])], k[0]))
+
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    handles: Dict[Path, Any] = {}
+    try:
+        with out_path.open("wb") as out:
+            for key in ordered:
+                path, start = located[key]
+                f = handles.get(path) or handles.setdefault(path, path.open("rb"))
+                f.seek(start)
+                out.write(f.readline().rstrip(b"\n") + b"\n")
+    finally:
+        for f in handles.values():
+            f.close()
+
+    missing = sorted(expected - set(located))
+    report = {
+        "num_shards": num_shards,
+        "shards_found": sorted(shards),
+        "shards_missing": sorted(set(range(num_shards)) - set(shards)),
+        "records": len(ordered),
+        "missing": [{"question_index": q, "pair": [a, b]} for q, a, b in missing],
+        "duplicates": duplicates,
+    }
+    logger.info(
+        "Merged %s records from %s/%s shards into %s (%s missing, %s duplicates)",
+        len(ordered),
+        len(shards),
+        num_shards,
+        out_path,
+        len(missing),
+        len(duplicates),
+    )
+    return report
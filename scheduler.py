@@ -0,0 +1,463 @@
+# === scheduler.py ===
+
+"""
+Model-affinity scheduler for a responder × revisor model matrix.
+
+Ollama keeps only so many models in memory; when consecutive requests hit
+different local models, weights are evicted and reloaded. The scheduler
+therefore runs every pair's graph in two phases (draft + tools, then revise,
+split with interrupt_before=["revise"] and an in-memory checkpointer) and
+batches the phases by local model: all drafts and revisions of one local
+model run back to back before the next model is touched.
+
+Phases on cloud models (and a hosted judge) never wait for a batch:
+cloud-only pairs run concurrently from the start, cloud drafts start right
+away and cloud revisions start as soon as their local draft batch is done.
+
+A local (Ollama) judge is one more local model. Its calls are deferred and
+run as a final batch over all pairs and questions, which keeps the server's
+parallel request slots busy without swapping the judge in between batches.
+Each revised question waiting for that batch is handed to *on_revised*
+(main.py fsyncs it to a pending file), and a resumed run judges such
+questions without drafting them again.
+
+The report compares the number of local model loads with a pair-by-pair,
+question-by-question run, assuming one resident local model at a time.
+"""
+
+from __future__ import annotations
+
+# === Imports ===
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple, cast
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    messages_from_dict,
+    messages_to_dict,
+)
+
+from budget import note_skipped, run_exhausted
+from instrumentation import (
+    QuestionMetrics,
+    end_question,
+    resume_question,
+    start_question,
+)
+from pipeline import (
+    DEFAULT_MAX_CONCURRENCY,
+    MAX_MESSAGES,
+    OrderedEmitter,
+    build_graph,
+    finish_question,
+    note_revise_skipped,
+)
+from results_store import RecordKey
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Constants ===
+LOCAL_BACKENDS = ("ollama",)  # backends whose models compete for one GPU/CPU
+
+
+class ModelSpec(NamedTuple):
+    """One model of the matrix."""
+
+    backend: str  # concurrency backend, see concurrency.py
+    name: str  # name stored in the records
+    llm: Any
+
+    @property
+    def is_local(self) -> bool:
+        return self.backend in LOCAL_BACKENDS
+
+
+class PairJob:
+    """Phased run of all questions through one responder/revisor pair."""
+
+    def __init__(
+        self,
+        examples: List[Dict],
+        responder: ModelSpec,
+        revisor: ModelSpec,
+        on_result: Callable[[Dict[str, Any]], None],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_messages: int = MAX_MESSAGES,
+        judge_mode: str = "criteria",
+        skip: Optional[Set[Tuple[str, str, str]]] = None,
+        skip_revise: bool = True,
+        defer_judge: bool = False,
+        judge_gate: bool = False,
+        responder_think: str = "on",
+        revisor_think: str = "on",
+        on_revised: Optional[Callable[[Dict[str, Any]], None]] = None,
+        revised: Optional[Dict[RecordKey, Dict[str, Any]]] = None,
+    ) -> None:
+        """
+        *on_revised* receives every revised question that waits for the
+        deferred judge; *revised* maps record keys to such entries of an
+        earlier run, these questions are only judged.
+        """
+        self.responder = responder
+        self.revisor = revisor
+        self.judge_mode = judge_mode
+        self.defer_judge = defer_judge
+        self.judge_gate = judge_gate
+        self.on_revised = on_revised
+        self.total = len(examples)
+        from langgraph.checkpoint.memory import MemorySaver
+
+        self.checkpointer = MemorySaver()
+        self.graph = build_graph(
+            responder.llm,
+            revisor.llm,
+            responder.backend,
+            revisor.backend,
+            max_messages=max_messages,
+            skip_revise=skip_revise,
+            checkpointer=self.checkpointer,
+            interrupt_before=["revise"],
+            responder_think=responder_think,
+            revisor_think=revisor_think,
+        )
+        self.emitter = OrderedEmitter(on_result)
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._metrics: Dict[int, QuestionMetrics] = {}
+        self._finishing: List[asyncio.Task] = []
+        self._unjudged: List[Tuple[int, List[BaseMessage]]] = []
+
+        skip = skip or set()
+        revised = revised or {}
+        self.questions: Dict[int, str] = {}
+        self.question_indices: Dict[int, Optional[int]] = {}
+        self.golds: Dict[int, Any] = {}
+        for idx, ex in enumerate(examples):
+            if (ex["question"], responder.name, revisor.name) in skip:
+                logger.info(
+                    "QUESTION %s/%s already done, skipping", idx + 1, self.total
+                )
+                self.emitter.put(idx, None)
+            else:
+                self.questions[idx] = ex["question"]
+                self.question_indices[idx] = ex.get("question_index")
+                self.golds[idx] = ex.get("answer")
+                entry = revised.get((ex["question"], responder.name, revisor.name))
+                if entry is not None and defer_judge:
+                    self._restore(idx, entry)
+        self.drafted: List[int] = []
+
+    def __repr__(self) -> str:
+        return f"{self.responder.name} → {self.revisor.name}"
+
+    def _restore(self, idx: int, entry: Dict[str, Any]) -> None:
+        """Queue a question revised by an earlier run for the judge batch."""
+        metrics = QuestionMetrics()
+        metrics.stages = entry.get("stages", [])
+        self._metrics[idx] = metrics
+        self._unjudged.append((idx, messages_from_dict(entry["messages"])))
+        logger.info(
+            "QUESTION %s/%s already revised, only judging it", idx + 1, self.total
+        )
+
+    def _save_revised(self, idx: int, result: List[BaseMessage]) -> None:
+        """Hand a question waiting for the judge batch to on_revised."""
+        if self.on_revised is None:
+            return
+        self.on_revised(
+            {
+                "question_index": self.question_indices[idx],
+                "question": self.questions[idx],
+                "responder_model": self.responder.name,
+                "revisor_model": self.revisor.name,
+                "messages": messages_to_dict(result),
+                "stages": self._metrics[idx].stages,
+            }
+        )
+
+    def _config(self, idx: int) -> Dict[str, Any]:
+        return {"configurable": {"thread_id": str(idx)}}
+
+    async def _draft(self, idx: int) -> None:
+        async with self._limit:
+            if run_exhausted():
+                note_skipped()
+                self.emitter.put(idx, None)
+                return
+            logger.info(
+                "QUESTION %s/%s (%s): %s",
+                idx + 1,
+                self.total,
+                self,
+                self.questions[idx],
+            )
+            self._metrics[idx] = start_question()
+            try:
+                await self.graph.ainvoke(
+                    [HumanMessage(content=self.questions[idx])], self._config(idx)
+                )
+            except Exception:
+                logger.exception("Draft failed for question: %s", self.questions[idx])
+                self._drop(idx)
+                return
+        self.drafted.append(idx)
+
+    async def _revise(self, idx: int) -> Optional[List[BaseMessage]]:
+        """Run the graph from the interrupt to its end, None on failure."""
+        config = self._config(idx)
+        async with self._limit:
+            resume_question(self._metrics[idx])
+            try:
+                state = await self.graph.aget_state(config)
+                if state.next and run_exhausted():
+                    # Save the answers so far, without the pending tool results
+                    logger.info("Run budget spent, question %s not revised", idx + 1)
+                    note_revise_skipped("budget")
+                    return _up_to_last_answer(cast(List[BaseMessage], state.values))
+                # Each further revise round stops at the interrupt again
+                while state.next:
+                    await self.graph.ainvoke(None, config)
+                    state = await self.graph.aget_state(config)
+            except Exception:
+                logger.exception("Revise failed for question: %s", self.questions[idx])
+                self._drop(idx)
+                return None
+        return cast(List[BaseMessage], state.values)
+
+    async def _finish(self, idx: int, result: List[BaseMessage]) -> None:
+        """Evaluate and emit one question; a failure only drops this question."""
+        resume_question(self._metrics[idx])
+        record = None
+        try:
+            record = await finish_question(
+                idx,
+                self.questions[idx],
+                result,
+                self._metrics[idx],
+                self.responder.name,
+                self.revisor.name,
+                judge_mode=self.judge_mode,
+                question_index=self.question_indices[idx],
+                gold=self.golds[idx],
+                judge_gate=self.judge_gate,
+            )
+        except Exception:
+            logger.exception("Finishing failed for question: %s", self.questions[idx])
+        finally:
+            self.emitter.put(idx, record)
+            end_question(self._metrics[idx])
+            await self.checkpointer.adelete_thread(str(idx))
+
+    def _drop(self, idx: int) -> None:
+        """Give up on a question whose graph failed."""
+        self.emitter.put(idx, None)
+        end_question(self._metrics[idx])
+
+    async def _revise_and_finish(self, idx: int, background: bool) -> None:
+        result = await self._revise(idx)
+        if result is None:
+            return
+        if self.defer_judge:
+            # Judged in the final local judge batch, see run_judging()
+            self._unjudged.append((idx, result))
+            self._save_revised(idx, result)
+        elif background:
+            # The judge is a cloud call, do not hold up the local batch
+            self._finishing.append(asyncio.create_task(self._finish(idx, result)))
+        else:
+            await self._finish(idx, result)
+
+    async def run_drafts(self) -> None:
+        restored = {idx for idx, _ in self._unjudged}
+        await asyncio.gather(
+            *(self._draft(idx) for idx in self.questions if idx not in restored)
+        )
+
+    async def run_revisions(self) -> None:
+        await asyncio.gather(
+            *(
+                self._revise_and_finish(idx, background=self.revisor.is_local)
+                for idx in sorted(self.drafted)
+            )
+        )
+
+    async def run_all(self) -> None:
+        """Both phases back to back, for pairs without local models."""
+        await self.run_drafts()
+        await self.run_revisions()
+
+    async def run_judging(self) -> int:
+        """Judge all deferred questions, returns their number."""
+        unjudged, self._unjudged = self._unjudged, []
+        await asyncio.gather(*(self._finish(idx, result) for idx, result in unjudged))
+        return len(unjudged)
+
+    async def wait(self) -> None:
+        """Wait for the evaluations still running in the background."""
+        await asyncio.gather(*self._finishing)
+
+
+def _up_to_last_answer(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """*messages* up to the last model answer, without its pending tool results."""
+    last = max(i for i, m in enumerate(messages) if isinstance(m, AIMessage))
+    return messages[: last + 1]
+
+
+# === Load accounting ===
+
+
+def _loads(sequence: List[str]) -> Dict[str, int]:
+    """Number of loads per model for a sequence of local model calls."""
+    loads: Dict[str, int] = {}
+    previous = None
+    for model in sequence:
+        if model != previous:
+            loads[model] = loads.get(model, 0) + 1
+            previous = model
+    return loads
+
+
+def _sequential_sequence(jobs: List[PairJob], judge: Optional[str]) -> List[str]:
+    """Local model calls of a pair-by-pair, question-by-question run."""
+    sequence = []
+    for job in jobs:
+        for _ in job.questions:
+            sequence += [m.name for m in (job.responder, job.revisor) if m.is_local]
+            if judge:
+                sequence.append(judge)
+    return sequence
+
+
+def _report(
+    jobs: List[PairJob],
+    batches: List[str],
+    load_seconds: Dict[str, float],
+    judge: Optional[str],
+) -> Dict[str, Any]:
+    naive = _loads(_sequential_sequence(jobs, judge))
+    scheduled = _loads(batches)
+    avoided = {m: naive[m] - scheduled.get(m, 0) for m in naive}
+    return {
+        "batches": batches,
+        "loads_sequential": naive,
+        "loads_scheduled": scheduled,
+        "swaps_sequential": max(sum(naive.values()) - 1, 0),
+        "swaps_scheduled": max(sum(scheduled.values()) - 1, 0),
+        "load_s_avoided": round(
+            sum(n * load_seconds.get(m, 0.0) for m, n in avoided.items()), 2
+        ),
+    }
+
+
+# === Scheduler ===
+
+
+async def run_matrix(
+    jobs: List[PairJob],
+    load_seconds: Optional[Dict[str, float]] = None,
+    local_judge: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Run all pair jobs with local-model batching, see module docstring.
+    *load_seconds* is the load time per local model (e.g. from the warm-up)
+    used to estimate the avoided load time. *local_judge* names a local judge
+    model, the jobs must then be created with defer_judge. Returns the
+    schedule report.
+    """
+    cloud_tasks: List[asyncio.Task] = []
+    draft_tasks: Dict[int, asyncio.Task] = {}
+    # Next phase of every job that still needs a local model
+    phase: Dict[int, str] = {}
+
+    for i, job in enumerate(jobs):
+        if not job.responder.is_local and not job.revisor.is_local:
+            cloud_tasks.append(asyncio.create_task(job.run_all()))
+        elif not job.responder.is_local:
+            draft_tasks[i] = asyncio.create_task(job.run_drafts())
+            phase[i] = "revise"
+        else:
+            phase[i] = "draft"
+
+    local_order = list(
+        dict.fromkeys(
+            m.name for job in jobs for m in (job.responder, job.revisor) if m.is_local
+        )
+    )
+
+    async def _run_phase(i: int, step: str) -> None:
+        job = jobs[i]
+        if step == "draft":
+            await job.run_drafts()
+            if job.revisor.is_local:
+                phase[i] = "revise"
+            else:
+                del phase[i]
+                cloud_tasks.append(asyncio.create_task(job.run_revisions()))
+        else:
+            if i in draft_tasks:
+                await draft_tasks.pop(i)
+            await job.run_revisions()
+            del phase[i]
+
+    def _ready(model: str) -> List[Tuple[int, str]]:
+        return [
+            (i, step)
+            for i, step in phase.items()
+            if (jobs[i].responder if step == "draft" else jobs[i].revisor).name == model
+        ]
+
+    batches: List[str] = []
+    while phase:
+        for model in local_order:
+            # A draft batch can make revisions on the same model ready
+            while batch := _ready(model):
+                logger.info(
+                    "=== Local batch: %s (%s) ===",
+                    model,
+                    ", ".join(f"{jobs[i]} {step}" for i, step in batch),
+                )
+                if not batches or batches[-1] != model:
+                    batches.append(model)
+                await asyncio.gather(*(_run_phase(i, step) for i, step in batch))
+
+    # Cloud tasks may add further tasks while they run
+    while cloud_tasks:
+        await cloud_tasks.pop()
+
+    judge_batch: Dict[str, Any] = {}
+    if any(job.defer_judge for job in jobs):
+        logger.info("=== Local batch: %s (judge) ===", local_judge)
+        if local_judge and (not batches or batches[-1] != local_judge):
+            batches.append(local_judge)
+        start = time.perf_counter()
+        judged = sum(await asyncio.gather(*(job.run_judging() for job in jobs)))
+        seconds = time.perf_counter() - start
+        judge_batch = {
+            "model": local_judge,
+            "questions": judged,
+            "seconds": round(seconds, 2),
+            "questions_per_s": round(judged / seconds, 3) if seconds else 0.0,
+        }
+        logger.info(
+            "Judge batch: %s questions in %.1fs (%.2f questions/s)",
+            judged,
+            seconds,
+            judge_batch["questions_per_s"],
+        )
+    for job in jobs:
+        await job.wait()
+
+    report = _report(jobs, batches, load_seconds or {}, local_judge)
+    if judge_batch:
+        report["judge_batch"] = judge_batch
+    logger.info(
+        "Local model swaps: %s scheduled vs. %s sequential, ~%.1fs load time avoided",
+        report["swaps_scheduled"],
+        report["swaps_sequential"],
+        report["load_s_avoided"],
+    )
+    return report
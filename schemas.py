@@ -4,9 +4,10 @@
 Typed tool-IO schemas for LangChain agents:
 - AnswerQuestion with self-reflection & search queries
 - ReviseAnswer extension
+- JointEvaluation for the single-call multi-criteria judge
 """
 
-from typing import List
+from typing import List, Literal
 
 from pydantic import BaseModel, Field
 
@@ -60,3 +61,47 @@ class ReviseAnswer(AnswerQuestion):
         # Sources backing up the revised content
         description="Citations motivating your updated answer."
     )
+
+
+# --- Schemas for the single-call judge ---
+
+
+class CriterionVerdict(BaseModel):
+    """
+    Yes/No verdict of the judge for one criterion.
+    Mirrors the output of LangChain's CRITERIA evaluator.
+    """
+
+    reasoning: str = Field(description="Short step-by-step justification.")
+    value: Literal["Y", "N"] = Field(
+        description="'Y' if the submission meets the criterion, otherwise 'N'."
+    )
+
+
+class AnswerAssessment(BaseModel):
+    """
+    Verdicts for all single-response criteria of one answer.
+    """
+
+    helpfulness: CriterionVerdict
+    correctness: CriterionVerdict
+    relevance: CriterionVerdict
+    conciseness: CriterionVerdict
+    coherence: CriterionVerdict
+
+
+class JointEvaluation(BaseModel):
+    """
+    Structured output of the single-call judge.
+    Grades the responder (assistant A) and revisor (assistant B) answers
+    on every criterion and picks the overall pair-wise winner.
+    """
+
+    responder: AnswerAssessment = Field(description="Verdicts for assistant A.")
+    revisor: AnswerAssessment = Field(description="Verdicts for assistant B.")
+    pairwise_reasoning: str = Field(
+        description="Short explanation comparing both answers."
+    )
+    pairwise_winner: Literal["A", "B", "C"] = Field(
+        description="'A' if assistant A is better, 'B' if B is better, 'C' for a tie."
+    )
@@ -0,0 +1,247 @@
+# === scoring.py ===
+
+"""
+Local string metrics of answers against gold answers.
+
+Exact match, token F1 and containment use the SQuAD/HotpotQA normalisation
+(lower case, no punctuation, no articles, single spaces). A question may have
+several gold answers (aliases), each metric takes the best one.
+
+The answers of this pipeline are long (~150 words), so a low F1 says little:
+a correct paraphrase ("American" for "United States") scores F1 0. Only an
+exact match or a whole-word containment of the gold answer counts as a
+conclusive "correct"; everything else is left to the LLM judge. Yes/no
+questions are graded by the yes/no the answer starts with instead, as
+containment would find the "no" in "Yes, there is no doubt…".
+
+All metrics are computed with NumPy for a whole batch of (prediction, gold)
+pairs at once, tokens are counted per pair via sorted integer keys instead
+of per-pair Counters. The same code scores the two answers of one question
+(for the judge gate) and all answers of a finished run.
+
+Run: python scoring.py --results results/results.jsonl
+"""
+
+from __future__ import annotations
+
+# === Imports ===
+import argparse
+import logging
+import re
+import string
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# === Logging ===
+logger = logging.getLogger(__name__)
+
+# === Constants ===
+METRICS = ("exact_match", "f1", "contains")
+YES_NO = frozenset({"yes", "no"})
+
+_ARTICLES = re.compile(r"\b(a|an|the)\b")
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+
+
+# === Normalisation ===
+
+
+def normalize_answer(text: str) -> str:
+    """Lower case, remove punctuation, articles and extra whitespace."""
+    text = str(text).lower().translate(_PUNCTUATION)
+    return " ".join(_ARTICLES.sub(" ", text).split())
+
+
+def gold_answers(gold: Any) -> List[str]:
+    """Gold answers of a question as a list (a string or a list of aliases)."""
+    if gold is None:
+        return []
+    if isinstance(gold, str):
+        return [gold] if gold.strip() else []
+    return [str(g) for g in gold if str(g).strip()]
+
+
+def yes_no_gold(gold: Any) -> Optional[str]:
+    """ "yes" or "no" if that is the (only) gold answer, else None."""
+    answers = {normalize_answer(g) for g in gold_answers(gold)}
+    if len(answers) == 1 and answers <= YES_NO:
+        return answers.pop()
+    return None
+
+
+def _leading_yes_no(text: str) -> Optional[str]:
+    """The yes/no an answer starts with, None if it starts otherwise."""
+    tokens = normalize_answer(text).split()
+    return tokens[0] if tokens and tokens[0] in YES_NO else None
+
+
+# === Vectorised metrics ===
+
+
+def _tokens(texts: Sequence[str]) -> Tuple[np.ndarray, List[str]]:
+    """Row index and text of every token of the normalised *texts*."""
+    split = [text.split() for text in texts]
+    lengths = np.fromiter(map(len, split), dtype=np.int64, count=len(split))
+    return np.repeat(np.arange(len(split)), lengths), list(chain.from_iterable(split))
+
+
+def score_pairs(
+    predictions: Sequence[str], golds: Sequence[Any]
+) -> Dict[str, np.ndarray]:
+    """
+    Exact match, token F1 and containment of every prediction against its
+    gold answer(s). Returns one float array per metric, NaN where a
+    prediction has no gold answer.
+    """
+    n = len(predictions)
+    # One row per (prediction, gold alias) pair
+    owner: List[int] = []
+    gold_texts: List[str] = []
+    for i, gold in enumerate(golds):
+        for alias in gold_answers(gold):
+            # A gold answer that is only articles/punctuation cannot be scored
+            normalized_alias = normalize_answer(alias)
+            if normalized_alias:
+                owner.append(i)
+                gold_texts.append(normalized_alias)
+    result: Dict[str, np.ndarray] = {metric: np.full(n, np.nan) for metric in METRICS}
+    if not owner:
+        return result
+
+    owners = np.asarray(owner, dtype=np.int64)
+    normalized = [normalize_answer(p) for p in predictions]
+    pred_texts = [normalized[i] for i in owner]
+
+    pred = np.asarray(pred_texts, dtype=object)
+    gold = np.asarray(gold_texts, dtype=object)
+    exact = (pred == gold).astype(np.float64)
+    # Whole-word containment of the gold answer in the prediction
+    padded_pred = np.char.add(np.char.add(" ", pred.astype(str)), " ")
+    padded_gold = np.char.add(np.char.add(" ", gold.astype(str)), " ")
+    contains = np.char.find(padded_pred, padded_gold) >= 0
+
+    # Token F1: count (row, token id) keys of both sides and intersect them
+    pred_rows, pred_tokens = _tokens(pred_texts)
+    gold_rows, gold_tokens = _tokens(gold_texts)
+    ids, vocab = pd.factorize(np.asarray(pred_tokens + gold_tokens, dtype=object))
+    pred_ids, gold_ids = ids[: len(pred_tokens)], ids[len(pred_tokens) :]
+    width = max(len(vocab), 1)
+    pred_keys, pred_counts = np.unique(pred_rows * width + pred_ids, return_counts=True)
+    gold_keys, gold_counts = np.unique(gold_rows * width + gold_ids, return_counts=True)
+    common, pi, gi = np.intersect1d(
+        pred_keys, gold_keys, assume_unique=True, return_indices=True
+    )
+    rows = len(owner)
+    overlap = np.bincount(
+        common // width,
+        weights=np.minimum(pred_counts[pi], gold_counts[gi]),
+        minlength=rows,
+    )
+    pred_len = np.bincount(pred_rows, minlength=rows)
+    gold_len = np.bincount(gold_rows, minlength=rows)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = overlap / pred_len
+        recall = overlap / gold_len
+        f1 = np.where(overlap > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+    # Best gold alias per prediction
+    for metric, values in (
+        ("exact_match", exact),
+        ("f1", f1),
+        ("contains", contains.astype(np.float64)),
+    ):
+        best = np.full(n, -np.inf)
+        np.maximum.at(best, owners, values)
+        result[metric] = np.where(np.isinf(best), np.nan, best)
+    return result
+
+
+def verdicts(
+    scores: Dict[str, np.ndarray], predictions: Sequence[str], golds: Sequence[Any]
+) -> List[Optional[bool]]:
+    """
+    Correct (True), wrong (False) or inconclusive (None) per prediction.
+
+    Exact match and containment are only conclusive for correct answers; a
+    yes/no gold answer is compared with the yes/no the prediction starts with.
+    """
+    out: List[Optional[bool]] = []
+    for prediction, gold, em, contains in zip(
+        predictions, golds, scores["exact_match"], scores["contains"]
+    ):
+        polarity = yes_no_gold(gold)
+        if polarity is not None:
+            leading = _leading_yes_no(prediction)
+            out.append(None if leading is None else leading == polarity)
+        elif em == 1 or contains == 1:
+            out.append(True)
+        else:
+            out.append(None)
+    return out
+
+
+def score_answer_pair(
+    responder_answer: str, revisor_answer: str, gold: Any
+) -> Optional[Dict[str, Dict[str, Any]]]:
+    """String scores of both answers of one question, None without gold."""
+    predictions, golds = [responder_answer, revisor_answer], [gold, gold]
+    scores = score_pairs(predictions, golds)
+    if np.isnan(scores["f1"][0]):
+        return None
+    correct = verdicts(scores, predictions, golds)
+    return {
+        role: {
+            **{metric: round(float(scores[metric][i]), 4) for metric in METRICS},
+            "correct": correct[i],
+        }
+        for i, role in enumerate(("responder", "revisor"))
+    }
+
+
+# === Run level ===
+
+
+def score_records(records: Iterable[Dict[str, Any]]) -> pd.DataFrame:
+    """Score the answers of all records with a gold answer in one batch."""
+    rows = [r for r in records if gold_answers(r.get("gold_answer"))]
+    frame = pd.DataFrame(
+        {
+            "responder_model": [r.get("responder_model", "-") for r in rows],
+            "revisor_model": [r.get("revisor_model", "-") for r in rows],
+        }
+    )
+    golds = [r["gold_answer"] for r in rows]
+    for role in ("responder", "revisor"):
+        scores = score_pairs([r.get(f"{role}_answer", "") for r in rows], golds)
+        for metric in METRICS:
+            frame[f"{metric}_{role}"] = scores[metric]
+    return frame
+
+
+def main() -> None:
+    from analytics import load_records
+    from results_store import RESULTS_JSONL
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--results", default=str(RESULTS_JSONL))
+    parser.add_argument("--output", default=None, help="Write the means as CSV.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    frame = score_records(load_records(args.results))
+    if frame.empty:
+        print("No records with a gold answer")
+        return
+    means = frame.groupby(["responder_model", "revisor_model"]).mean()
+    means.insert(0, "n", frame.groupby(["responder_model", "revisor_model"]).size())
+    print(means.round(3).to_string())
+    if args.output:
+        means.to_csv(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,33 @@
 # === tool_executor.py ===
 
-"""Wrapper for Tavily-Search, Responder/Revisor can call this tool."""
+"""Wrapper for Tavily-Search, Responder/Revisor can call this tool.
+
+The Tavily client and the tool node are created on first use.
+Before the results reach the revisor they are compressed: duplicate URLs
+are dropped, the snippets are ranked against the question, the draft's
+reflection and the search queries, and cut to a token budget. Every kept
+snippet keeps its URL, so the revisor can still cite it in its references.
+"""
 
 # --- Imports ---
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
-from typing import List
+import math
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 
 from dotenv import load_dotenv
-from langchain_core.tools import (
-    StructuredTool,  # Wraps functions to make them usable by LLMs
-)
-from langchain_tavily import TavilySearch
-from langgraph.prebuilt import ToolNode
 
+import cassette
+from concurrency import backend_slot
+from disk_cache import DiskCache
+from instrumentation import count_tokens, current_stage
+from resilience import call_with_retries, call_with_retries_sync, is_retryable
 from schemas import AnswerQuestion, ReviseAnswer
 
 # --- Logging ---
@@ -23,14 +36,152 @@ logger = logging.getLogger(__name__)
 # --- Environment ---
 load_dotenv()
 
-# Initialize Tavily search tool
-tavily_tool = TavilySearch(max_results=5)
+# Tavily search tool, created on the first search that misses the cache
+_tavily_tool: Any = None
+
+
+def get_search_tool():
+    """Return the Tavily search tool, creating it on first use."""
+    global _tavily_tool
+    if _tavily_tool is None:
+        from langchain_tavily import TavilySearch
+
+        _tavily_tool = TavilySearch(max_results=5)
+    return _tavily_tool
+
+
+def set_search_tool(tool) -> None:
+    """Replace the Tavily tool, e.g. with an offline stand-in (needs batch/abatch)."""
+    global _tavily_tool
+    _tavily_tool = tool
+
+
+# --- Search cache ---
+SEARCH_CACHE_PATH = Path("cache/search_cache.sqlite")
+SEARCH_CACHE_TTL = 24 * 3600  # seconds, search results go stale
+SEARCH_CACHE_MAX_ENTRIES = 50_000
+
+# Filler words that do not change what a web search returns; question
+# words, negations and conjunctions are not among them
+_FILLER_WORDS = frozenset("a an at by for from in is of on the to with".split())
+# Words left out when ranking snippets against the queries
+_QUERY_STOPWORDS = _FILLER_WORDS | frozenset("and or what which who".split())
+
+_search_cache_enabled = True
+_search_cache: Optional[DiskCache] = None
+
+
+def configure_search_cache(
+    enabled: bool = True,
+    path: str | Path = SEARCH_CACHE_PATH,
+    ttl: Optional[float] = SEARCH_CACHE_TTL,
+    max_entries: Optional[int] = SEARCH_CACHE_MAX_ENTRIES,
+) -> None:
+    """Enable, relocate or bypass the persistent Tavily result cache."""
+    global _search_cache, _search_cache_enabled
+    _search_cache_enabled = enabled
+    _search_cache = (
+        DiskCache(path, max_entries=max_entries, name="search cache", ttl=ttl)
+        if enabled
+        else None
+    )
+    if not enabled:
+        logger.info("Search cache bypassed")
+
+
+def get_search_cache() -> Optional[DiskCache]:
+    """Return the search cache, opening it on first use; None if bypassed."""
+    global _search_cache
+    if _search_cache is None and _search_cache_enabled:
+        _search_cache = DiskCache(
+            SEARCH_CACHE_PATH,
+            max_entries=SEARCH_CACHE_MAX_ENTRIES,
+            name="search cache",
+            ttl=SEARCH_CACHE_TTL,
+        )
+    return _search_cache
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalised cache key of a search query.
+    Case, whitespace, punctuation and filler words are ignored; the word
+    order, question words and negations are kept, as they change what the
+    search returns.
+
+    >>> normalize_query("X 2025") == normalize_query("x in 2025?")
+    True
+    >>> normalize_query("who founded X") == normalize_query("X founded who")
+    False
+    """
+    tokens = re.findall(r"\w+", query.lower())
+    return " ".join(t for t in tokens if t not in _FILLER_WORDS)
+
+
+def _plan(search_queries: List[str]) -> Tuple[List[Any], Dict[str, str]]:
+    """
+    Look up every query in the cache.
+    Returns the results found so far (None for misses) and the distinct
+    normalised keys still to fetch, mapped to the query sent to Tavily.
+    """
+    cache = get_search_cache()
+    found: List[Any] = []
+    pending: Dict[str, str] = {}
+    for query in search_queries:
+        key = normalize_query(query)
+        hit = None
+        # An in-batch duplicate of a pending query is fetched only once
+        if key not in pending and cache is not None:
+            hit = cache.get(["tavily", key])
+        if hit is None:
+            pending.setdefault(key, query)
+        found.append(hit)
+    return found, pending
+
+
+def _merge(
+    search_queries: List[str], found: List[Any], fetched: Dict[str, Any]
+) -> List[Any]:
+    """Fill the cache misses in *found* and store fresh results."""
+    cache = get_search_cache()
+    if cache is not None:
+        for key, result in fetched.items():
+            if isinstance(result, dict) and "error" not in result:
+                cache.set(["tavily", key], result)
+
+    results = [
+        hit if hit is not None else fetched[normalize_query(query)]
+        for query, hit in zip(search_queries, found)
+    ]
+
+    hits = sum(hit is not None for hit in found)
+    logger.info(
+        "Search cache: %s/%s queries served from cache, %s sent to Tavily%s",
+        hits,
+        len(search_queries),
+        len(fetched),
+        f" (total {cache.stats()})" if cache is not None else "",
+    )
+    return results
+
+
+def _raise_transient(blocks: List[Any]) -> List[Any]:
+    """
+    TavilySearch returns {"error": exception} instead of raising,
+    re-raise transient errors so that the batch is retried.
+    """
+    for block in blocks:
+        error = block.get("error") if isinstance(block, dict) else None
+        if isinstance(error, Exception) and is_retryable(error):
+            raise error
+    return blocks
 
 
 def run_queries(search_queries: List[str], **kwargs):
     """
     Executes a batch of search queries using Tavily.
     Only runs if the input list is non-empty.
+    Cached and duplicate queries are not sent again.
     Args: search_queries (list[str]): One or more user-generated queries.
     Returns: list: Search results, one per query.
     """
@@ -38,25 +189,263 @@ def run_queries(search_queries: List[str], **kwargs):
         logger.debug("run_queries: empty request, nothing to do")
         return []
 
-    # Run each query using Tavily and return the results
-    logger.info("run_queries: Start %s search requests", len(search_queries))
-    results = tavily_tool.batch([{"query": q} for q in search_queries])
-    logger.info("run_queries: Tavily search delivers  %s result blocks", len(results))
+    recorder = cassette.get_cassette()
+    if recorder is not None and recorder.mode == "replay":
+        return recorder.lookup("search", "tavily", search_queries)
+
+    found, pending = _plan(search_queries)
+    fetched: Dict[str, Any] = {}
+    if pending:
+        # Run each remaining query using Tavily
+        logger.info("run_queries: Start %s search requests", len(pending))
+        blocks = call_with_retries_sync(
+            "tavily",
+            lambda: _raise_transient(
+                get_search_tool().batch([{"query": q} for q in pending.values()])
+            ),
+        )
+        fetched = dict(zip(pending, blocks))
+        logger.info(
+            "run_queries: Tavily search delivers  %s result blocks", len(blocks)
+        )
+    results = _merge(search_queries, found, fetched)
+
+    if recorder is not None:
+        recorder.record("search", "tavily", search_queries, results)
     return results
 
 
-# Wrap run_queries into LangChain-compatible StructuredTools
-execute_tools = ToolNode(
-    [
-        # Tool used by the responder agent
-        StructuredTool.from_function(
-            run_queries,
-            name=AnswerQuestion.__name__,  # The Tool will be named "AnswerQuestion"
-        ),
-        # Tool used by the revisor agent
-        StructuredTool.from_function(
-            run_queries,
-            name=ReviseAnswer.__name__,  # The Tool will be named "ReviseAnswer"
-        ),
-    ]
-)
+async def arun_queries(search_queries: List[str], **kwargs):
+    """
+    Async variant of run_queries used when the graph runs via ainvoke.
+    Holds one Tavily concurrency slot for the whole batch, a failed or
+    timed out batch is retried (see resilience.py).
+    """
+    if not search_queries:
+        logger.debug("arun_queries: empty request, nothing to do")
+        return []
+
+    recorder = cassette.get_cassette()
+    if recorder is not None and recorder.mode == "replay":
+        return recorder.lookup("search", "tavily", search_queries)
+
+    # The cache lookups and writes run in a worker thread, not on the loop
+    found, pending = await asyncio.to_thread(_plan, search_queries)
+    fetched: Dict[str, Any] = {}
+    if pending:
+        logger.info("arun_queries: Start %s search requests", len(pending))
+
+        async def _fetch() -> List[Any]:
+            return _raise_transient(
+                await get_search_tool().abatch([{"query": q} for q in pending.values()])
+            )
+
+        blocks = await call_with_retries(
+            "tavily", _fetch, slot=lambda: backend_slot("tavily")
+        )
+        fetched = dict(zip(pending, blocks))
+        logger.info(
+            "arun_queries: Tavily search delivers %s result blocks", len(blocks)
+        )
+    results = await asyncio.to_thread(_merge, search_queries, found, fetched)
+
+    if recorder is not None:
+        recorder.record("search", "tavily", search_queries, results)
+    return results
+
+
+# --- Result compression ---
+SEARCH_TOKEN_BUDGET = 1200  # tokens of search results handed to the revisor
+MIN_SNIPPET_TOKENS = 40  # a snippet that would be cut shorter is left out
+# BM25 parameters of the snippet ranking
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+_token_budget: Optional[int] = SEARCH_TOKEN_BUDGET
+
+
+def configure_compression(token_budget: Optional[int] = SEARCH_TOKEN_BUDGET) -> None:
+    """Set the token budget of the search results, None or 0 disables it."""
+    global _token_budget
+    _token_budget = token_budget or None
+    if _token_budget is None:
+        logger.info("Search result compression disabled")
+
+
+def _terms(text: str) -> List[str]:
+    return [t for t in re.findall(r"\w+", text.lower()) if t not in _QUERY_STOPWORDS]
+
+
+def _canonical_url(url: str) -> str:
+    """URL without scheme, "www.", fragment and trailing slash."""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().removeprefix("www.")
+    query = f"?{parts.query}" if parts.query else ""
+    return f"{host}{parts.path.rstrip('/')}{query}"
+
+
+def _unique_hits(results: List[Any]) -> List[Dict[str, Any]]:
+    """Hits of all result blocks in query order, the first one per URL."""
+    hits: Dict[str, Dict[str, Any]] = {}
+    for block in results:
+        if not isinstance(block, dict):
+            continue
+        for hit in block.get("results", []):
+            url = hit.get("url")
+            if url and hit.get("content"):
+                hits.setdefault(_canonical_url(url), hit)
+    return list(hits.values())
+
+
+def _ranking_terms(search_queries: List[str], messages: Optional[List[Any]]) -> str:
+    """Question, reflection of the latest answer and the search queries."""
+    parts = list(search_queries)
+    if messages:
+        if isinstance(messages[0].content, str):
+            parts.append(messages[0].content)
+        for call in getattr(messages[-1], "tool_calls", None) or []:
+            reflection = call["args"].get("reflection")
+            if isinstance(reflection, dict):
+                parts.append(reflection.get("missing", ""))
+    return " ".join(parts)
+
+
+def _rank(hits: List[Dict[str, Any]], query: str) -> List[Dict[str, Any]]:
+    """Sort *hits* by their BM25 score for *query*, Tavily's order on ties."""
+    docs = [_terms(f"{hit.get('title', '')} {hit['content']}") for hit in hits]
+    avg_len = sum(map(len, docs)) / len(docs) or 1.0
+    query_terms = set(_terms(query))
+    df = {t: sum(t in set(doc) for doc in docs) for t in query_terms}
+    scores = []
+    for doc in docs:
+        tf: Dict[str, int] = {}
+        for t in doc:
+            if t in query_terms:
+                tf[t] = tf.get(t, 0) + 1
+        norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * len(doc) / avg_len)
+        scores.append(
+            sum(
+                math.log(1 + (len(docs) - df[t] + 0.5) / (df[t] + 0.5))
+                * n
+                * (_BM25_K1 + 1)
+                / (n + norm)
+                for t, n in tf.items()
+            )
+        )
+    order = sorted(range(len(hits)), key=lambda i: -scores[i])
+    return [hits[i] for i in order]
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Longest word prefix of *text* within *max_tokens* (binary search)."""
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:mid])) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return " ".join(words[:low]) + " …"
+
+
+def compress_results(
+    results: List[Any],
+    search_queries: List[str],
+    messages: Optional[List[Any]] = None,
+) -> List[Any]:
+    """
+    Deduplicate, rank and trim the Tavily *results* of one tool call.
+    Returns numbered {id, url, title, content} snippets in rank order that
+    fit into the token budget, or *results* unchanged without a budget.
+    The token counts before and after are added to the execute_tools stage.
+    """
+    if not results:
+        return results
+    raw_tokens = count_tokens(json.dumps(results, ensure_ascii=False))
+    compressed = results
+    hits = _unique_hits(results)
+    if _token_budget is not None and hits:
+        compressed = []
+        used = 2  # the brackets of the list
+        for hit in _rank(hits, _ranking_terms(search_queries, messages)):
+            snippet = {
+                "id": len(compressed) + 1,
+                "url": hit["url"],
+                "title": hit.get("title", ""),
+                "content": hit["content"],
+            }
+            cost = count_tokens(json.dumps(snippet, ensure_ascii=False))
+            if used + cost > _token_budget:
+                overhead = cost - count_tokens(hit["content"])
+                room = _token_budget - used - overhead
+                if room < MIN_SNIPPET_TOKENS:
+                    continue
+                snippet["content"] = _truncate(hit["content"], room)
+                cost = count_tokens(json.dumps(snippet, ensure_ascii=False))
+            compressed.append(snippet)
+            used += cost
+    tokens = count_tokens(json.dumps(compressed, ensure_ascii=False))
+
+    entry = current_stage()
+    if entry is not None:
+        entry["result_tokens_raw"] = entry.get("result_tokens_raw", 0) + raw_tokens
+        entry["result_tokens"] = entry.get("result_tokens", 0) + tokens
+    logger.info(
+        "Search results: %s unique of %s hits, %s → %s tokens",
+        len(hits),
+        sum(len(b.get("results", [])) for b in results if isinstance(b, dict)),
+        raw_tokens,
+        tokens,
+    )
+    return compressed
+
+
+def search(search_queries: List[str], messages: Optional[List[Any]] = None):
+    """Run the queries and compress the results for the revisor."""
+    return compress_results(run_queries(search_queries), search_queries, messages)
+
+
+async def asearch(search_queries: List[str], messages: Optional[List[Any]] = None):
+    """Async variant of search()."""
+    results = await arun_queries(search_queries)
+    return compress_results(results, search_queries, messages)
+
+
+def build_tool_node():
+    """
+    Wrap the search into LangChain-compatible StructuredTools,
+    the search cache sits in front of Tavily for both of them.
+    The graph messages are injected so that the results can be ranked
+    against the question and the reflection.
+    """
+    from typing import Annotated
+
+    from langchain_core.tools import (
+        StructuredTool,  # Wraps functions to make them usable by LLMs
+    )
+    from langgraph.prebuilt import InjectedState, ToolNode
+    from pydantic import BaseModel, Field
+
+    class SearchInput(BaseModel):
+        search_queries: List[str] = Field(description="Queries sent to Tavily.")
+        messages: Annotated[Optional[List[Any]], InjectedState("messages")] = None
+
+    return ToolNode(
+        [
+            # Tool used by the responder agent
+            StructuredTool.from_function(
+                search,
+                coroutine=asearch,
+                name=AnswerQuestion.__name__,  # The Tool will be named "AnswerQuestion"
+                args_schema=SearchInput,
+            ),
+            # Tool used by the revisor agent
+            StructuredTool.from_function(
+                search,
+                coroutine=asearch,
+                name=ReviseAnswer.__name__,  # The Tool will be named "ReviseAnswer"
+                args_schema=SearchInput,
+            ),
+        ]
+    )